@@ -0,0 +1,233 @@
+"""Account deletion: a quick soft delete, then a purge in the background.
+
+Deleting a user through the ORM loaded their relationships and cascaded
+through every message, follow and fancy in the request, holding locks for
+as long as that took. Instead:
+
+1. soft_delete() just stamps `users.deleted_at`. From then on the account
+   can't log in, its profile is gone and nobody can follow it.
+2. purge() removes what the account left behind, in batches of
+   PURGE_BATCH_SIZE rows, each committed on its own: timeline entries,
+   fancies given and received, follows both ways, messages and finally
+   the user row (and cached cards of the messages). Other accounts'
+   counters are adjusted for exactly the rows each batch removed, and the
+   account's own counters count down, which is the progress status()
+   reports.
+
+purge() runs as a job (see jobs.py); `flask purge-deleted` purges any
+accounts still waiting, there and then.
+"""
+
+from collections import Counter
+from datetime import datetime
+
+from flask import current_app
+from sqlalchemy import select, tuple_
+
+from models import db, Fancy, Follows, Message, TimelineEntry, User
+import counters
+import fragments
+import jobs
+import timeline
+import usercache
+
+DEFAULT_BATCH_SIZE = 1000
+
+TIMELINE = TimelineEntry.__table__
+FANCIES = Fancy.__table__
+FOLLOWS = Follows.__table__
+MESSAGES = Message.__table__
+
+
+def batch_size():
+    return current_app.config.get('PURGE_BATCH_SIZE', DEFAULT_BATCH_SIZE)
+
+
+def soft_delete(user):
+    """Mark `user` deleted and queue their purge; commit afterwards."""
+
+    user.deleted_at = datetime.utcnow()
+    usercache.forget_user(user.id)
+    schedule_purge(user.id)
+
+
+def adjust_each(model, ids, **deltas):
+    """counters.adjust, applied to each id as often as `ids` lists it."""
+
+    by_times = {}
+
+    for id, times in Counter(ids).items():
+        by_times.setdefault(times, []).append(id)
+
+    for times, same in by_times.items():
+        counters.adjust(model, same, **{col: delta * times
+                                        for col, delta in deltas.items()})
+
+
+def delete_batch(table, criterion, returning):
+    """Delete up to a batch of `table` rows matching `criterion`.
+
+    Returns the `returning` column of the rows deleted.
+    """
+
+    key = table.primary_key.columns.values()
+    batch = select(key).where(criterion).limit(batch_size())
+
+    stmt = (table
+            .delete()
+            .where(tuple_(*key).in_(batch))
+            .returning(returning))
+
+    return [row[0] for row in db.session.execute(stmt)]
+
+
+def delete_timeline(user_id):
+    """The user's own timeline, then their messages in everyone else's."""
+
+    return (delete_batch(TIMELINE, TIMELINE.c.user_id == user_id,
+                         TIMELINE.c.message_id) or
+            delete_batch(TIMELINE, TIMELINE.c.author_id == user_id,
+                         TIMELINE.c.message_id))
+
+
+def delete_fancies_given(user_id):
+    message_ids = delete_batch(FANCIES, FANCIES.c.user_id == user_id,
+                               FANCIES.c.message_id)
+
+    if message_ids:
+        counters.adjust(Message, message_ids, fancies_count=-1)
+        counters.adjust(User, user_id, fancies_count=-len(message_ids))
+
+    return message_ids
+
+
+def delete_fancies_received(user_id):
+    own = select([MESSAGES.c.id]).where(MESSAGES.c.user_id == user_id)
+    fan_ids = delete_batch(FANCIES, FANCIES.c.message_id.in_(own),
+                           FANCIES.c.user_id)
+
+    if fan_ids:
+        adjust_each(User, fan_ids, fancies_count=-1)
+
+    return fan_ids
+
+
+def delete_follows(user_id):
+    followed_ids = delete_batch(FOLLOWS,
+                                FOLLOWS.c.user_following_id == user_id,
+                                FOLLOWS.c.user_being_followed_id)
+
+    if followed_ids:
+        counters.adjust(User, followed_ids, followers_count=-1)
+        counters.adjust(User, user_id, following_count=-len(followed_ids))
+        timeline.followers_removed(followed_ids)
+        return followed_ids
+
+    follower_ids = delete_batch(FOLLOWS,
+                                FOLLOWS.c.user_being_followed_id == user_id,
+                                FOLLOWS.c.user_following_id)
+
+    if follower_ids:
+        counters.adjust(User, follower_ids, following_count=-1)
+        counters.adjust(User, user_id, followers_count=-len(follower_ids))
+
+    return follower_ids
+
+
+def delete_messages(user_id):
+    message_ids = delete_batch(MESSAGES, MESSAGES.c.user_id == user_id,
+                               MESSAGES.c.id)
+
+    if message_ids:
+        counters.adjust(User, user_id, messages_count=-len(message_ids))
+
+        for message_id in message_ids:
+            fragments.forget_message(message_id)
+
+    return message_ids
+
+
+# in order: messages go once nothing refers to them any more
+PURGE_STEPS = [delete_timeline, delete_fancies_given, delete_fancies_received,
+               delete_follows, delete_messages]
+
+
+def purge_step(user_id):
+    """Remove one batch of what `user_id` left behind, and commit.
+
+    Returns False once there's nothing left and the user row is gone.
+    """
+
+    for step in PURGE_STEPS:
+        if step(user_id):
+            db.session.commit()
+            return True
+
+    User.query.filter_by(id=user_id).delete(synchronize_session=False)
+    db.session.commit()
+    return False
+
+
+@jobs.task('purge-account')
+def purge(user_id):
+    """Remove a soft-deleted user and everything they left behind."""
+
+    deleted_at = (db.session
+                  .query(User.deleted_at)
+                  .filter(User.id == user_id)
+                  .scalar())
+
+    if deleted_at is None:
+        return
+
+    while purge_step(user_id):
+        jobs.heartbeat()
+
+    usercache.forget_user(user_id)
+
+
+def purge_all():
+    """Purge every soft-deleted user; returns how many there were."""
+
+    user_ids = [row[0] for row in
+                db.session.query(User.id).filter(User.deleted_at.isnot(None))]
+
+    for user_id in user_ids:
+        purge(user_id)
+
+    return len(user_ids)
+
+
+def schedule_purge(user_id):
+    """Queue purging `user_id` as a job; commit afterwards."""
+
+    jobs.enqueue('purge-account', key=f"purge-account:{user_id}",
+                 user_id=user_id)
+
+
+def status(user_id):
+    """How far along deleting `user_id` is, as a dict."""
+
+    user = (db.session
+            .query(User.deleted_at, User.messages_count, User.following_count,
+                   User.followers_count, User.fancies_count)
+            .filter(User.id == user_id)
+            .first())
+
+    if user is None:
+        return {'user_id': user_id, 'status': 'deleted'}
+
+    if user.deleted_at is None:
+        return {'user_id': user_id, 'status': 'active'}
+
+    return {
+        'user_id': user_id,
+        'status': 'deleting',
+        'deleted_at': user.deleted_at.isoformat(),
+        'remaining': {
+            'messages': user.messages_count,
+            'following': user.following_count,
+            'followers': user.followers_count,
+            'fancies': user.fancies_count,
+        },
+    }
@@ -1,12 +1,33 @@
 import os
+import signal
 
-from flask import Flask, render_template, request, flash, redirect, session, g
-from flask_debugtoolbar import DebugToolbarExtension
+import click
+from flask import Flask, render_template, request, flash, redirect, session, g, url_for, jsonify, abort
 from sqlalchemy.exc import IntegrityError
 
 from forms import UserAddForm, LoginForm, MessageForm, UserEditForm
 from models import db, connect_db, User, Message, Fancy, HEADER_DEFAULT, PROFILE_DEFAULT
 from verification import verify_user
+from cache import init_cache
+from passwords import init_passwords, get_pool, PasswordQueueFull
+import accounts
+import bulkload
+import counters
+import dbpool
+import fancies
+import follows
+import feeds
+import fragments
+import httpcache
+import instrument
+import jobs
+import metrics
+import migrate
+import pagination
+import replicas
+import search
+import timeline
+import usercache
 
 CURR_USER_KEY = "curr_user"
 
@@ -21,9 +42,97 @@ app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 app.config['SQLALCHEMY_ECHO'] = False
 app.config['DEBUG_TB_INTERCEPT_REDIRECTS'] = False
 app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY', "password!")
-toolbar = DebugToolbarExtension(app)
+
+# Authors with more followers than this aren't fanned out to timelines on
+# write; their messages are merged into home feeds at read time instead.
+app.config['TIMELINE_FANOUT_LIMIT'] = int(
+    os.environ.get('TIMELINE_FANOUT_LIMIT', 10000))
+app.config['TIMELINE_BACKFILL_LIMIT'] = 100
+app.config['FEED_PAGE_SIZE'] = 20
+
+# 'simple' is an in-process LRU per worker; 'redis' is shared (needs
+# CACHE_REDIS_URL); 'null' disables caching
+app.config['CACHE_BACKEND'] = os.environ.get('CACHE_BACKEND', 'simple')
+app.config['CACHE_REDIS_URL'] = os.environ.get('CACHE_REDIS_URL')
+app.config['CACHE_DEFAULT_TTL'] = 300
+app.config['CACHE_MAX_ENTRIES'] = 10000
+# how often each worker checks for deleted accounts among cached users
+app.config['DELETED_CHECK_SECONDS'] = 1
+
+# bcrypt runs in a pool of PASSWORD_HASH_WORKERS processes per app process
+# (0 runs it inline). Only gevent workers, serving many requests each, gain
+# from a pool, so only they get one by default; see passwords.py
+app.config['BCRYPT_LOG_ROUNDS'] = int(os.environ.get('BCRYPT_LOG_ROUNDS', 12))
+app.config['PASSWORD_HASH_WORKERS'] = int(os.environ.get(
+    'PASSWORD_HASH_WORKERS',
+    2 if os.environ.get('WARBLER_WORKER') == 'gevent' else 0))
+app.config['PASSWORD_QUEUE_LIMIT'] = 16
+app.config['PASSWORD_QUEUE_TIMEOUT'] = 2
+
+# Database pool, per worker process. DB_MAX_CONNECTIONS (this app's share of
+# Postgres' max_connections) is split between the WEB_CONCURRENCY workers;
+# without it, DB_POOL_SIZE and DB_MAX_OVERFLOW are used as given.
+if os.environ.get('DB_MAX_CONNECTIONS'):
+    (app.config['SQLALCHEMY_POOL_SIZE'],
+     app.config['SQLALCHEMY_MAX_OVERFLOW']) = dbpool.size_for_workers(
+        int(os.environ['DB_MAX_CONNECTIONS']),
+        int(os.environ.get('WEB_CONCURRENCY', 1)))
+else:
+    app.config['SQLALCHEMY_POOL_SIZE'] = int(
+        os.environ.get('DB_POOL_SIZE', 5))
+    app.config['SQLALCHEMY_MAX_OVERFLOW'] = int(
+        os.environ.get('DB_MAX_OVERFLOW', 10))
+
+app.config['SQLALCHEMY_POOL_TIMEOUT'] = int(
+    os.environ.get('DB_POOL_TIMEOUT', 10))
+app.config['SQLALCHEMY_POOL_RECYCLE'] = int(
+    os.environ.get('DB_POOL_RECYCLE', 1800))
+app.config['SQLALCHEMY_POOL_PRE_PING'] = True
+
+# Read-only views (marked @replicas.read_only) use these replicas, except
+# for REPLICA_STICKY_SECONDS after a visitor writes
+app.config['SQLALCHEMY_BINDS'] = replicas.replica_binds(
+    os.environ.get('DATABASE_REPLICA_URLS'))
+app.config['DB_REPLICAS'] = list(app.config['SQLALCHEMY_BINDS'])
+app.config['REPLICA_STICKY_SECONDS'] = 10
+
+# /internal/* and /metrics are served to localhost, or to anyone sending
+# this token in an X-Internal-Token header (or as a Bearer token)
+app.config['INTERNAL_TOKEN'] = os.environ.get('INTERNAL_TOKEN')
+
+# Per-request query/template timings for a sample of requests (see
+# instrument.py); Server-Timing headers for internal requests, and
+# /internal/requests
+app.config['INSTRUMENT_SAMPLE_RATE'] = float(
+    os.environ.get('INSTRUMENT_SAMPLE_RATE', 0.05))
+app.config['SLOW_QUERY_MS'] = int(os.environ.get('SLOW_QUERY_MS', 100))
+app.config['QUERY_WARN_COUNT'] = 30
+
+# Deleted accounts are purged in the background, this many rows per
+# transaction (see accounts.py)
+app.config['PURGE_BATCH_SIZE'] = int(os.environ.get('PURGE_BATCH_SIZE', 1000))
+
+# Deferred work runs in `flask worker` processes (see jobs.py); JOBS_EAGER
+# runs it inline instead, for development without a worker
+app.config['JOBS_EAGER'] = os.environ.get('JOBS_EAGER') == '1'
+app.config['JOB_RETRY_DELAY'] = 10
+app.config['JOB_LOCK_TIMEOUT'] = int(os.environ.get('JOB_LOCK_TIMEOUT', 600))
+
+# The debug toolbar is for development only
+if app.debug:
+    from flask_debugtoolbar import DebugToolbarExtension
+    toolbar = DebugToolbarExtension(app)
 
 connect_db(app)
+init_cache(app)
+init_passwords(app)
+# is_internal_request is defined with the internal endpoints, below
+instrument.init_instrument(app, show_timing=lambda: is_internal_request())
+metrics.init_metrics(app)
+replicas.init_replicas(app)
+
+app.jinja_env.globals['message_card'] = fragments.message_card
+app.jinja_env.globals['static_url'] = httpcache.static_url
 
 
 ##############################################################################
@@ -35,7 +144,7 @@ def add_user_to_g():
     """If we're logged in, add curr user to Flask global."""
 
     if CURR_USER_KEY in session:
-        g.user = User.query.get(session[CURR_USER_KEY])
+        g.user = usercache.load_user(session[CURR_USER_KEY])
 
     else:
         g.user = None
@@ -101,6 +210,9 @@ def login():
                                  form.password.data)
 
         if user:
+            # authenticate() may have upgraded the password hash
+            db.session.commit()
+
             do_login(user)
             flash(f"Hello, {user.username}!", "success")
             return redirect("/")
@@ -122,67 +234,165 @@ def logout():
 ##############################################################################
 # General user routes:
 
+
+def wants_json():
+    """Did the client send or ask for JSON rather than HTML?"""
+
+    return (request.is_json or
+            request.accept_mimetypes.best == 'application/json')
+
+
+def requested_flag(name):
+    """Boolean `name` from a JSON body or form, or None if not given."""
+
+    data = request.get_json(silent=True) or request.form
+    value = data.get(name)
+
+    if value is None or value == '':
+        return None
+    if isinstance(value, bool):
+        return value
+
+    value = str(value).lower()
+
+    if value in ('true', '1', 'on', 'yes'):
+        return True
+    if value in ('false', '0', 'off', 'no'):
+        return False
+
+    abort(400)
+
+
+def get_user_or_404(user_id):
+    """The user with `user_id`, or a 404 if there's none (or it's deleted)."""
+
+    return User.query.filter_by(id=user_id, deleted_at=None).first_or_404()
+
+
+def following_ids_for_viewer(users):
+    """Ids among `users` that the logged-in user follows (one query)."""
+
+    if not g.user:
+        return set()
+
+    return g.user.following_among([user.id for user in users])
+
+
 @app.route('/users')
+@replicas.read_only
 def list_users():
     """Page with listing of users.
 
-    Can take a 'q' param in querystring to search by that username.
+    Can take a 'q' param in querystring to search by that username, and a
+    'page' param for later pages of results. Without 'q', lists everyone in
+    signup order, continuing after the id in an 'after' param.
     """
 
-    search = request.args.get('q')
+    term = request.args.get('q', '').strip()
 
-    if not search:
-        users = User.query.all()
+    if term:
+        page = request.args.get('page', 1, type=int)
+        results = search.search_users(term, page)
+        next_url = (results.next_page and
+                    url_for('list_users', q=term, page=results.next_page))
     else:
-        users = User.query.filter(User.username.like(f"%{search}%")).all()
+        after = request.args.get('after', type=int)
+        results = search.list_users(after)
+        next_url = (results.next_page and
+                    url_for('list_users', after=results.next_page))
 
-    return render_template('users/index.html', users=users)
+    users = results.items
+    followed_ids = following_ids_for_viewer(users)
+
+    return render_template('users/index.html', users=users,
+                           followed_ids=followed_ids, next_url=next_url)
 
 
 @app.route('/users/<int:user_id>')
+@replicas.read_only
+@httpcache.conditional(httpcache.profile_etag)
 def users_show(user_id):
-    """Show user profile."""
+    """Show user profile, one page of messages at a time.
+
+    Takes a 'before' cursor in querystring to show older messages.
+    """
+
+    user = get_user_or_404(user_id)
+
+    page = pagination.paginate(Message.query.filter(Message.user_id == user_id),
+                               Message.timestamp,
+                               Message.id,
+                               pagination.cursor_from_request())
+    page = page._replace(items=feeds.load_feed(page.items, g.user))
+
+    return render_template('users/show.html', user=user, page=page)
 
-    user = User.query.get_or_404(user_id)
 
-    # snagging messages in order from the database;
-    # user.messages won't be in order by default
-    messages = (Message
-                .query
-                .filter(Message.user_id == user_id)
-                .order_by(Message.timestamp.desc())
-                .limit(100)
-                .all())
-    return render_template('users/show.html', user=user, messages=messages)
+def follow_listing(user_id, direction):
+    """A page of `user_id`'s followers or followed users, as HTML or JSON.
+
+    Takes an 'after' user id in querystring for later pages.
+    """
+
+    user = get_user_or_404(user_id)
+    page = follows.follow_page(user_id, direction, g.user.id,
+                               request.args.get('after', type=int))
+    next_url = (page.next_cursor and
+                url_for(request.endpoint, user_id=user_id,
+                        after=page.next_cursor))
+
+    if wants_json():
+        return jsonify(users=[dict(id=entry.user.id,
+                                   username=entry.user.username,
+                                   image_url=entry.user.image_url,
+                                   bio=entry.user.bio,
+                                   viewer_follows=entry.viewer_follows)
+                              for entry in page.items],
+                       next=next_url)
+
+    return render_template(f'users/{direction}.html', user=user,
+                           entries=page.items, next_url=next_url)
 
 
 @app.route('/users/<int:user_id>/following')
+@replicas.read_only
 @verify_user
 def show_following(user_id):
     """Show list of people this user is following."""
 
-    user = User.query.get_or_404(user_id)
-    return render_template('users/following.html', user=user)
+    return follow_listing(user_id, 'following')
 
 
 @app.route('/users/<int:user_id>/followers')
+@replicas.read_only
 @verify_user
 def users_followers(user_id):
     """Show list of followers of this user."""
 
-    user = User.query.get_or_404(user_id)
-    return render_template('users/followers.html', user=user)
+    return follow_listing(user_id, 'followers')
 
 
 @app.route('/users/<int:user_id>/fancies')
+@replicas.read_only
 @verify_user
 def users_fancies(user_id):
-    """Show list of warbles fancied by user."""
+    """Show list of warbles fancied by user, one page at a time."""
 
-    user = User.query.get_or_404(user_id)
-    messages = user.fancies
+    user = get_user_or_404(user_id)
 
-    return render_template('users/show-fancies.html', user=user, messages=messages)
+    # newest fancy first, walking ix_fancies_user_timestamp
+    page = pagination.paginate((db.session
+                                .query(Message, Fancy.timestamp)
+                                .join(Fancy, Fancy.message_id == Message.id)
+                                .filter(Fancy.user_id == user_id)),
+                               Fancy.timestamp,
+                               Fancy.message_id,
+                               pagination.cursor_from_request(),
+                               key=lambda row: (row.timestamp, row.Message.id))
+    page = page._replace(items=feeds.load_feed(
+        [message for message, _ in page.items], g.user))
+
+    return render_template('users/show-fancies.html', user=user, page=page)
 
 
 @app.route('/users/follow/<int:follow_id>', methods=['POST'])
@@ -190,8 +400,11 @@ def users_fancies(user_id):
 def add_follow(follow_id):
     """Add a follow for the currently-logged-in user."""
 
-    followed_user = User.query.get_or_404(follow_id)
-    g.user.following.append(followed_user)
+    if (not follows.follow(g.user.id, [follow_id]) and
+            not db.session.query(User.query.filter_by(id=follow_id)
+                                 .exists()).scalar()):
+        abort(404)
+
     db.session.commit()
 
     return redirect(f"/users/{g.user.id}/following")
@@ -202,13 +415,63 @@ def add_follow(follow_id):
 def stop_following(follow_id):
     """Have currently-logged-in-user stop following this user."""
 
-    followed_user = User.query.get(follow_id)
-    g.user.following.remove(followed_user)
+    follows.unfollow(g.user.id, [follow_id])
     db.session.commit()
 
     return redirect(f"/users/{g.user.id}/following")
 
 
+def requested_ids():
+    """User ids to (un)follow in bulk: JSON {"ids": [...]} or form `ids`."""
+
+    data = request.get_json(silent=True)
+
+    try:
+        if data is not None:
+            ids = data.get('ids', [])
+            if not isinstance(ids, list):
+                abort(400)
+            ids = [int(user_id) for user_id in ids]
+        else:
+            ids = [int(user_id) for value in request.form.getlist('ids')
+                   for user_id in value.split(',') if user_id.strip()]
+    except (AttributeError, TypeError, ValueError):
+        abort(400)
+
+    if len(ids) > follows.MAX_BULK:
+        abort(400)
+
+    return ids
+
+
+@app.route('/users/follow', methods=['POST'])
+@verify_user
+def follow_many():
+    """Follow many users at once; answers JSON with the ids newly followed."""
+
+    followed = follows.follow(g.user.id, requested_ids())
+    db.session.commit()
+
+    if wants_json():
+        return jsonify(followed=followed)
+
+    return redirect(f"/users/{g.user.id}/following")
+
+
+@app.route('/users/stop-following', methods=['POST'])
+@verify_user
+def unfollow_many():
+    """Unfollow many users at once; answers JSON with the ids unfollowed."""
+
+    unfollowed = follows.unfollow(g.user.id, requested_ids())
+    db.session.commit()
+
+    if wants_json():
+        return jsonify(unfollowed=unfollowed)
+
+    return redirect(f"/users/{g.user.id}/following")
+
+
 @app.route('/users/profile', methods=["GET", "POST"])
 @verify_user
 def profile():
@@ -230,6 +493,7 @@ def profile():
         g.user.location = form.location.data
 
         db.session.commit()
+        usercache.forget_user(g.user.id)
 
         return redirect(f'/users/{g.user.id}')
 
@@ -239,11 +503,11 @@ def profile():
 @app.route('/users/delete', methods=["POST"])
 @verify_user
 def delete_user():
-    """Delete user."""
+    """Delete user: marked deleted now, purged in the background."""
 
     do_logout()
 
-    db.session.delete(g.user)
+    accounts.soft_delete(g.user)
     db.session.commit()
 
     return redirect("/signup")
@@ -263,8 +527,11 @@ def messages_add():
     form = MessageForm()
 
     if form.validate_on_submit():
-        msg = Message(text=form.text.data)
-        g.user.messages.append(msg)
+        msg = Message(text=form.text.data, user_id=g.user.id)
+        db.session.add(msg)
+        db.session.flush()
+        counters.message_added(msg)
+        timeline.add_message(msg)
         db.session.commit()
 
         return redirect(f"/users/{g.user.id}")
@@ -272,12 +539,41 @@ def messages_add():
     return render_template('messages/new.html', form=form)
 
 
+@app.route('/messages/search')
+@replicas.read_only
+def messages_search():
+    """Search warbles by text.
+
+    Takes a 'q' param in querystring, and a 'before' cursor for older pages
+    of results.
+    """
+
+    term = request.args.get('q', '').strip()
+
+    if not term:
+        return redirect("/")
+
+    page = search.search_messages(term, search.cursor_from_request())
+    messages = [msg for msg, score in page.items]
+    page = page._replace(items=feeds.load_feed(messages, g.user))
+
+    return render_template('messages/search.html', term=term, page=page)
+
+
 @app.route('/messages/<int:message_id>', methods=["GET"])
+@replicas.read_only
+@httpcache.conditional(httpcache.message_etag)
 def messages_show(message_id):
     """Show a message."""
 
-    msg = Message.query.get(message_id)
-    return render_template('messages/show.html', message=msg)
+    msg = (Message
+           .query
+           .join(User, User.id == Message.user_id)
+           .filter(Message.id == message_id, User.deleted_at.is_(None))
+           .first_or_404())
+    item = feeds.load_message(msg, g.user)
+
+    return render_template('messages/show.html', item=item)
 
 
 @app.route('/messages/<int:message_id>/delete', methods=["POST"])
@@ -291,8 +587,10 @@ def messages_destroy(message_id):
         flash("Access unauthorized.", "danger")
         return redirect("/")
 
+    counters.message_removed(msg)
     db.session.delete(msg)
     db.session.commit()
+    fragments.forget_message(message_id)
 
     return redirect(f"/users/{g.user.id}")
 
@@ -300,64 +598,238 @@ def messages_destroy(message_id):
 @app.route('/messages/<int:message_id>/fancy', methods=["POST"])
 @verify_user
 def messages_fancy(message_id):
-    """Fancy or unfancy a message"""
+    """Fancy or unfancy a message.
 
-    message = Message.query.get_or_404(message_id)
+    Toggles, unless a `fancied` of true/false (form or JSON) says which
+    state is wanted. Answers JSON (the new state and count) to clients
+    that ask for it; otherwise redirects back.
+    """
 
-    if message.is_fancied_by(g.user):
-        Fancy.query.filter_by(
-            user_id=g.user.id, message_id=message_id).delete()
-    else:
-        new_fancy = Fancy(user_id=g.user.id, message_id=message_id)
-        db.session.add(new_fancy)
+    state = fancies.set_fancied(g.user.id, message_id,
+                                requested_flag('fancied'))
+
+    if state is None:
+        abort(404)
 
     db.session.commit()
 
-    return redirect(request.referrer)
+    if wants_json():
+        return jsonify(fancied=state.fancied, count=state.count)
+
+    return redirect(request.referrer or
+                    url_for('messages_show', message_id=message_id))
 
 
 ##############################################################################
 # Homepage and error pages
 
 
+@app.errorhandler(PasswordQueueFull)
+def password_queue_full(error):
+    """Too many logins/signups at once: ask the client to retry shortly."""
+
+    return ("We're very busy right now. Please try again in a moment.",
+            503, {'Retry-After': '1'})
+
+
 @app.route('/')
+@replicas.read_only
 def homepage():
     """Show homepage:
 
     - anon users: no messages
-    - logged in: 100 most recent messages of followed_users
+    - logged in: most recent messages of followed_users, one page at a
+      time (older pages via a 'before' cursor in querystring)
     """
 
     if g.user:
-        following_users_ids = [
-            user.id for user in g.user.following] + [g.user.id]
-
-        messages = (Message
-                    .query
-                    .filter(Message.user_id.in_(following_users_ids))
-                    .order_by(Message.timestamp.desc())
-                    .limit(100)
-                    .all())
+        page = timeline.home_timeline(g.user.id,
+                                      pagination.cursor_from_request())
+        page = page._replace(items=feeds.load_feed(page.items, g.user))
 
-        return render_template('home.html', messages=messages)
+        return render_template('home.html', page=page)
 
     else:
         return render_template('home-anon.html')
 
 
 ##############################################################################
-# Turn off all caching in Flask
-#   (useful for dev; in production, this kind of stuff is typically
-#   handled elsewhere)
-#
-# https://stackoverflow.com/questions/34066804/disabling-caching-in-flask
+# Internal endpoints (for operators, not users)
+
+
+def is_internal_request():
+    """Is this request from localhost or carrying the internal token?"""
+
+    token = app.config['INTERNAL_TOKEN']
+
+    if token:
+        bearer = request.headers.get('Authorization', '')
+        return token in (request.headers.get('X-Internal-Token'),
+                         bearer.split(' ', 1)[-1]
+                         if bearer.startswith('Bearer ') else None)
+
+    return request.remote_addr in ('127.0.0.1', '::1')
+
+
+@app.route('/internal/stats')
+def internal_stats():
+    """Connection and password pool numbers for the worker answering."""
+
+    if not is_internal_request():
+        abort(404)
+
+    return jsonify(pid=os.getpid(),
+                   db=dbpool.pool_stats(db.engine),
+                   passwords=get_pool().stats())
+
+
+@app.route('/internal/requests')
+def internal_requests():
+    """Per-endpoint request, query and template timings for this worker."""
+
+    if not is_internal_request():
+        abort(404)
+
+    return jsonify(pid=os.getpid(), endpoints=instrument.report())
+
+
+@app.route('/internal/deletions/<int:user_id>')
+def internal_deletion(user_id):
+    """How far along purging a deleted account is."""
+
+    if not is_internal_request():
+        abort(404)
+
+    return jsonify(accounts.status(user_id))
+
+
+@app.route('/internal/jobs')
+def internal_jobs():
+    """Jobs in the queue, by task and status."""
+
+    if not is_internal_request():
+        abort(404)
+
+    return jsonify(jobs.stats())
+
+
+@app.route('/metrics')
+def metrics_view():
+    """Prometheus metrics, added up over all worker processes."""
+
+    if not is_internal_request():
+        abort(404)
+
+    body, content_type = metrics.exposition()
+    return body, 200, {'Content-Type': content_type}
+
+
+##############################################################################
+# Maintenance commands
+
+
+@app.cli.command('migrate')
+def migrate_db():
+    """Apply pending schema migrations (see migrate.py)."""
+
+    for name in migrate.upgrade(db.engine):
+        print(f"Applied {name}")
+
+
+@app.cli.command('bulk-import')
+@click.argument('directory', default='generator')
+@click.option('--chunk-rows', default=bulkload.CHUNK_ROWS,
+              help="Rows loaded and committed at a time.")
+def bulk_import(directory, chunk_rows):
+    """Load users/messages/follows/fancies CSVs into empty tables."""
+
+    bulkload.import_dir(directory, chunk_rows=chunk_rows)
+
+
+@app.cli.command('rebuild-timelines')
+def rebuild_timelines():
+    """Rebuild every user's home timeline from follows and messages."""
+
+    timeline.rebuild()
+    db.session.commit()
+
+
+@app.cli.command('init-search')
+def init_search():
+    """Create the indexes used by search."""
+
+    search.install()
+    db.session.commit()
+
+
+@app.cli.command('rebuild-search-index')
+def rebuild_search_index():
+    """Rebuild search indexes over all existing users and messages."""
+
+    search.rebuild()
+    db.session.commit()
+
+
+@app.cli.command('purge-deleted')
+def purge_deleted():
+    """Finish purging accounts deleted but not yet purged."""
+
+    print(f"Purged {accounts.purge_all()} deleted accounts.")
+
+
+@app.cli.command('reconcile-counters')
+@click.option('--background', is_flag=True,
+              help="Queue it for a worker instead of running it here.")
+def reconcile_counters(background):
+    """Recompute message/follow/fancy counters wherever they've drifted."""
+
+    if background:
+        jobs.enqueue('reconcile-counters')
+        db.session.commit()
+        return
+
+    fixed = counters.reconcile()
+    db.session.commit()
+
+    print(f"Repaired {fixed} counters.")
+
+
+@app.cli.command('worker')
+@click.option('--burst', is_flag=True,
+              help="Exit once no jobs are due, instead of waiting for more.")
+@click.option('--poll', default=jobs.DEFAULT_POLL_SECONDS,
+              help="Seconds to wait between checks when idle.")
+def worker(burst, poll):
+    """Run queued jobs (see jobs.py) until stopped."""
+
+    stopping = []
+    signal.signal(signal.SIGTERM, lambda *args: stopping.append(True))
+
+    try:
+        ran = jobs.work(burst, poll, should_stop=lambda: stopping)
+    except KeyboardInterrupt:
+        return
+
+    print(f"Ran {ran} jobs.")
+
+
+@app.cli.command('prune-jobs')
+@click.option('--days', default=7, help="Keep jobs finished since then.")
+def prune_jobs(days):
+    """Delete old finished jobs."""
+
+    pruned = jobs.prune(days)
+    db.session.commit()
+
+    print(f"Deleted {pruned} jobs.")
+
+
+##############################################################################
+# HTTP caching: long-lived fingerprinted static files, ETags on public pages,
+# private/no-cache for anything personal (see httpcache.py)
 
 @app.after_request
-def add_header(req):
-    """Add non-caching headers on every request."""
-
-    req.headers["Cache-Control"] = "no-cache, no-store, must-revalidate"
-    req.headers["Pragma"] = "no-cache"
-    req.headers["Expires"] = "0"
-    req.headers['Cache-Control'] = 'public, max-age=0'
-    return req
+def add_header(response):
+    """Add caching headers on every request."""
+
+    return httpcache.set_cache_headers(response)
@@ -0,0 +1,177 @@
+"""Query plans and latency of the hot queries, without and with the
+indexes from migrations/0001_hot_query_indexes.sql.
+
+Run from the top of the project, against a scratch PostgreSQL database
+(the indexes are dropped and recreated):
+
+    python -m bench.indexes --database postgresql:///warbler-bench \\
+        --users 200000
+
+--users fills the database with generated rows first (about 20 messages,
+50 follows and 20 fancies per user, skewed so a few users are very
+popular); leave it out to use the data already there.
+"""
+
+import argparse
+import os
+import random
+import time
+
+from sqlalchemy import create_engine, text
+
+import migrate
+
+MIGRATION = os.path.join(migrate.MIGRATIONS_DIR, "0001_hot_query_indexes.sql")
+INDEXES = ("ix_messages_user_timestamp", "ix_follows_following",
+           "ix_fancies_user")
+
+# the SQL behind users_show, following_ids / is_following, and
+# users_fancies
+QUERIES = {
+    'user messages': """
+        SELECT id, text, timestamp, user_id FROM messages
+        WHERE user_id = :user_id
+        ORDER BY timestamp DESC, id DESC LIMIT 21""",
+    'following': """
+        SELECT user_being_followed_id FROM follows
+        WHERE user_following_id = :user_id""",
+    'user fancies': """
+        SELECT messages.id, messages.timestamp FROM messages
+        JOIN fancies ON fancies.message_id = messages.id
+        WHERE fancies.user_id = :user_id
+        ORDER BY messages.timestamp DESC, messages.id DESC LIMIT 21""",
+}
+
+# random()^3 piles rows onto low user ids: a rough power law
+GENERATE = [
+    "TRUNCATE users, messages, follows, fancies, timeline_entries "
+    "RESTART IDENTITY CASCADE",
+    """INSERT INTO users (email, username, password, image_url,
+                          header_image_url)
+       SELECT 'user' || i || '@example.com', 'user' || i, 'x',
+              '/static/images/default-pic.png',
+              '/static/images/warbler-hero.jpg'
+       FROM generate_series(1, :users) AS i""",
+    """INSERT INTO messages (text, timestamp, user_id)
+       SELECT 'warble ' || i,
+              now() - random() * interval '730 days',
+              1 + floor(random() ^ 3 * :users)::int
+       FROM generate_series(1, :users * 20) AS i""",
+    """INSERT INTO follows (user_being_followed_id, user_following_id)
+       SELECT followed, follower FROM (
+           SELECT 1 + floor(random() ^ 3 * :users)::int AS followed,
+                  1 + floor(random() * :users)::int AS follower
+           FROM generate_series(1, :users * 50)) AS pairs
+       WHERE followed <> follower
+       ON CONFLICT DO NOTHING""",
+    """INSERT INTO fancies (message_id, user_id)
+       SELECT 1 + floor(random() ^ 3 * :users * 20)::int,
+              1 + floor(random() * :users)::int
+       FROM generate_series(1, :users * 20)
+       ON CONFLICT DO NOTHING""",
+]
+
+
+def generate(engine, users):
+    print(f"Generating data for {users} users...")
+
+    with engine.begin() as conn:
+        for stmt in GENERATE:
+            conn.execute(text(stmt), users=users)
+
+
+def sample_user_ids(conn, count, seed):
+    """Users to run the queries for: half at random, half the busiest."""
+
+    max_id = conn.execute(text("SELECT max(id) FROM users")).scalar()
+    rand = random.Random(seed)
+
+    busiest = [row[0] for row in conn.execute(text(
+        "SELECT user_id FROM messages GROUP BY user_id "
+        "ORDER BY count(*) DESC LIMIT :n"), n=count // 2)]
+
+    return busiest + [rand.randint(1, max_id)
+                      for _ in range(count - len(busiest))]
+
+
+def measure(conn, user_ids):
+    """{query name: (plan, [milliseconds per run])}"""
+
+    results = {}
+
+    for name, sql in QUERIES.items():
+        plan = "\n".join(row[0] for row in conn.execute(
+            text("EXPLAIN (ANALYZE, BUFFERS) " + sql), user_id=user_ids[0]))
+
+        times = []
+        for user_id in user_ids:
+            start = time.perf_counter()
+            conn.execute(text(sql), user_id=user_id).fetchall()
+            times.append((time.perf_counter() - start) * 1000)
+
+        results[name] = (plan, times)
+
+    return results
+
+
+def report(label, results):
+    print(f"\n=== {label} ===")
+
+    for name, (plan, times) in results.items():
+        print(f"\n--- {name} ---\n{plan}")
+
+
+def summary(before, after):
+    print("\n=== latency (ms) ===")
+    print(f"{'query':<16}{'p50 before':>12}{'p50 after':>12}"
+          f"{'p95 before':>12}{'p95 after':>12}")
+
+    for name in QUERIES:
+        b, a = before[name][1], after[name][1]
+        print(f"{name:<16}{percentile(b, 50):>12.3f}{percentile(a, 50):>12.3f}"
+              f"{percentile(b, 95):>12.3f}{percentile(a, 95):>12.3f}")
+
+
+def percentile(values, pct):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * pct / 100))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--database", default=os.environ.get(
+        'DATABASE_URL', "postgresql:///warbler-bench"))
+    parser.add_argument("--users", type=int, default=0,
+                        help="generate this many users first")
+    parser.add_argument("--runs", type=int, default=50,
+                        help="users to time each query for")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    engine = create_engine(args.database)
+
+    if args.users:
+        generate(engine, args.users)
+
+    with engine.connect() as conn:
+        user_ids = sample_user_ids(conn, args.runs, args.seed)
+
+        for index in INDEXES:
+            conn.execute(text(f"DROP INDEX IF EXISTS {index}"))
+        conn.execute(text("ANALYZE"))
+
+        before = measure(conn, user_ids)
+
+        for stmt in migrate.statements(MIGRATION):
+            conn.execute(text(stmt))
+        conn.execute(text("ANALYZE"))
+
+        after = measure(conn, user_ids)
+
+    report("without indexes", before)
+    report("with indexes", after)
+    summary(before, after)
+
+
+if __name__ == "__main__":
+    main()
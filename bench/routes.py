@@ -0,0 +1,269 @@
+"""Benchmark Warbler's main routes through the real Flask app.
+
+Each scenario is requested --requests times, from --concurrency threads,
+each its own logged-in visitor. Reports p50/p95/p99 latency, throughput
+and database queries per request, and saves the results as JSON under
+bench/results/ (named by time and git commit) so runs can be compared.
+
+Run from the top of the project, against a scratch PostgreSQL database:
+
+    python -m bench.routes --database postgresql:///warbler-bench \\
+        --seed-users 20000
+
+--seed-users (re)builds the database first, with generator/generate.py
+and the bulk loader; leave it out to reuse the data already there.
+Compare with an earlier run:
+
+    python -m bench.routes --compare bench/results/<earlier>.json
+"""
+
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS_DIR = os.path.join(PROJECT_DIR, 'bench', 'results')
+
+SEARCH_TERMS = ["a", "jo", "mar", "smith", "ann"]
+
+# shape of a seeded dataset; home timelines hold roughly
+# users * FOLLOWS_PER_USER * MESSAGES_PER_USER entries (more, with the skew)
+MESSAGES_PER_USER = 10
+FOLLOWS_PER_USER = 20
+FANCIES_PER_USER = 10
+
+SCENARIOS = ['home', 'profile', 'user search', 'new message', 'fancy toggle']
+
+
+def seed(users, seed):
+    """Generate and load a dataset with `users` users."""
+
+    from app import app, db
+    import bulkload
+
+    with tempfile.TemporaryDirectory() as out:
+        subprocess.run(
+            [sys.executable, os.path.join(PROJECT_DIR, 'generator',
+                                          'generate.py'),
+             '--out', out, '--users', str(users),
+             '--messages', str(users * MESSAGES_PER_USER),
+             '--follows', str(users * FOLLOWS_PER_USER),
+             '--fancies', str(users * FANCIES_PER_USER),
+             '--seed', str(seed)],
+            check=True)
+
+        with app.app_context():
+            db.drop_all()
+            db.create_all()
+            bulkload.import_dir(out)
+
+
+class QueryCounter:
+    """Counts statements run by each thread."""
+
+    def __init__(self, engine):
+        from sqlalchemy import event
+
+        self.local = threading.local()
+        event.listen(engine, 'before_cursor_execute', self.count)
+
+    def count(self, *args):
+        self.local.count = getattr(self.local, 'count', 0) + 1
+
+    def take(self):
+        count = getattr(self.local, 'count', 0)
+        self.local.count = 0
+        return count
+
+
+def request_for(scenario, rand, user_id, user_ids, message_ids):
+    """(method, url, data) of one request in `scenario`."""
+
+    if scenario == 'home':
+        return 'GET', "/", None
+    if scenario == 'profile':
+        return 'GET', f"/users/{rand.choice(user_ids)}", None
+    if scenario == 'user search':
+        return 'GET', f"/users?q={rand.choice(SEARCH_TERMS)}", None
+    if scenario == 'new message':
+        return 'POST', "/messages/new", {'text': f"Benchmark {rand.random()}"}
+    if scenario == 'fancy toggle':
+        return 'POST', f"/messages/{rand.choice(message_ids)}/fancy", None
+
+    raise ValueError(f"Unknown scenario: {scenario}")
+
+
+def run_scenario(app, counter, scenario, args, user_ids, message_ids):
+    """Latencies (ms) and query counts of every request, and wall time."""
+
+    from app import CURR_USER_KEY
+
+    latencies = []
+    queries = []
+    errors = []
+    per_thread = args.requests // args.concurrency
+    lock = threading.Lock()
+
+    def visitor(number):
+        rand = random.Random(f"{args.seed}:{scenario}:{number}")
+        user_id = rand.choice(user_ids)
+        client = app.test_client()
+
+        with client.session_transaction() as sess:
+            sess[CURR_USER_KEY] = user_id
+
+        for _ in range(per_thread):
+            method, url, data = request_for(scenario, rand, user_id,
+                                            user_ids, message_ids)
+            counter.take()
+            start = time.perf_counter()
+            resp = client.open(url, method=method, data=data,
+                               headers={'Referer': "/"})
+            elapsed = (time.perf_counter() - start) * 1000
+
+            with lock:
+                latencies.append(elapsed)
+                queries.append(counter.take())
+                if resp.status_code >= 400:
+                    errors.append(resp.status_code)
+
+    threads = [threading.Thread(target=visitor, args=(number,))
+               for number in range(args.concurrency)]
+
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    return latencies, queries, errors, time.perf_counter() - start
+
+
+def percentile(values, pct):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * pct / 100))]
+
+
+def summarize(latencies, queries, errors, seconds):
+    return {
+        'requests': len(latencies),
+        'errors': len(errors),
+        'p50_ms': percentile(latencies, 50),
+        'p95_ms': percentile(latencies, 95),
+        'p99_ms': percentile(latencies, 99),
+        'throughput_rps': len(latencies) / seconds,
+        'queries_per_request': sum(queries) / len(queries),
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=PROJECT_DIR,
+            capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def print_results(results, baseline=None):
+    print(f"\n{'scenario':<14}{'p50':>9}{'p95':>9}{'p99':>9}"
+          f"{'req/s':>9}{'queries':>9}{'errors':>8}")
+
+    for scenario, stats in results['scenarios'].items():
+        print(f"{scenario:<14}{stats['p50_ms']:>9.2f}{stats['p95_ms']:>9.2f}"
+              f"{stats['p99_ms']:>9.2f}{stats['throughput_rps']:>9.1f}"
+              f"{stats['queries_per_request']:>9.1f}{stats['errors']:>8}")
+
+        before = baseline and baseline['scenarios'].get(scenario)
+        if before:
+            changes = [change(before[key], stats[key]) for key in
+                       ('p50_ms', 'p95_ms', 'p99_ms', 'throughput_rps',
+                        'queries_per_request')]
+            print(f"{'  vs ' + baseline['commit']:<14}" +
+                  "".join(f"{c:>9}" for c in changes))
+
+
+def change(before, after):
+    if not before:
+        return "-"
+    return f"{(after - before) / before:+.0%}"
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Benchmark Warbler's routes.")
+    parser.add_argument("--database", default=os.environ.get(
+        'DATABASE_URL', "postgresql:///warbler-bench"))
+    parser.add_argument("--seed-users", type=int, default=0,
+                        help="rebuild the database with this many users")
+    parser.add_argument("--requests", type=int, default=500,
+                        help="requests per scenario")
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--scenario", action='append', choices=SCENARIOS,
+                        help="run only these (repeatable)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--compare", help="earlier results JSON to compare")
+    parser.add_argument("--no-save", action='store_true')
+    args = parser.parse_args()
+
+    # app.py reads its configuration at import
+    os.environ['DATABASE_URL'] = args.database
+    from app import app, db
+    from models import User, Message
+
+    app.config['WTF_CSRF_ENABLED'] = False
+
+    if args.seed_users:
+        seed(args.seed_users, args.seed)
+
+    counter = QueryCounter(db.engine)
+
+    with app.app_context():
+        user_ids = [row[0] for row in
+                    db.session.query(User.id).order_by(User.id).limit(10000)]
+        message_ids = [row[0] for row in
+                       db.session.query(Message.id)
+                       .order_by(Message.id).limit(10000)]
+
+    results = {
+        'commit': git_commit(),
+        'time': datetime.now().isoformat(timespec='seconds'),
+        'database': args.database.rsplit('@', 1)[-1],
+        'users': len(user_ids),
+        'requests': args.requests,
+        'concurrency': args.concurrency,
+        'scenarios': {},
+    }
+
+    for scenario in args.scenario or SCENARIOS:
+        results['scenarios'][scenario] = summarize(*run_scenario(
+            app, counter, scenario, args, user_ids, message_ids))
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as file:
+            baseline = json.load(file)
+
+    print_results(results, baseline)
+
+    if not args.no_save:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        path = os.path.join(
+            RESULTS_DIR,
+            f"{datetime.now():%Y%m%d-%H%M%S}-{results['commit']}.json")
+
+        with open(path, 'w') as file:
+            json.dump(results, file, indent=2)
+
+        print(f"\nSaved {path}")
+
+
+if __name__ == "__main__":
+    main()
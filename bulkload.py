@@ -0,0 +1,215 @@
+"""Fast bulk import of Warbler CSVs (as written by generator/).
+
+Meant for filling empty tables with millions of rows:
+
+- Files are streamed in chunks of CHUNK_ROWS rows, each loaded and
+  committed on its own, so memory stays flat and no transaction grows huge.
+- On PostgreSQL each chunk goes in with `COPY ... FROM STDIN`; elsewhere
+  (SQLite) with a plain executemany.
+- Secondary indexes and foreign keys are dropped before loading and
+  recreated afterwards: one sorted build is much cheaper than updating
+  them row by row. Primary keys and unique constraints stay, so bad data
+  is still rejected.
+  If loading fails they are put back all the same.
+- Id sequences are moved past the loaded ids, so new rows don't collide.
+
+import_dir() also brings what's derived from those tables up to date:
+counters, home timelines and search indexes.
+
+Rows must reference users/messages by their position in users.csv and
+messages.csv (1, 2, ...), so load into empty tables.
+"""
+
+import csv
+import io
+import os
+import time
+from collections import namedtuple
+
+from sqlalchemy import inspect, text
+from sqlalchemy.schema import AddConstraint
+
+from models import db, User, Message, Follows, Fancy
+import counters
+import search
+import timeline
+
+CHUNK_ROWS = 50000
+
+# in dependency order
+TABLES = [
+    ('users.csv', User.__table__),
+    ('messages.csv', Message.__table__),
+    ('follows.csv', Follows.__table__),
+    ('fancies.csv', Fancy.__table__),
+]
+
+Loaded = namedtuple('Loaded', ['table', 'rows', 'seconds'])
+
+
+def chunks(reader, size):
+    """Lists of up to `size` rows from a csv reader."""
+
+    chunk = []
+
+    for row in reader:
+        chunk.append(row)
+
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+
+    if chunk:
+        yield chunk
+
+
+def copy_chunk(cursor, table, columns, rows):
+    """Load rows with PostgreSQL's COPY."""
+
+    buffer = io.StringIO()
+    csv.writer(buffer).writerows(rows)
+    buffer.seek(0)
+
+    cursor.copy_expert(f"COPY {table.name} ({', '.join(columns)}) "
+                       f"FROM STDIN WITH (FORMAT csv)", buffer)
+
+
+def insert_chunk(cursor, table, columns, rows):
+    """Load rows with executemany (databases without COPY)."""
+
+    placeholders = ", ".join("?" for _ in columns)
+
+    # as COPY does, read empty fields as NULL
+    cursor.executemany(
+        f"INSERT INTO {table.name} ({', '.join(columns)}) "
+        f"VALUES ({placeholders})",
+        ([value or None for value in row] for row in rows))
+
+
+def load_file(engine, table, path, chunk_rows=CHUNK_ROWS):
+    """Stream one CSV into `table`; returns the number of rows."""
+
+    load_chunk = (copy_chunk if engine.dialect.name == 'postgresql'
+                  else insert_chunk)
+    total = 0
+
+    with open(path, newline='') as file:
+        reader = csv.reader(file)
+        columns = next(reader)
+
+        conn = engine.raw_connection()
+        try:
+            for rows in chunks(reader, chunk_rows):
+                cursor = conn.cursor()
+                load_chunk(cursor, table, columns, rows)
+                cursor.close()
+                conn.commit()
+                total += len(rows)
+        finally:
+            conn.close()
+
+    return total
+
+
+def deferrable(tables):
+    """Secondary indexes and foreign keys of `tables`, to drop and recreate.
+
+    Unique indexes stay put: they check the data as it loads.
+    """
+
+    indexes = [index for table in tables for index in table.indexes
+               if not index.unique]
+    foreign_keys = [fk for table in tables
+                    for fk in table.foreign_key_constraints]
+
+    return indexes, foreign_keys
+
+
+def drop_foreign_keys(conn, tables):
+    """Drop the foreign keys of `tables` (named by the database)."""
+
+    inspector = inspect(conn)
+
+    for table in tables:
+        for fk in inspector.get_foreign_keys(table.name):
+            conn.execute(text(
+                f"ALTER TABLE {table.name} DROP CONSTRAINT {fk['name']}"))
+
+
+def reset_sequences(conn, tables):
+    """Move id sequences past the highest loaded id (PostgreSQL)."""
+
+    for table in tables:
+        if 'id' not in table.c or not table.c.id.autoincrement:
+            continue
+
+        conn.execute(text(
+            f"SELECT setval(pg_get_serial_sequence('{table.name}', 'id'), "
+            f"COALESCE(max(id), 1), max(id) IS NOT NULL) FROM {table.name}"))
+
+
+def load_dir(directory, engine=None, chunk_rows=CHUNK_ROWS, report=print):
+    """Bulk-load every known CSV in `directory`; returns [Loaded]."""
+
+    engine = engine or db.engine
+    files = [(os.path.join(directory, filename), table)
+             for filename, table in TABLES
+             if os.path.exists(os.path.join(directory, filename))]
+    tables = [table for _, table in files]
+
+    # SQLite can't drop constraints (and doesn't enforce FKs by default)
+    postgres = engine.dialect.name == 'postgresql'
+    indexes, foreign_keys = deferrable(tables)
+
+    with engine.begin() as conn:
+        if postgres:
+            drop_foreign_keys(conn, tables)
+        for index in indexes:
+            conn.execute(text(f"DROP INDEX IF EXISTS {index.name}"))
+
+    loaded = []
+
+    try:
+        for path, table in files:
+            start = time.monotonic()
+            rows = load_file(engine, table, path, chunk_rows)
+            result = Loaded(table.name, rows, time.monotonic() - start)
+
+            report(f"{result.table}: {result.rows} rows in "
+                   f"{result.seconds:.1f}s "
+                   f"({result.rows / max(result.seconds, 1e-9):,.0f} rows/s)")
+            loaded.append(result)
+
+    finally:
+        start = time.monotonic()
+
+        with engine.begin() as conn:
+            for index in indexes:
+                index.create(conn)
+            if postgres:
+                for fk in foreign_keys:
+                    conn.execute(AddConstraint(fk))
+                reset_sequences(conn, tables)
+
+        report(f"Indexes and constraints: {time.monotonic() - start:.1f}s")
+
+    return loaded
+
+
+def import_dir(directory, chunk_rows=CHUNK_ROWS, report=print):
+    """load_dir() into the app's database, then recompute counters, rebuild
+    timelines and install search indexes; returns [Loaded]."""
+
+    loaded = load_dir(directory, chunk_rows=chunk_rows, report=report)
+
+    start = time.monotonic()
+
+    counters.reconcile()
+    timeline.rebuild()
+    search.install()
+    db.session.commit()
+
+    report(f"Counters, timelines and search: "
+           f"{time.monotonic() - start:.1f}s")
+
+    return loaded
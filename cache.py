@@ -0,0 +1,149 @@
+"""Small key/value cache used for hot rows and rendered fragments.
+
+Pick a backend with the CACHE_BACKEND config:
+
+- 'simple' (default): an in-process LRU dict with per-entry TTLs. Each
+  gunicorn worker has its own copy.
+- 'redis': shared between workers and hosts; needs the `redis` package and
+  CACHE_REDIS_URL.
+- 'null': caches nothing (handy for debugging).
+
+Values must be picklable for the redis backend.
+"""
+
+import pickle
+import threading
+import time
+from collections import OrderedDict
+
+from flask import current_app
+
+DEFAULT_TTL = 300
+DEFAULT_MAX_ENTRIES = 10000
+
+
+class NullCache:
+    """A cache that never remembers anything."""
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        self.misses += 1
+        return None
+
+    def set(self, key, value, ttl=None):
+        pass
+
+    def delete(self, key):
+        pass
+
+    def clear(self):
+        pass
+
+
+class LRUCache(NullCache):
+    """In-process cache evicting least-recently-used entries past
+    `max_entries`, and entries older than their TTL."""
+
+    def __init__(self, max_entries=DEFAULT_MAX_ENTRIES, ttl=DEFAULT_TTL):
+        super().__init__()
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key, value, ttl=None):
+        expires = time.monotonic() + (ttl or self.ttl)
+
+        with self._lock:
+            self._entries[key] = (expires, value)
+            self._entries.move_to_end(key)
+
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class RedisCache(NullCache):
+    """Cache shared between processes through redis."""
+
+    def __init__(self, url, ttl=DEFAULT_TTL, prefix="warbler:"):
+        import redis
+
+        super().__init__()
+        self.client = redis.Redis.from_url(url)
+        self.ttl = ttl
+        self.prefix = prefix
+
+    def get(self, key):
+        value = self.client.get(self.prefix + key)
+
+        if value is None:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        return pickle.loads(value)
+
+    def set(self, key, value, ttl=None):
+        self.client.set(self.prefix + key, pickle.dumps(value),
+                        ex=ttl or self.ttl)
+
+    def delete(self, key):
+        self.client.delete(self.prefix + key)
+
+    def clear(self):
+        for key in self.client.scan_iter(self.prefix + "*"):
+            self.client.delete(key)
+
+
+def init_cache(app):
+    """Create the cache configured for `app`."""
+
+    backend = app.config.get('CACHE_BACKEND', 'simple')
+    ttl = app.config.get('CACHE_DEFAULT_TTL', DEFAULT_TTL)
+
+    if backend == 'redis':
+        cache = RedisCache(app.config['CACHE_REDIS_URL'], ttl=ttl)
+    elif backend == 'simple':
+        cache = LRUCache(
+            app.config.get('CACHE_MAX_ENTRIES', DEFAULT_MAX_ENTRIES), ttl=ttl)
+    elif backend == 'null':
+        cache = NullCache()
+    else:
+        raise ValueError(f"Unknown CACHE_BACKEND: {backend}")
+
+    app.extensions['warbler_cache'] = cache
+    return cache
+
+
+def get_cache():
+    """The cache for the current app."""
+
+    return current_app.extensions['warbler_cache']
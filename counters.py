@@ -0,0 +1,110 @@
+"""Denormalized counters on users and messages.
+
+Pages show how many messages, followers, followed users and fancies an
+account has, and how many fancies a message has. Rather than loading whole
+relationship collections to count them, the counts live in columns that
+are bumped in the same transaction as the change they count.
+
+Every helper here issues `col = col + n` in SQL, so concurrent requests
+can't lose each other's updates. If the counts ever drift (bulk imports,
+manual SQL), `reconcile()` recomputes them in bulk.
+"""
+
+from sqlalchemy import func, select
+
+from models import Fancy, Follows, Message, User
+import jobs
+
+
+def adjust(model, ids, **deltas):
+    """Add each of `deltas` to the matching counter column on `ids` rows.
+
+    `ids` may be a single id, a list of ids, or a SELECT of ids.
+    """
+
+    if isinstance(ids, int):
+        criterion = model.id == ids
+    else:
+        criterion = model.id.in_(ids)
+
+    values = {getattr(model, col): getattr(model, col) + delta
+              for col, delta in deltas.items()}
+
+    (model
+     .query
+     .filter(criterion)
+     .update(values, synchronize_session=False))
+
+
+def message_added(message):
+    """Count a new message for its author."""
+
+    adjust(User, message.user_id, messages_count=1)
+
+
+def message_removed(message):
+    """Uncount a message about to be deleted.
+
+    Call before the delete, while its fancies still exist.
+    """
+
+    adjust(User, message.user_id, messages_count=-1)
+
+    fanciers = select([Fancy.user_id]).where(Fancy.message_id == message.id)
+    adjust(User, fanciers, fancies_count=-1)
+
+
+def follows_added(follower_id, followed_ids):
+    """Count new follows of `followed_ids` by `follower_id`."""
+
+    adjust(User, follower_id, following_count=len(followed_ids))
+    adjust(User, followed_ids, followers_count=1)
+
+
+def follows_removed(follower_id, followed_ids):
+    """Uncount removed follows of `followed_ids` by `follower_id`."""
+
+    adjust(User, follower_id, following_count=-len(followed_ids))
+    adjust(User, followed_ids, followers_count=-1)
+
+
+def _count(key, outer_id):
+    """Correlated `SELECT count(*) FROM <key's table> WHERE key = outer_id`."""
+
+    return (select([func.count()])
+            .select_from(key.table)
+            .where(key == outer_id)
+            .as_scalar())
+
+
+@jobs.task('reconcile-counters', max_attempts=1)
+def reconcile():
+    """Recompute every counter from the underlying tables.
+
+    Only rows whose stored count is wrong get written. Returns the number of
+    counter values repaired.
+    """
+
+    user_counts = {
+        'messages_count': _count(Message.user_id, User.id),
+        'following_count': _count(Follows.user_following_id, User.id),
+        'followers_count': _count(Follows.user_being_followed_id, User.id),
+        'fancies_count': _count(Fancy.user_id, User.id),
+    }
+
+    fixed = 0
+
+    for col, actual in user_counts.items():
+        fixed += (User
+                  .query
+                  .filter(getattr(User, col) != actual)
+                  .update({col: actual}, synchronize_session=False))
+        jobs.heartbeat()
+
+    actual = _count(Fancy.message_id, Message.id)
+    fixed += (Message
+              .query
+              .filter(Message.fancies_count != actual)
+              .update({'fancies_count': actual}, synchronize_session=False))
+
+    return fixed
@@ -0,0 +1,95 @@
+"""Database connection pool sizing and instrumentation.
+
+Each worker process has its own pool, so the connections Warbler can open
+are roughly workers * (pool size + max overflow). Set DB_MAX_CONNECTIONS to
+the share of Postgres' `max_connections` this app may use and
+`size_for_workers()` divides it between the WEB_CONCURRENCY workers.
+
+`InstrumentedQueuePool` counts checkouts, time spent waiting for a
+connection, timeouts and overflow use; `/internal/stats` shows them for
+the worker that answers.
+"""
+
+import threading
+import time
+
+from sqlalchemy import exc
+from sqlalchemy.pool import QueuePool
+
+# fraction of each worker's connections kept open; the rest is overflow
+POOL_SHARE = 0.75
+
+
+def size_for_workers(max_connections, workers):
+    """(pool_size, max_overflow) so `workers` pools fit `max_connections`."""
+
+    per_worker = max(1, max_connections // max(1, workers))
+    pool_size = max(1, int(per_worker * POOL_SHARE))
+
+    return pool_size, per_worker - pool_size
+
+
+class InstrumentedQueuePool(QueuePool):
+    """QueuePool keeping counts of how it's used."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+
+        self._stats_lock = threading.Lock()
+        self.checkouts = 0
+        self.overflow_checkouts = 0
+        self.timeouts = 0
+        self.wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+        self.peak_checked_out = 0
+
+    def _do_get(self):
+        start = time.monotonic()
+
+        try:
+            conn = super()._do_get()
+        except exc.TimeoutError:
+            with self._stats_lock:
+                self.timeouts += 1
+            raise
+
+        waited = time.monotonic() - start
+
+        with self._stats_lock:
+            self.checkouts += 1
+            self.wait_seconds += waited
+            self.max_wait_seconds = max(self.max_wait_seconds, waited)
+            self.peak_checked_out = max(self.peak_checked_out,
+                                        self.checkedout())
+            if self.overflow() > 0:
+                self.overflow_checkouts += 1
+
+        return conn
+
+    def stats(self):
+        """Current state and running totals, for monitoring."""
+
+        return {
+            'pool_size': self.size(),
+            'max_overflow': self._max_overflow,
+            'checked_out': self.checkedout(),
+            'checked_in': self.checkedin(),
+            'overflow': max(0, self.overflow()),
+            'peak_checked_out': self.peak_checked_out,
+            'checkouts': self.checkouts,
+            'overflow_checkouts': self.overflow_checkouts,
+            'timeouts': self.timeouts,
+            'wait_seconds': self.wait_seconds,
+            'max_wait_seconds': self.max_wait_seconds,
+        }
+
+
+def pool_stats(engine):
+    """Stats for `engine`'s pool, or None if it isn't instrumented."""
+
+    pool = engine.pool
+
+    if not isinstance(pool, InstrumentedQueuePool):
+        return None
+
+    return pool.stats()
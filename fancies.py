@@ -0,0 +1,78 @@
+"""Fancying and unfancying messages in one statement.
+
+The toggle used to load the message, load everyone who'd fancied it to
+check whether the viewer had, then insert or delete -- several round trips,
+slower the more popular the message, and racy on a double click.
+
+`set_fancied()` does it in a single PostgreSQL statement: delete or
+insert the `fancies` row, bump the user's and message's counters by
+however many rows actually changed, and return the new state and count.
+Passing the state wanted (rather than toggling) makes repeats harmless.
+"""
+
+from collections import namedtuple
+
+from sqlalchemy import text
+from sqlalchemy.exc import IntegrityError
+
+from models import db
+
+FancyState = namedtuple('FancyState', ['fancied', 'count'])
+
+# :want is NULL to toggle, or true/false to set
+SET_FANCIED = text("""
+WITH removed AS (
+    DELETE FROM fancies
+    WHERE user_id = :user_id AND message_id = :message_id
+      AND :want IS NOT TRUE
+    RETURNING 1
+), added AS (
+    INSERT INTO fancies (user_id, message_id)
+    SELECT :user_id, :message_id
+    WHERE :want IS NOT FALSE AND NOT EXISTS (SELECT 1 FROM removed)
+    ON CONFLICT DO NOTHING
+    RETURNING 1
+), delta AS (
+    SELECT (SELECT count(*) FROM added) - (SELECT count(*) FROM removed) AS n
+), user_count AS (
+    UPDATE users SET fancies_count = users.fancies_count + delta.n
+    FROM delta
+    WHERE users.id = :user_id AND delta.n <> 0
+), message_count AS (
+    UPDATE messages SET fancies_count = messages.fancies_count + delta.n
+    FROM delta
+    WHERE messages.id = :message_id AND delta.n <> 0
+    RETURNING messages.fancies_count
+)
+SELECT EXISTS (SELECT 1 FROM added) AS added,
+       EXISTS (SELECT 1 FROM removed) AS removed,
+       COALESCE((SELECT fancies_count FROM message_count),
+                (SELECT fancies_count FROM messages
+                 WHERE id = :message_id)) AS count
+""")
+
+
+def set_fancied(user_id, message_id, want=None):
+    """Fancy (want=True), unfancy (False) or toggle (None) a message.
+
+    Returns a FancyState; commit afterwards. If there's no such message,
+    rolls the session back and returns None.
+    """
+
+    try:
+        row = db.session.execute(SET_FANCIED, {
+            'user_id': user_id, 'message_id': message_id, 'want': want,
+        }).first()
+    except IntegrityError:
+        # the insert hit the foreign key: no such message
+        db.session.rollback()
+        return None
+
+    if row.count is None:
+        return None
+
+    # nothing changed: it already was as wanted (or, toggling, someone
+    # else's click got in first and fancied it)
+    fancied = row.added or (not row.removed and want is not False)
+
+    return FancyState(fancied, row.count)
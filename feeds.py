@@ -0,0 +1,78 @@
+"""Batched loading of everything a page of messages needs to render.
+
+Rendering a message card needs its author, its fancy count and whether the
+viewer has fancied it. Asking each Message for those lazily costs a few
+queries per card; these helpers fetch them for a whole page at once, in a
+fixed number of queries however long the page is. (The fancy count is a
+column on Message, kept by counters.py.)
+
+Messages by deleted accounts are dropped here, so a page may come out a
+little short while an account waits to be purged.
+"""
+
+from collections import namedtuple
+
+from models import db, Fancy, User
+
+FeedItem = namedtuple('FeedItem',
+                      ['message', 'author', 'fancy_count', 'fancied',
+                       'following_author'],
+                      defaults=[None])
+
+
+def load_authors(messages):
+    """Map user id -> User for the live authors of `messages` (one query)."""
+
+    author_ids = {msg.user_id for msg in messages}
+
+    if not author_ids:
+        return {}
+
+    return {user.id: user
+            for user in User.query.filter(User.id.in_(author_ids),
+                                          User.deleted_at.is_(None))}
+
+
+def load_fancied_by(viewer, message_ids):
+    """Set of `message_ids` that `viewer` has fancied (one query)."""
+
+    if viewer is None or not message_ids:
+        return set()
+
+    rows = (db.session
+            .query(Fancy.message_id)
+            .filter(Fancy.user_id == viewer.id,
+                    Fancy.message_id.in_(message_ids))
+            .all())
+
+    return {row[0] for row in rows}
+
+
+def load_feed(messages, viewer):
+    """Wrap `messages` as FeedItems with everything precomputed for `viewer`,
+    leaving out messages by deleted accounts."""
+
+    authors = load_authors(messages)
+    messages = [msg for msg in messages if msg.user_id in authors]
+
+    fancied = load_fancied_by(viewer, [msg.id for msg in messages])
+
+    return [FeedItem(message=msg,
+                     author=authors[msg.user_id],
+                     fancy_count=msg.fancies_count,
+                     fancied=msg.id in fancied)
+            for msg in messages]
+
+
+def load_message(message, viewer):
+    """A single FeedItem for `message`, including whether `viewer` follows
+    its author."""
+
+    [item] = load_feed([message], viewer)
+
+    if viewer is None or viewer.id == message.user_id:
+        return item
+
+    following = viewer.is_following(item.author)
+
+    return item._replace(following_author=following)
@@ -0,0 +1,158 @@
+"""Following and unfollowing, one or many users at a time.
+
+Appending to or removing from `user.following` makes SQLAlchemy load the
+whole collection first -- every account the user follows -- to write a
+single row. Here follows are plain set-based statements on `follows`:
+
+- follow(): one INSERT ... SELECT FROM users ... ON CONFLICT DO NOTHING,
+  which skips missing users and follows that already exist,
+- unfollow(): one DELETE,
+
+both RETURNING the ids that actually changed, so counters and timelines are
+only touched for those. The cost depends on how many users are (un)followed,
+not on how many the follower already follows.
+
+After a change `follows_changed` is sent (follower_id, added=[...],
+removed=[...]) for anything caching follow-dependent data to hook into.
+
+Follower and following lists are read a page at a time with follow_page():
+keyset-paginated on the other user's id, which walks the `follows` primary
+key (followers) or ix_follows_following (following) in order, and flags
+the users the viewer follows in the same query.
+"""
+
+from collections import namedtuple
+
+from flask.signals import Namespace
+from sqlalchemy import and_, literal, select
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import aliased, load_only
+from sqlalchemy.orm.util import identity_key
+
+from models import db, Follows, User
+import counters
+import pagination
+import timeline
+
+# most users one bulk request may (un)follow
+MAX_BULK = 1000
+
+signals = Namespace()
+follows_changed = signals.signal('follows-changed')
+
+FollowEntry = namedtuple('FollowEntry', ['user', 'viewer_follows'])
+
+# what a user card shows
+CARD_COLUMNS = ('id', 'username', 'image_url', 'header_image_url', 'bio')
+
+
+def follow(follower_id, followed_ids):
+    """Have `follower_id` follow each of `followed_ids`.
+
+    Returns the ids newly followed; missing or deleted users, the follower
+    themself and users already followed are skipped. Commit afterwards.
+    """
+
+    if not followed_ids:
+        return []
+
+    users = (select([User.id, literal(follower_id)])
+             .where(User.id.in_(followed_ids))
+             .where(User.id != follower_id)
+             .where(User.deleted_at.is_(None)))
+
+    stmt = (insert(Follows.__table__)
+            .from_select(['user_being_followed_id', 'user_following_id'],
+                         users)
+            .on_conflict_do_nothing()
+            .returning(Follows.user_being_followed_id))
+
+    added = [row[0] for row in db.session.execute(stmt)]
+
+    if added:
+        counters.follows_added(follower_id, added)
+        timeline.add_follows(follower_id, added)
+        changed(follower_id, added=added)
+
+    return added
+
+
+def unfollow(follower_id, followed_ids):
+    """Have `follower_id` stop following each of `followed_ids`.
+
+    Returns the ids actually unfollowed. Commit afterwards.
+    """
+
+    if not followed_ids:
+        return []
+
+    stmt = (Follows.__table__
+            .delete()
+            .where(Follows.user_following_id == follower_id)
+            .where(Follows.user_being_followed_id.in_(followed_ids))
+            .returning(Follows.user_being_followed_id))
+
+    removed = [row[0] for row in db.session.execute(stmt)]
+
+    if removed:
+        counters.follows_removed(follower_id, removed)
+        timeline.remove_follows(follower_id, removed)
+        timeline.followers_removed(removed)
+        changed(follower_id, removed=removed)
+
+    return removed
+
+
+def changed(follower_id, added=(), removed=()):
+    """Expire what this session has loaded about the follows, tell hooks."""
+
+    for user_id in (follower_id, *added, *removed):
+        user = db.session.identity_map.get(identity_key(User, user_id))
+
+        if user is not None:
+            db.session.expire(user, ['following', 'followers',
+                                     'following_count', 'followers_count'])
+
+    follows_changed.send(follower_id, added=list(added),
+                         removed=list(removed))
+
+
+def follow_page(user_id, direction, viewer_id=None, after_id=None,
+                per_page=None):
+    """One page of the users following (direction='followers') or followed
+    by (direction='following') `user_id`, in id order after `after_id`.
+
+    Returns a pagination.Page of FollowEntry, whose `next_cursor` is the id
+    to continue after.
+    """
+
+    per_page = per_page or pagination.page_size()
+
+    if direction == 'followers':
+        listed = Follows.user_being_followed_id
+        other = Follows.user_following_id
+    else:
+        listed = Follows.user_following_id
+        other = Follows.user_being_followed_id
+
+    viewer = aliased(Follows)
+
+    query = (db.session
+             .query(User, viewer.user_following_id.isnot(None))
+             .options(load_only(*CARD_COLUMNS))
+             .join(Follows, other == User.id)
+             .outerjoin(viewer, and_(viewer.user_following_id == viewer_id,
+                                     viewer.user_being_followed_id == User.id))
+             .filter(listed == user_id, User.deleted_at.is_(None)))
+
+    if after_id:
+        query = query.filter(other > after_id)
+
+    rows = query.order_by(other).limit(per_page + 1).all()
+    entries = [FollowEntry(user, bool(flag)) for user, flag in rows]
+
+    if len(entries) <= per_page:
+        return pagination.Page(entries, None)
+
+    entries = entries[:per_page]
+    return pagination.Page(entries, entries[-1].user.id)
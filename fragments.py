@@ -0,0 +1,77 @@
+"""Cached HTML fragments for message cards.
+
+A message card looks the same to everyone except for the star colour (has
+the viewer fancied it?) and, on the single-message page, the
+delete/follow/unfollow buttons. We render the shared part once with
+placeholder comments where those per-viewer pieces go, cache it, and fill
+the placeholders in on each request.
+
+Each cached card is stored with a version made of everything it shows
+that can change: the fancy count and the author's username and picture.
+A stale version is simply re-rendered, so fancying a message or editing a
+profile needs no explicit invalidation. Deleted messages are dropped with
+`forget_message()`.
+"""
+
+from flask import get_template_attribute
+from markupsafe import Markup
+
+from cache import get_cache
+
+# HTML comments can't appear in rendered message text (it's escaped), so
+# these can't be forged by users
+ACTIONS_SLOT = Markup("<!--slot:actions-->")
+STAR_SLOT = Markup("<!--slot:star-->")
+
+
+def cache_key(message_id, single_message):
+    return f"card:{message_id}:{int(single_message)}"
+
+
+def card_version(item):
+    """Everything shown on the shared part of a card that can change."""
+
+    return (item.fancy_count, item.author.username, item.author.image_url)
+
+
+def render_card(item, single_message):
+    """Render the shared part of a card, with per-viewer slots left empty."""
+
+    msg_card = get_template_attribute('macros.html', 'msg_card')
+
+    return str(msg_card(item.message, item.author, item.fancy_count,
+                        single_message, ACTIONS_SLOT, STAR_SLOT))
+
+
+def message_card(item, single_message=False):
+    """HTML for a FeedItem's card as seen by the current viewer."""
+
+    cache = get_cache()
+    key = cache_key(item.message.id, single_message)
+    version = card_version(item)
+
+    cached = cache.get(key)
+
+    if cached is not None and cached[0] == version:
+        html = cached[1]
+    else:
+        html = render_card(item, single_message)
+        cache.set(key, (version, html))
+
+    fancy_star = get_template_attribute('macros.html', 'fancy_star')
+    html = html.replace(STAR_SLOT, str(fancy_star(item.fancied)))
+
+    if single_message:
+        msg_actions = get_template_attribute('macros.html', 'msg_actions')
+        html = html.replace(ACTIONS_SLOT, str(msg_actions(item)))
+
+    return Markup(html)
+
+
+def forget_message(message_id):
+    """Drop cached cards for a deleted message."""
+
+    cache = get_cache()
+
+    for single_message in (False, True):
+        cache.delete(cache_key(message_id, single_message))
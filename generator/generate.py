@@ -0,0 +1,247 @@
+"""Generate large CSVs of synthetic Warbler data for load testing.
+
+Unlike create_csvs.py this streams rows straight to disk, needs no network,
+and splits the work between processes, so it scales to tens of millions of
+rows. The same --seed always gives the same files, whatever --processes is.
+
+Followers follow a power law: a handful of users have a large share of all
+followers, most have a few. Message authorship and fancied messages are
+skewed the same way.
+
+    python generator/generate.py --users 1000000 --messages 20000000 \\
+        --follows 50000000 --fancies 20000000 --processes 8
+
+Writes users.csv, messages.csv, follows.csv and fancies.csv to --out (the
+generator/ directory by default, where seed.py looks). Users and messages
+are numbered from 1 in file order, matching the ids they get when loaded
+into empty tables.
+"""
+
+import argparse
+import csv
+import os
+import shutil
+from datetime import datetime, timedelta
+from multiprocessing import Pool
+from random import Random
+
+from faker import Faker
+
+from helpers import AUTHOR_STRIDE, power_law, random_datetime, scatter
+
+MAX_WARBLER_LENGTH = 140
+
+USERS_CSV_HEADERS = ['email', 'username', 'image_url', 'password', 'bio',
+                     'header_image_url', 'location']
+MESSAGES_CSV_HEADERS = ['text', 'timestamp', 'user_id']
+FOLLOWS_CSV_HEADERS = ['user_being_followed_id', 'user_following_id']
+FANCIES_CSV_HEADERS = ['message_id', 'user_id']
+
+# bcrypt hash of "password", so every generated user can log in
+PASSWORD = '$2b$12$Q1PUFjhN/AWRQ21LbGYvjeLpZZB6lfZ1BPwifHALGO6oIbyC3CmJe'
+
+IMAGE_URLS = [
+    f"https://randomuser.me/api/portraits/{kind}/{i}.jpg"
+    for kind, count in [("lego", 10), ("men", 100), ("women", 100)]
+    for i in range(count)
+]
+HEADER_IMAGE_URL = "/static/images/warbler-hero.jpg"
+
+# Faker is far too slow to call per row at this scale: draw pools of fake
+# values once per process and pick from them
+POOL_SIZE = 5000
+
+CHUNK_ROWS = 200000
+
+
+class Vocabulary:
+    """Pools of fake words, names and places, the same in every process."""
+
+    def __init__(self, seed):
+        fake = Faker()
+        fake.seed_instance(seed)
+
+        self.words = fake.words(POOL_SIZE)
+        self.first_names = [fake.first_name().lower() for _ in range(500)]
+        self.last_names = [fake.last_name().lower() for _ in range(500)]
+        self.domains = [fake.free_email_domain() for _ in range(50)]
+        self.cities = [fake.city() for _ in range(POOL_SIZE)]
+        self.bios = [fake.sentence() for _ in range(POOL_SIZE)]
+
+    def text(self, rand):
+        words = rand.choices(self.words, k=rand.randint(3, 25))
+        text = " ".join(words).capitalize()[:MAX_WARBLER_LENGTH - 1]
+        return text.rstrip() + "."
+
+
+def users(rand, vocab, args, start, stop):
+    for user_id in range(start, stop):
+        # the id suffix keeps usernames and emails unique
+        username = (f"{rand.choice(vocab.first_names)}"
+                    f"{rand.choice(vocab.last_names)}{user_id}")
+
+        yield (f"{username}@{rand.choice(vocab.domains)}", username,
+               rand.choice(IMAGE_URLS), PASSWORD, rand.choice(vocab.bios),
+               HEADER_IMAGE_URL, rand.choice(vocab.cities))
+
+
+def messages(rand, vocab, args, start, stop):
+    for _ in range(start, stop):
+        # prolific authors aren't necessarily the most followed ones
+        author = scatter(power_law(rand, args.users, args.author_exponent),
+                         args.users, AUTHOR_STRIDE)
+
+        yield (vocab.text(rand),
+               random_datetime(rand, args.start_date, args.end_date),
+               author)
+
+
+def degrees(rand, total, count):
+    """Out-degree for one user, so `count` users make about `total`."""
+
+    mean = total / count if count else 0
+    return int(rand.expovariate(1 / mean)) if mean else 0
+
+
+def pick_distinct(rand, n, k, exponent, exclude=None):
+    """Up to `k` distinct power-law-distributed ids in 1..n."""
+
+    picked = set()
+    attempts = 0
+
+    # popular ids come up again and again; give up rather than spin
+    while len(picked) < k and attempts < k * 10:
+        attempts += 1
+        pick = scatter(power_law(rand, n, exponent), n)
+
+        if pick != exclude:
+            picked.add(pick)
+
+    return picked
+
+
+def follows(rand, vocab, args, start, stop):
+    for follower in range(start, stop):
+        k = min(degrees(rand, args.follows, args.users), args.users - 1)
+
+        for followed in pick_distinct(rand, args.users, k,
+                                      args.follower_exponent, follower):
+            yield (followed, follower)
+
+
+def fancies(rand, vocab, args, start, stop):
+    if not args.messages:
+        return
+
+    for user_id in range(start, stop):
+        k = min(degrees(rand, args.fancies, args.users), args.messages)
+
+        for message_id in pick_distinct(rand, args.messages, k,
+                                        args.fancy_exponent):
+            yield (message_id, user_id)
+
+
+# (filename, headers, row generator, number of ids to generate rows for,
+#  about how many rows each id makes)
+TABLES = [
+    ('users.csv', USERS_CSV_HEADERS, users,
+     lambda args: args.users, lambda args: 1),
+    ('messages.csv', MESSAGES_CSV_HEADERS, messages,
+     lambda args: args.messages, lambda args: 1),
+    ('follows.csv', FOLLOWS_CSV_HEADERS, follows,
+     lambda args: args.users, lambda args: args.follows / args.users),
+    ('fancies.csv', FANCIES_CSV_HEADERS, fancies,
+     lambda args: args.users, lambda args: args.fancies / args.users),
+]
+
+_vocab = None
+
+
+def write_chunk(task):
+    """Write one chunk of one table to its own part file."""
+
+    global _vocab
+
+    args, table, chunk, start, stop = task
+    filename, _, rows, _, _ = TABLES[table]
+
+    if _vocab is None:
+        _vocab = Vocabulary(args.seed)
+
+    # seeded by position alone, so the output doesn't depend on which
+    # process writes which chunk
+    rand = Random(f"{args.seed}:{table}:{chunk}")
+    path = os.path.join(args.out, f"{filename}.part{chunk:05d}")
+
+    with open(path, 'w', newline='') as part:
+        csv.writer(part).writerows(rows(rand, _vocab, args, start, stop))
+
+    return path
+
+
+def tasks(args, table):
+    """Chunks to write for a table: [(args, table, chunk, start, stop)]."""
+
+    _, _, _, count, rows_per_id = TABLES[table]
+    count = count(args)
+    step = max(1, int(CHUNK_ROWS / max(1, rows_per_id(args))))
+
+    return [(args, table, chunk, start, min(start + step, count + 1))
+            for chunk, start in enumerate(range(1, count + 1, step))]
+
+
+def concatenate(args, table, parts):
+    filename, headers, _, _, _ = TABLES[table]
+
+    with open(os.path.join(args.out, filename), 'w', newline='') as out:
+        csv.writer(out).writerow(headers)
+
+        for path in parts:
+            with open(path) as part:
+                shutil.copyfileobj(part, out)
+            os.remove(path)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Generate synthetic Warbler CSVs.")
+    parser.add_argument('--users', type=int, default=300)
+    parser.add_argument('--messages', type=int, default=1000)
+    parser.add_argument('--follows', type=int, default=5000,
+                        help="about this many in total")
+    parser.add_argument('--fancies', type=int, default=2000,
+                        help="about this many in total")
+    parser.add_argument('--follower-exponent', type=float, default=1.1,
+                        help="power law exponent of followers per user")
+    parser.add_argument('--author-exponent', type=float, default=0.8,
+                        help="power law exponent of messages per user")
+    parser.add_argument('--fancy-exponent', type=float, default=1.1,
+                        help="power law exponent of fancies per message")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--processes', type=int, default=os.cpu_count())
+    parser.add_argument('--end-date', type=datetime.fromisoformat,
+                        default=datetime(2020, 1, 1),
+                        help="latest message timestamp (YYYY-MM-DD)")
+    parser.add_argument('--years', type=int, default=2,
+                        help="how far back messages go")
+    parser.add_argument('--out', default=os.path.dirname(
+        os.path.abspath(__file__)))
+
+    args = parser.parse_args(argv)
+    args.start_date = args.end_date - timedelta(days=365 * args.years)
+    return args
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    os.makedirs(args.out, exist_ok=True)
+
+    with Pool(args.processes) as pool:
+        for table, (filename, *_) in enumerate(TABLES):
+            parts = pool.map(write_chunk, tasks(args, table))
+            concatenate(args, table, parts)
+            print(f"Wrote {filename}")
+
+
+if __name__ == "__main__":
+    main()
@@ -12,3 +12,41 @@ def get_random_datetime(year_gap=2):
     random_timestamp = uniform(then.timestamp(), now.timestamp())
 
     return datetime.fromtimestamp(random_timestamp)
+
+
+def random_datetime(rand, start, end):
+    """Datetime between `start` and `end`, using the Random `rand`."""
+
+    return datetime.fromtimestamp(
+        rand.uniform(start.timestamp(), end.timestamp()))
+
+
+def power_law(rand, n, exponent):
+    """Integer in 1..n with P(k) proportional to k ** -exponent.
+
+    Low numbers come up far more often than high ones: a few popular
+    users, a long tail of everyone else.
+    """
+
+    u = rand.random()
+
+    if exponent == 1:
+        return min(n, int(n ** u))
+
+    a = 1 - exponent
+    return min(n, int((1 + u * (n ** a - 1)) ** (1 / a)))
+
+
+# primes, so coprime with any n below them
+FOLLOWED_STRIDE = 2654435761
+AUTHOR_STRIDE = 2246822519
+
+
+def scatter(k, n, stride=FOLLOWED_STRIDE):
+    """Map 1..n onto itself, spreading neighbours far apart.
+
+    So the most popular users (k=1, 2, ...) aren't also the oldest ids.
+    Different strides give unrelated orders.
+    """
+
+    return (k - 1) * stride % n + 1
@@ -0,0 +1,71 @@
+"""gunicorn settings for Warbler.
+
+Two serving modes, picked with WARBLER_WORKER:
+
+- 'sync' (default): one request per worker process at a time. Simple, but
+  an idle keep-alive connection or a slow client ties up a whole process.
+- 'gevent': each worker runs up to WORKER_CONNECTIONS requests as
+  greenlets. The standard library is monkey-patched by gunicorn, and
+  psycopg2 is made cooperative with psycogreen, so a greenlet waiting on
+  Postgres (or a socket, or the password pool) lets the others run. One
+  process can then hold thousands of idle or slow clients.
+
+The views, templates and models are the same in both modes: Flask-SQLAlchemy
+scopes sessions per greenlet, and the database pool hands connections out
+cooperatively. Keep the database pool (SQLALCHEMY_POOL_SIZE and friends)
+well below WORKER_CONNECTIONS; requests past the pool size wait for a
+connection rather than opening more.
+
+    WARBLER_WORKER=gevent gunicorn -c gunicorn.conf.py app:app
+"""
+
+import multiprocessing
+import os
+
+worker_mode = os.environ.get('WARBLER_WORKER', 'sync')
+
+bind = f"0.0.0.0:{os.environ.get('PORT', 8000)}"
+workers = int(os.environ.get('WEB_CONCURRENCY',
+                             multiprocessing.cpu_count() * 2 + 1))
+
+# the app divides DB_MAX_CONNECTIONS between this many workers
+os.environ['WEB_CONCURRENCY'] = str(workers)
+
+if worker_mode == 'gevent':
+    worker_class = 'gevent'
+    worker_connections = int(os.environ.get('WORKER_CONNECTIONS', 1000))
+    keepalive = 5
+elif worker_mode == 'sync':
+    worker_class = 'sync'
+else:
+    raise ValueError(f"Unknown WARBLER_WORKER: {worker_mode}")
+
+
+# Prometheus multiprocess mode (see metrics.py): workers share numbers
+# through files in this directory, which must start out empty
+metrics_dir = os.environ.get('PROMETHEUS_MULTIPROC_DIR')
+
+if metrics_dir:
+    os.environ['prometheus_multiproc_dir'] = metrics_dir
+
+
+def on_starting(server):
+    if metrics_dir:
+        os.makedirs(metrics_dir, exist_ok=True)
+
+        for filename in os.listdir(metrics_dir):
+            os.remove(os.path.join(metrics_dir, filename))
+
+
+def child_exit(server, worker):
+    if metrics_dir:
+        from prometheus_client import multiprocess
+
+        multiprocess.mark_process_dead(worker.pid)
+
+
+def post_fork(server, worker):
+    if worker_mode == 'gevent':
+        from psycogreen.gevent import patch_psycopg
+
+        patch_psycopg()
@@ -0,0 +1,146 @@
+"""HTTP caching policy for Warbler.
+
+- Static files linked through `static_url()` carry a content hash in their
+  query string, so they can be cached by browsers and CDNs "forever".
+- Public pages (a message, a profile) get an ETag computed from a couple of
+  cheap queries. A client sending a matching If-None-Match gets a 304
+  without the view running or the template rendering.
+- Anything rendered for a logged-in user (or carrying a flash message) is
+  private to them, and must be revalidated.
+"""
+
+import hashlib
+import os
+from functools import wraps
+
+from flask import current_app, g, make_response, request, session, url_for
+
+from models import db, Message, User
+import pagination
+
+IMMUTABLE = "public, max-age=31536000, immutable"
+STATIC = "public, max-age=3600"
+PUBLIC = "public, no-cache"
+PRIVATE = "private, no-cache"
+
+_fingerprints = {}
+
+
+def fingerprint(filename):
+    """Short hash of a static file's contents (memoized by mtime)."""
+
+    path = os.path.join(current_app.static_folder, filename)
+    mtime = os.path.getmtime(path)
+
+    cached = _fingerprints.get(path)
+
+    if cached is None or cached[0] != mtime:
+        with open(path, 'rb') as file:
+            digest = hashlib.md5(file.read()).hexdigest()[:12]
+        cached = _fingerprints[path] = (mtime, digest)
+
+    return cached[1]
+
+
+def static_url(filename):
+    """URL for a static file that changes whenever the file does."""
+
+    return url_for('static', filename=filename, v=fingerprint(filename))
+
+
+def make_etag(*parts):
+    """A strong ETag from the things a page depends on."""
+
+    return hashlib.sha1(repr(parts).encode()).hexdigest()
+
+
+def is_personal():
+    """Will this response be rendered differently for this visitor?"""
+
+    return g.get('user') is not None or '_flashes' in session
+
+
+def conditional(etag_for):
+    """Decorate a public view to answer If-None-Match with a 304.
+
+    `etag_for` gets the view's arguments and returns an ETag, or None if it
+    can't tell (the view then runs as usual). Logged-in visitors always get
+    the full page.
+    """
+
+    def decorator(f):
+        @wraps(f)
+        def wrapped(*args, **kwargs):
+
+            if is_personal():
+                return f(*args, **kwargs)
+
+            etag = etag_for(*args, **kwargs)
+
+            if etag is None:
+                return f(*args, **kwargs)
+
+            if request.if_none_match.contains(etag):
+                response = current_app.response_class(status=304)
+            else:
+                response = make_response(f(*args, **kwargs))
+
+            response.set_etag(etag)
+            response.headers['Cache-Control'] = PUBLIC
+            return response
+
+        return wrapped
+    return decorator
+
+
+def message_etag(message_id):
+    """ETag for a single message page."""
+
+    row = (db.session
+           .query(Message.id, Message.fancies_count,
+                  User.username, User.image_url)
+           .join(User, User.id == Message.user_id)
+           .filter(Message.id == message_id, User.deleted_at.is_(None))
+           .first())
+
+    return row and make_etag('message', *row)
+
+
+def profile_etag(user_id):
+    """ETag for a page of a user's profile."""
+
+    user = (db.session
+            .query(User.username, User.image_url, User.header_image_url,
+                   User.bio, User.location, User.messages_count,
+                   User.following_count, User.followers_count,
+                   User.fancies_count)
+            .filter(User.id == user_id, User.deleted_at.is_(None))
+            .first())
+
+    if user is None:
+        return None
+
+    cursor = pagination.cursor_from_request()
+    query = (db.session
+             .query(Message.id, Message.fancies_count)
+             .filter(Message.user_id == user_id))
+
+    page = pagination.keyset(query, Message.timestamp, Message.id,
+                             cursor, pagination.page_size()).all()
+
+    return make_etag('profile', user_id, cursor, tuple(user), tuple(page))
+
+
+def set_cache_headers(response):
+    """Fill in Cache-Control for responses whose views didn't."""
+
+    if request.endpoint == 'static':
+        response.headers['Cache-Control'] = (
+            IMMUTABLE if 'v' in request.args else STATIC)
+        return response
+
+    if 'Cache-Control' not in response.headers:
+        response.headers['Cache-Control'] = PRIVATE
+
+    response.vary.add('Cookie')
+    return response
@@ -0,0 +1,241 @@
+"""Lightweight per-request instrumentation, safe to leave on in production.
+
+For a sample of requests (INSTRUMENT_SAMPLE_RATE, 0 to 1) we record:
+
+- how many SQL statements ran and how long they took,
+- how long render_template() took,
+- statements slower than SLOW_QUERY_MS, with the line of our code that
+  ran them (logged as warnings),
+
+and, to internal requests (see init_instrument) or in debug mode, send the
+totals back in a `Server-Timing` header (browser dev tools show it); other
+clients don't get to see our timings. Requests running more than
+QUERY_WARN_COUNT statements are logged too: that's usually an N+1 query in
+a loop.
+
+Totals are also aggregated per endpoint, in each worker process, and
+served as JSON at /internal/requests.
+"""
+
+import os
+import random
+import threading
+import time
+import traceback
+
+from flask import (current_app, g, has_request_context, request,
+                   before_render_template, template_rendered)
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+PROJECT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+DEFAULT_SAMPLE_RATE = 0.05
+DEFAULT_SLOW_QUERY_MS = 100
+DEFAULT_QUERY_WARN_COUNT = 30
+
+# slow statements kept per endpoint for the report
+MAX_SLOW_STATEMENTS = 10
+
+
+class RequestStats:
+    """What one request did."""
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.queries = 0
+        self.db_seconds = 0.0
+        self.template_seconds = 0.0
+        self.slow = []
+
+
+class EndpointStats:
+    """Running totals for one endpoint."""
+
+    def __init__(self):
+        self.requests = 0
+        self.seconds = 0.0
+        self.queries = 0
+        self.max_queries = 0
+        self.db_seconds = 0.0
+        self.template_seconds = 0.0
+        self.slow = []
+
+    def add(self, stats, seconds):
+        self.requests += 1
+        self.seconds += seconds
+        self.queries += stats.queries
+        self.max_queries = max(self.max_queries, stats.queries)
+        self.db_seconds += stats.db_seconds
+        self.template_seconds += stats.template_seconds
+        self.slow = (self.slow + stats.slow)[-MAX_SLOW_STATEMENTS:]
+
+    def report(self):
+        requests = self.requests or 1
+
+        return {
+            'requests': self.requests,
+            'avg_ms': self.seconds / requests * 1000,
+            'avg_queries': self.queries / requests,
+            'max_queries': self.max_queries,
+            'avg_db_ms': self.db_seconds / requests * 1000,
+            'avg_template_ms': self.template_seconds / requests * 1000,
+            'slow_statements': self.slow,
+        }
+
+
+_endpoints = {}
+_lock = threading.Lock()
+
+
+def current_stats():
+    """Stats of the request being served, if it's being sampled."""
+
+    if not has_request_context():
+        return None
+
+    return g.get('instrument')
+
+
+def call_site():
+    """'file:line in function' of the innermost frame in our own code."""
+
+    for frame in reversed(traceback.extract_stack()):
+        if (frame.filename.startswith(PROJECT_DIR) and
+                os.path.basename(frame.filename) != 'instrument.py' and
+                'site-packages' not in frame.filename):
+            return (f"{os.path.relpath(frame.filename, PROJECT_DIR)}:"
+                    f"{frame.lineno} in {frame.name}")
+
+    return "unknown"
+
+
+##############################################################################
+# Database and template hooks
+
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def before_cursor_execute(conn, cursor, statement, parameters, context,
+                          executemany):
+    if current_stats() is not None:
+        conn.info.setdefault('instrument_start', []).append(
+            time.perf_counter())
+
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def after_cursor_execute(conn, cursor, statement, parameters, context,
+                         executemany):
+    stats = current_stats()
+    starts = conn.info.get('instrument_start')
+
+    if stats is None or not starts:
+        return
+
+    elapsed = time.perf_counter() - starts.pop()
+    stats.queries += 1
+    stats.db_seconds += elapsed
+
+    if elapsed * 1000 >= current_app.config.get('SLOW_QUERY_MS',
+                                                DEFAULT_SLOW_QUERY_MS):
+        slow = {'ms': round(elapsed * 1000, 1), 'statement': statement,
+                'call_site': call_site()}
+        stats.slow.append(slow)
+
+        current_app.logger.warning("Slow query (%.1f ms) at %s: %s",
+                                   slow['ms'], slow['call_site'], statement)
+
+
+@event.listens_for(Engine, 'handle_error')
+def handle_error(context):
+    conn = context.connection
+    starts = conn is not None and conn.info.get('instrument_start')
+
+    if starts:
+        starts.pop()
+
+
+def before_template(sender, template, context, **extra):
+    stats = current_stats()
+
+    if stats is not None:
+        g.instrument_template_start = time.perf_counter()
+
+
+def after_template(sender, template, context, **extra):
+    stats = current_stats()
+    start = g.pop('instrument_template_start', None)
+
+    if stats is not None and start is not None:
+        stats.template_seconds += time.perf_counter() - start
+
+
+##############################################################################
+# Request hooks
+
+
+def start_request():
+    rate = current_app.config.get('INSTRUMENT_SAMPLE_RATE',
+                                  DEFAULT_SAMPLE_RATE)
+
+    if rate >= 1 or random.random() < rate:
+        g.instrument = RequestStats()
+
+
+def finish_request(response):
+    stats = current_stats()
+
+    if stats is None:
+        return response
+
+    seconds = time.perf_counter() - stats.start
+
+    show_timing = current_app.extensions['warbler_instrument']
+
+    if current_app.debug or show_timing():
+        response.headers['Server-Timing'] = ", ".join([
+            f'db;dur={stats.db_seconds * 1000:.1f};'
+            f'desc="{stats.queries} queries"',
+            f'tpl;dur={stats.template_seconds * 1000:.1f}',
+            f'total;dur={seconds * 1000:.1f}',
+        ])
+
+    if stats.queries > current_app.config.get('QUERY_WARN_COUNT',
+                                              DEFAULT_QUERY_WARN_COUNT):
+        current_app.logger.warning("%s ran %d queries", request.endpoint,
+                                   stats.queries)
+
+    with _lock:
+        _endpoints.setdefault(request.endpoint, EndpointStats()).add(
+            stats, seconds)
+
+    return response
+
+
+def report():
+    """{endpoint: aggregated stats} for this worker process."""
+
+    with _lock:
+        return {endpoint: stats.report()
+                for endpoint, stats in _endpoints.items()}
+
+
+def reset():
+    with _lock:
+        _endpoints.clear()
+
+
+def init_instrument(app, show_timing=lambda: False):
+    """Instrument `app`'s requests.
+
+    `show_timing()` says whether the current request may see the
+    Server-Timing header. Call before other before_request handlers so
+    their queries count too.
+    """
+
+    app.extensions['warbler_instrument'] = show_timing
+
+    app.before_request(start_request)
+    app.after_request(finish_request)
+
+    before_render_template.connect(before_template, app)
+    template_rendered.connect(after_template, app)
@@ -0,0 +1,242 @@
+"""A job queue in the database, for work that needn't hold up a request.
+
+Tasks are plain functions registered with @task:
+
+    @jobs.task('fan-out-message')
+    def fan_out(message_id):
+        ...
+
+and queued from a request with enqueue():
+
+    jobs.enqueue('fan-out-message', key=f"fan-out-message:{msg.id}",
+                 message_id=msg.id)
+
+The job is a row in the `jobs` table, written in the request's own
+transaction: it's only queued if the request commits, and a job with the
+same idempotency `key` is only ever queued once. Arguments must be JSON.
+
+`flask worker` runs them. Workers claim the oldest due job with SELECT ...
+FOR UPDATE SKIP LOCKED, so any number can run side by side without a
+broker. A job that raises is retried after JOB_RETRY_DELAY, then twice
+that, four times that, ... seconds, up to its task's max_attempts, then
+marked failed. A job left running longer than JOB_LOCK_TIMEOUT (its worker
+died) is picked up again if it has attempts left, and marked failed if
+not, so tasks should be safe to run twice. Tasks that may run longer than
+that call heartbeat() as they go to keep their claim.
+
+With JOBS_EAGER set, enqueue() runs the task on the spot instead (for
+development without a worker). Finished jobs are kept, for their keys and
+for inspection, until `flask prune-jobs` removes them.
+"""
+
+import json
+import time
+import traceback
+from collections import namedtuple
+from datetime import datetime, timedelta
+
+from flask import current_app
+from sqlalchemy import and_, func, or_, select
+from sqlalchemy.dialects.postgresql import insert
+
+from models import db, Job
+
+DEFAULT_MAX_ATTEMPTS = 5
+DEFAULT_RETRY_DELAY = 10
+DEFAULT_LOCK_TIMEOUT = 600
+DEFAULT_POLL_SECONDS = 1.0
+
+Task = namedtuple('Task', ['func', 'max_attempts'])
+
+TASKS = {}
+
+# id of the job this worker is running, for heartbeat()
+_running = None
+
+
+def task(name, max_attempts=DEFAULT_MAX_ATTEMPTS):
+    """Register a function as the task `name`."""
+
+    def decorator(func):
+        TASKS[name] = Task(func, max_attempts)
+        return func
+
+    return decorator
+
+
+def enqueue(name, key=None, delay=0, **kwargs):
+    """Queue task `name` to run with `kwargs`, `delay` seconds from now.
+
+    Commit afterwards. Returns the job's id, or None if a job with `key`
+    already exists (or the task ran eagerly).
+    """
+
+    if name not in TASKS:
+        raise LookupError(f"Unknown task: {name}")
+
+    if current_app.config.get('JOBS_EAGER'):
+        TASKS[name].func(**kwargs)
+        return None
+
+    stmt = (insert(Job.__table__)
+            .values(task=name, args=json.dumps(kwargs), key=key,
+                    status='queued', attempts=0,
+                    max_attempts=TASKS[name].max_attempts,
+                    run_at=datetime.utcnow() + timedelta(seconds=delay))
+            .on_conflict_do_nothing(index_elements=['key'])
+            .returning(Job.id))
+
+    row = db.session.execute(stmt).first()
+    return row and row[0]
+
+
+def claim():
+    """Take the oldest due job, marking it running; returns it, or None."""
+
+    now = datetime.utcnow()
+    stale = now - timedelta(seconds=current_app.config.get(
+        'JOB_LOCK_TIMEOUT', DEFAULT_LOCK_TIMEOUT))
+
+    # abandoned (its worker died) with no attempts left
+    (Job
+     .query
+     .filter(Job.status == 'running', Job.locked_at < stale,
+             Job.attempts >= Job.max_attempts)
+     .update({'status': 'failed', 'finished_at': now,
+              'last_error': "Worker stopped while running the job"},
+             synchronize_session=False))
+
+    due = (select([Job.id])
+           .where(or_(and_(Job.status == 'queued', Job.run_at <= now),
+                      and_(Job.status == 'running', Job.locked_at < stale,
+                           Job.attempts < Job.max_attempts)))
+           .order_by(Job.run_at, Job.id)
+           .limit(1)
+           .with_for_update(skip_locked=True))
+
+    stmt = (Job.__table__
+            .update()
+            .where(Job.id == due.as_scalar())
+            .values(status='running', locked_at=now,
+                    attempts=Job.attempts + 1)
+            .returning(Job.id, Job.task, Job.args, Job.attempts,
+                       Job.max_attempts))
+
+    job = db.session.execute(stmt).first()
+    db.session.commit()
+
+    return job
+
+
+def heartbeat():
+    """Renew the running job's claim, so no other worker takes it over.
+
+    Commits on a connection of its own, leaving the task's transaction
+    alone. Does nothing outside a worker (e.g. with JOBS_EAGER).
+    """
+
+    if _running is None:
+        return
+
+    with db.engine.begin() as conn:
+        conn.execute(Job.__table__
+                     .update()
+                     .where(Job.id == _running)
+                     .values(locked_at=datetime.utcnow()))
+
+
+def finish(job_id, **values):
+    Job.query.filter_by(id=job_id).update(values, synchronize_session=False)
+    db.session.commit()
+
+
+def run_one():
+    """Run the oldest due job, if any; returns whether there was one."""
+
+    global _running
+
+    job = claim()
+
+    if job is None:
+        return False
+
+    _running = job.id
+
+    try:
+        if job.task not in TASKS:
+            raise LookupError(f"Unknown task: {job.task}")
+
+        TASKS[job.task].func(**json.loads(job.args))
+        db.session.commit()
+
+    except Exception:
+        db.session.rollback()
+        current_app.logger.exception("Job %s (%s) failed", job.id, job.task)
+
+        error = traceback.format_exc()
+
+        if job.attempts >= job.max_attempts:
+            finish(job.id, status='failed', finished_at=datetime.utcnow(),
+                   last_error=error)
+        else:
+            delay = (current_app.config.get('JOB_RETRY_DELAY',
+                                            DEFAULT_RETRY_DELAY) *
+                     2 ** (job.attempts - 1))
+            finish(job.id, status='queued', last_error=error,
+                   run_at=datetime.utcnow() + timedelta(seconds=delay))
+
+    else:
+        finish(job.id, status='done', finished_at=datetime.utcnow())
+
+    finally:
+        _running = None
+        # don't carry one job's objects into the next
+        db.session.remove()
+
+    return True
+
+
+def work(burst=False, poll=DEFAULT_POLL_SECONDS, should_stop=lambda: False):
+    """Run jobs as they come due; returns how many ran.
+
+    With `burst`, stops once there's nothing due instead of polling.
+    """
+
+    ran = 0
+
+    while not should_stop():
+        if run_one():
+            ran += 1
+        elif burst:
+            break
+        else:
+            time.sleep(poll)
+
+    return ran
+
+
+def prune(days):
+    """Delete jobs that finished over `days` days ago; returns how many."""
+
+    cutoff = datetime.utcnow() - timedelta(days=days)
+
+    return (Job
+            .query
+            .filter(Job.status.in_(['done', 'failed']),
+                    Job.finished_at < cutoff)
+            .delete(synchronize_session=False))
+
+
+def stats():
+    """{task: {status: count}} over the whole queue."""
+
+    rows = (db.session
+            .query(Job.task, Job.status, func.count(Job.id))
+            .group_by(Job.task, Job.status))
+
+    counts = {}
+
+    for name, status, count in rows:
+        counts.setdefault(name, {})[status] = count
+
+    return counts
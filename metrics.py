@@ -0,0 +1,159 @@
+"""Prometheus metrics, served at /metrics.
+
+- warbler_request_duration_seconds: latency histogram per endpoint
+- warbler_request_db_seconds / warbler_request_template_seconds: time
+  spent in SQL and templates per request (for instrumented requests, see
+  instrument.py)
+- warbler_requests_in_flight
+- warbler_db_pool_*: connection pool use (see dbpool.py)
+- warbler_cache_{hits,misses}_total: hit ratio is hits / (hits + misses)
+- warbler_password_*: bcrypt queue depth and outcomes (see passwords.py)
+
+Under gunicorn each worker is its own process. Set PROMETHEUS_MULTIPROC_DIR
+to an empty directory and gunicorn.conf.py points prometheus_client's
+multiprocess mode at it: every worker writes its numbers to memory-mapped
+files there, and whichever worker answers /metrics adds them all up.
+"""
+
+import os
+import threading
+import time
+
+from flask import g, request
+from prometheus_client import (CONTENT_TYPE_LATEST, CollectorRegistry,
+                               Counter, Gauge, Histogram, REGISTRY,
+                               generate_latest, multiprocess)
+
+from cache import get_cache
+from dbpool import pool_stats
+from models import db
+from passwords import get_pool
+
+REQUEST_DURATION = Histogram(
+    'warbler_request_duration_seconds', "Request latency",
+    ['endpoint', 'method'])
+REQUEST_DB_SECONDS = Histogram(
+    'warbler_request_db_seconds', "Time in SQL per request", ['endpoint'])
+REQUEST_TEMPLATE_SECONDS = Histogram(
+    'warbler_request_template_seconds',
+    "Time rendering templates per request", ['endpoint'])
+REQUEST_QUERIES = Histogram(
+    'warbler_request_queries', "SQL statements per request", ['endpoint'],
+    buckets=(1, 2, 5, 10, 20, 50, 100))
+IN_FLIGHT = Gauge(
+    'warbler_requests_in_flight', "Requests being served",
+    multiprocess_mode='livesum')
+
+POOL_CHECKED_OUT = Gauge(
+    'warbler_db_pool_checked_out', "Connections in use",
+    multiprocess_mode='livesum')
+POOL_OVERFLOW = Gauge(
+    'warbler_db_pool_overflow', "Connections open beyond the pool size",
+    multiprocess_mode='livesum')
+POOL_CHECKOUTS = Counter(
+    'warbler_db_pool_checkouts_total', "Connection checkouts")
+POOL_TIMEOUTS = Counter(
+    'warbler_db_pool_timeouts_total', "Checkouts that timed out")
+POOL_WAIT = Counter(
+    'warbler_db_pool_wait_seconds_total',
+    "Time spent waiting for connections")
+
+CACHE_HITS = Counter('warbler_cache_hits_total', "Cache hits")
+CACHE_MISSES = Counter('warbler_cache_misses_total', "Cache misses")
+
+PASSWORD_IN_FLIGHT = Gauge(
+    'warbler_password_in_flight', "Password hashes queued or running",
+    multiprocess_mode='livesum')
+PASSWORD_COMPLETED = Counter(
+    'warbler_password_completed_total', "Password hashes done")
+PASSWORD_REJECTED = Counter(
+    'warbler_password_rejected_total', "Password hashes refused (queue full)")
+
+# Pools, caches and password queues keep running totals; we pass on what's
+# new since the last request in this process
+_last = {}
+_last_lock = threading.Lock()
+
+
+def add_totals(counter, key, total):
+    with _last_lock:
+        delta = total - _last.get(key, 0)
+        _last[key] = total
+
+    if delta > 0:
+        counter.inc(delta)
+
+
+def sync_resources():
+    """Copy this process's pool/cache/password numbers over."""
+
+    pool = pool_stats(db.engine)
+    cache = get_cache()
+    passwords = get_pool().stats()
+
+    if pool:
+        POOL_CHECKED_OUT.set(pool['checked_out'])
+        POOL_OVERFLOW.set(pool['overflow'])
+        add_totals(POOL_CHECKOUTS, 'checkouts', pool['checkouts'])
+        add_totals(POOL_TIMEOUTS, 'timeouts', pool['timeouts'])
+        add_totals(POOL_WAIT, 'wait', pool['wait_seconds'])
+
+    add_totals(CACHE_HITS, 'cache_hits', cache.hits)
+    add_totals(CACHE_MISSES, 'cache_misses', cache.misses)
+
+    PASSWORD_IN_FLIGHT.set(passwords['in_flight'])
+    add_totals(PASSWORD_COMPLETED, 'password_completed',
+               passwords['completed'])
+    add_totals(PASSWORD_REJECTED, 'password_rejected', passwords['rejected'])
+
+
+def start_request():
+    g.metrics_start = time.perf_counter()
+    IN_FLIGHT.inc()
+
+
+def finish_request(response):
+    endpoint = request.endpoint or 'none'
+    start = g.get('metrics_start')
+
+    if start is not None:
+        REQUEST_DURATION.labels(endpoint, request.method).observe(
+            time.perf_counter() - start)
+
+    stats = g.get('instrument')
+
+    if stats is not None:
+        REQUEST_DB_SECONDS.labels(endpoint).observe(stats.db_seconds)
+        REQUEST_TEMPLATE_SECONDS.labels(endpoint).observe(
+            stats.template_seconds)
+        REQUEST_QUERIES.labels(endpoint).observe(stats.queries)
+
+    sync_resources()
+    return response
+
+
+def end_request(exc):
+    if g.pop('metrics_start', None) is not None:
+        IN_FLIGHT.dec()
+
+
+def init_metrics(app):
+    """Record metrics for `app`'s requests."""
+
+    app.before_request(start_request)
+    app.after_request(finish_request)
+    app.teardown_request(end_request)
+
+
+def exposition():
+    """(body, content type) of the metrics for all worker processes."""
+
+    sync_resources()
+
+    if 'prometheus_multiproc_dir' in os.environ:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+
+    return generate_latest(registry), CONTENT_TYPE_LATEST
@@ -0,0 +1,86 @@
+"""Versioned schema migrations.
+
+`db.create_all()` builds a fresh database from models.py, but can't change
+an existing one. Changes to existing databases are numbered SQL files in
+migrations/ (`0001_hot_query_indexes.sql`, ...), applied in order by
+`flask migrate`. The versions applied so far are kept in the
+schema_migrations table.
+
+Migrations should also be reflected in models.py, so that fresh databases
+match, and be safe to run against them (CREATE INDEX IF NOT EXISTS, ...).
+"""
+
+import os
+import re
+
+from sqlalchemy import text
+
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                              'migrations')
+
+FILENAME_RE = re.compile(r"^(\d+)_(\w+)\.sql$")
+
+
+def available():
+    """[(version, name, path)] of every migration file, in order."""
+
+    found = []
+
+    for filename in os.listdir(MIGRATIONS_DIR):
+        match = FILENAME_RE.match(filename)
+        if match:
+            found.append((int(match.group(1)), match.group(2),
+                          os.path.join(MIGRATIONS_DIR, filename)))
+
+    return sorted(found)
+
+
+def statements(path):
+    """The SQL statements in a migration file."""
+
+    with open(path) as file:
+        sql = "\n".join(line for line in file
+                        if not line.lstrip().startswith("--"))
+
+    return [stmt.strip() for stmt in sql.split(";") if stmt.strip()]
+
+
+def applied(conn):
+    """Versions already applied to the database behind `conn`."""
+
+    conn.execute(text(
+        "CREATE TABLE IF NOT EXISTS schema_migrations ("
+        " version INTEGER PRIMARY KEY,"
+        " name TEXT NOT NULL)"))
+
+    return {row[0] for row in
+            conn.execute(text("SELECT version FROM schema_migrations"))}
+
+
+def upgrade(engine):
+    """Apply pending migrations, each in its own transaction.
+
+    Returns the names of the migrations applied.
+    """
+
+    with engine.begin() as conn:
+        done = applied(conn)
+
+    names = []
+
+    for version, name, path in available():
+        if version in done:
+            continue
+
+        with engine.begin() as conn:
+            for stmt in statements(path):
+                conn.execute(text(stmt))
+
+            conn.execute(
+                text("INSERT INTO schema_migrations (version, name) "
+                     "VALUES (:version, :name)"),
+                version=version, name=name)
+
+        names.append(name)
+
+    return names
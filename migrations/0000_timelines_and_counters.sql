@@ -0,0 +1,45 @@
+-- Schema that came before numbered migrations, for databases built from
+-- the original models:
+--
+-- * timeline_entries holds each user's home timeline (see timeline.py),
+--   read newest first by (user_id, timestamp); it starts out empty, so run
+--   `flask rebuild-timelines` after upgrading
+-- * denormalized counters on users and messages (see counters.py), filled
+--   in here from the underlying tables
+--
+-- Numbered 0000 so it runs before 0002_soft_delete (which indexes
+-- timeline_entries) without renumbering migrations already applied.
+
+CREATE TABLE IF NOT EXISTS timeline_entries (
+    user_id INTEGER NOT NULL REFERENCES users (id) ON DELETE CASCADE,
+    message_id INTEGER NOT NULL REFERENCES messages (id) ON DELETE CASCADE,
+    author_id INTEGER NOT NULL REFERENCES users (id) ON DELETE CASCADE,
+    timestamp TIMESTAMP NOT NULL,
+    PRIMARY KEY (user_id, message_id)
+);
+
+CREATE INDEX IF NOT EXISTS ix_timeline_entries_user_timestamp
+    ON timeline_entries (user_id, timestamp, message_id);
+
+ALTER TABLE users
+    ADD COLUMN IF NOT EXISTS messages_count INTEGER NOT NULL DEFAULT 0,
+    ADD COLUMN IF NOT EXISTS following_count INTEGER NOT NULL DEFAULT 0,
+    ADD COLUMN IF NOT EXISTS followers_count INTEGER NOT NULL DEFAULT 0,
+    ADD COLUMN IF NOT EXISTS fancies_count INTEGER NOT NULL DEFAULT 0;
+
+ALTER TABLE messages
+    ADD COLUMN IF NOT EXISTS fancies_count INTEGER NOT NULL DEFAULT 0;
+
+UPDATE users SET
+    messages_count = (SELECT count(*) FROM messages
+                      WHERE messages.user_id = users.id),
+    following_count = (SELECT count(*) FROM follows
+                       WHERE follows.user_following_id = users.id),
+    followers_count = (SELECT count(*) FROM follows
+                       WHERE follows.user_being_followed_id = users.id),
+    fancies_count = (SELECT count(*) FROM fancies
+                     WHERE fancies.user_id = users.id);
+
+UPDATE messages SET
+    fancies_count = (SELECT count(*) FROM fancies
+                     WHERE fancies.message_id = messages.id);
@@ -0,0 +1,16 @@
+-- Indexes matching the hottest query predicates:
+--
+-- * a user's messages, newest first (users_show, and home feeds merging in
+--   authors' messages): messages WHERE user_id = ? ORDER BY timestamp, id
+-- * who a user follows: follows WHERE user_following_id = ? (the second
+--   column of the primary key, so the key's index can't be used)
+-- * a user's fancies: fancies WHERE user_id = ? (also second in the key)
+
+CREATE INDEX IF NOT EXISTS ix_messages_user_timestamp
+    ON messages (user_id, timestamp, id);
+
+CREATE INDEX IF NOT EXISTS ix_follows_following
+    ON follows (user_following_id, user_being_followed_id);
+
+CREATE INDEX IF NOT EXISTS ix_fancies_user
+    ON fancies (user_id, message_id);
@@ -0,0 +1,15 @@
+-- Soft-deleted accounts (see accounts.py):
+--
+-- * users.deleted_at marks an account as deleted until it has been purged;
+--   the partial index finds the ones still waiting without touching the
+--   rest of the table
+-- * purging removes the account's messages from everyone's timelines:
+--   timeline_entries WHERE author_id = ?
+
+ALTER TABLE users ADD COLUMN IF NOT EXISTS deleted_at TIMESTAMP;
+
+CREATE INDEX IF NOT EXISTS ix_users_deleted
+    ON users (deleted_at) WHERE deleted_at IS NOT NULL;
+
+CREATE INDEX IF NOT EXISTS ix_timeline_entries_author
+    ON timeline_entries (author_id);
@@ -0,0 +1,19 @@
+-- The job queue (see jobs.py): workers claim the oldest due job with
+-- SELECT ... FOR UPDATE SKIP LOCKED, looking them up by (status, run_at)
+
+CREATE TABLE IF NOT EXISTS jobs (
+    id SERIAL PRIMARY KEY,
+    task TEXT NOT NULL,
+    args TEXT NOT NULL,
+    key TEXT UNIQUE,
+    status TEXT NOT NULL,
+    attempts INTEGER NOT NULL,
+    max_attempts INTEGER NOT NULL,
+    run_at TIMESTAMP NOT NULL,
+    locked_at TIMESTAMP,
+    finished_at TIMESTAMP,
+    last_error TEXT
+);
+
+CREATE INDEX IF NOT EXISTS ix_jobs_status_run_at
+    ON jobs (status, run_at);
@@ -0,0 +1,14 @@
+-- User search (see search.py) matches substrings of username, bio and
+-- location: lower(col) LIKE '%term%', which pg_trgm GIN indexes serve.
+-- Needs the pg_trgm extension (in PostgreSQL's contrib package).
+
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+
+CREATE INDEX IF NOT EXISTS ix_users_username_trgm
+    ON users USING gin (lower(username) gin_trgm_ops);
+
+CREATE INDEX IF NOT EXISTS ix_users_bio_trgm
+    ON users USING gin (lower(bio) gin_trgm_ops);
+
+CREATE INDEX IF NOT EXISTS ix_users_location_trgm
+    ON users USING gin (lower(location) gin_trgm_ops);
@@ -0,0 +1,12 @@
+-- When each fancy was made, so a user's fancies page a screen at a time
+-- down fancies (user_id, timestamp, message_id) instead of sorting all of
+-- their fancied messages by the messages' timestamps on every page.
+--
+-- Fancies from before this migration all get the time it ran, and so list
+-- newest message first.
+
+ALTER TABLE fancies
+    ADD COLUMN IF NOT EXISTS timestamp TIMESTAMP NOT NULL DEFAULT now();
+
+CREATE INDEX IF NOT EXISTS ix_fancies_user_timestamp
+    ON fancies (user_id, timestamp, message_id);
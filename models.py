@@ -2,11 +2,35 @@
 
 from datetime import datetime
 
-from flask_bcrypt import Bcrypt
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import orm
 
-bcrypt = Bcrypt()
-db = SQLAlchemy()
+from dbpool import InstrumentedQueuePool
+from replicas import RoutingSession
+import passwords
+
+
+class WarblerSQLAlchemy(SQLAlchemy):
+    """SQLAlchemy with our pool class and pre-ping on server databases,
+    and sessions that can read from replicas (see replicas.py)."""
+
+    def create_session(self, options):
+        return orm.sessionmaker(class_=RoutingSession, db=self, **options)
+
+    def apply_driver_hacks(self, app, info, options):
+        super().apply_driver_hacks(app, info, options)
+
+        if info.drivername == 'sqlite':
+            # sqlite uses a static or null pool, which take no sizing
+            for option in ('pool_size', 'max_overflow', 'pool_timeout'):
+                options.pop(option, None)
+        else:
+            options.setdefault('poolclass', InstrumentedQueuePool)
+            options['pool_pre_ping'] = app.config.get(
+                'SQLALCHEMY_POOL_PRE_PING', True)
+
+
+db = WarblerSQLAlchemy()
 
 HEADER_DEFAULT = "/static/images/warbler-hero.jpg"
 PROFILE_DEFAULT = "/static/images/default-pic.png"
@@ -17,8 +41,11 @@ class Follows(db.Model):
 
     __tablename__ = 'follows'
 
-    __table_args__ = (db.CheckConstraint(
-        "user_being_followed_id <> user_following_id"), )
+    __table_args__ = (
+        db.CheckConstraint("user_being_followed_id <> user_following_id"),
+        db.Index("ix_follows_following",
+                 "user_following_id", "user_being_followed_id"),
+    )
 
     user_being_followed_id = db.Column(
         db.Integer,
@@ -36,11 +63,26 @@ class Follows(db.Model):
         return f"<Follow: Followed: {self.user_being_followed_id},  Following: {self.user_following_id}"
 
 
+def follows_exists(follower_id, followed_id):
+    """Does `follower_id` follow `followed_id`? (A primary key lookup.)"""
+
+    return db.session.query(
+        Follows
+        .query
+        .filter(Follows.user_following_id == follower_id,
+                Follows.user_being_followed_id == followed_id)
+        .exists()).scalar()
+
+
 class User(db.Model):
     """User in the system."""
 
     __tablename__ = 'users'
 
+    __table_args__ = (db.Index(
+        "ix_users_deleted", "deleted_at",
+        postgresql_where=db.text("deleted_at IS NOT NULL")), )
+
     id = db.Column(
         db.Integer,
         autoincrement=True,
@@ -82,6 +124,40 @@ class User(db.Model):
         nullable=False,
     )
 
+    # Denormalized counts, kept up to date by counters.py
+    messages_count = db.Column(
+        db.Integer,
+        nullable=False,
+        default=0,
+        server_default="0",
+    )
+
+    following_count = db.Column(
+        db.Integer,
+        nullable=False,
+        default=0,
+        server_default="0",
+    )
+
+    followers_count = db.Column(
+        db.Integer,
+        nullable=False,
+        default=0,
+        server_default="0",
+    )
+
+    fancies_count = db.Column(
+        db.Integer,
+        nullable=False,
+        default=0,
+        server_default="0",
+    )
+
+    # Set when the account is deleted; accounts.py purges it afterwards
+    deleted_at = db.Column(
+        db.DateTime,
+    )
+
     messages = db.relationship('Message')
 
     followers = db.relationship(
@@ -104,16 +180,30 @@ class User(db.Model):
     def is_followed_by(self, other_user):
         """Is this user followed by `other_user`?"""
 
-        found_user_list = [
-            user for user in self.followers if user == other_user]
-        return len(found_user_list) == 1
+        return follows_exists(other_user.id, self.id)
 
     def is_following(self, other_user):
         """Is this user following `other_user`?"""
 
-        found_user_list = [
-            user for user in self.following if user == other_user]
-        return len(found_user_list) == 1
+        return follows_exists(self.id, other_user.id)
+
+    def following_among(self, user_ids):
+        """Which of `user_ids` does this user follow? Returns a set of ids.
+
+        One indexed query, however many users this user follows, so pages
+        listing users can check each one with a set lookup.
+        """
+
+        if not user_ids:
+            return set()
+
+        rows = (db.session
+                .query(Follows.user_being_followed_id)
+                .filter(Follows.user_following_id == self.id,
+                        Follows.user_being_followed_id.in_(user_ids))
+                .all())
+
+        return {row[0] for row in rows}
 
     def count_fancies(self):
         """How many messages has the user fancied"""
@@ -127,7 +217,7 @@ class User(db.Model):
         Hashes password and adds user to system.
         """
 
-        hashed_pwd = bcrypt.generate_password_hash(password).decode('UTF-8')
+        hashed_pwd = passwords.hash_password(password)
 
         user = User(
             username=username,
@@ -148,21 +238,30 @@ class User(db.Model):
         and, if it finds such a user, returns that user object.
 
         If can't find matching user (or if password is wrong), returns False.
+
+        If the stored hash was made with a different bcrypt cost than we use
+        now, it's replaced with a fresh one (commit to keep it).
         """
 
-        user = cls.query.filter_by(username=username).first()
+        user = cls.query.filter_by(username=username, deleted_at=None).first()
 
-        if user:
-            is_auth = bcrypt.check_password_hash(user.password, password)
-            if is_auth:
-                return user
+        if user and user.check_password(password):
+            return user
 
         return False
 
     def check_password(self, password):
-        """Checks if the password arguement is correct for the User instance"""
+        """Checks if the password arguement is correct for the User instance
+
+        Rehashes the password if the bcrypt cost has changed (commit to keep
+        the new hash).
+        """
+
+        is_user = passwords.check_password(self.password, password)
+
+        if is_user and passwords.needs_rehash(self.password):
+            self.password = passwords.hash_password(password)
 
-        is_user = bcrypt.check_password_hash(self.password, password)
         return is_user
 
 
@@ -171,6 +270,9 @@ class Message(db.Model):
 
     __tablename__ = 'messages'
 
+    __table_args__ = (db.Index(
+        "ix_messages_user_timestamp", "user_id", "timestamp", "id"), )
+
     id = db.Column(
         db.Integer,
         autoincrement=True,
@@ -194,6 +296,14 @@ class Message(db.Model):
         nullable=False,
     )
 
+    # Denormalized count, kept up to date by counters.py
+    fancies_count = db.Column(
+        db.Integer,
+        nullable=False,
+        default=0,
+        server_default="0",
+    )
+
     user = db.relationship('User')
 
     fanciers = db.relationship("User",
@@ -215,6 +325,12 @@ class Fancy(db.Model):
 
     __tablename__ = "fancies"
 
+    __table_args__ = (
+        db.Index("ix_fancies_user", "user_id", "message_id"),
+        db.Index("ix_fancies_user_timestamp",
+                 "user_id", "timestamp", "message_id"),
+    )
+
     message_id = db.Column(
         db.Integer,
         db.ForeignKey('messages.id', ondelete="cascade"),
@@ -227,6 +343,122 @@ class Fancy(db.Model):
         primary_key=True,
     )
 
+    # When it was fancied; set by the database, as fancies are inserted
+    # with plain SQL (see fancies.py)
+    timestamp = db.Column(
+        db.DateTime,
+        nullable=False,
+        server_default=db.func.now(),
+    )
+
+
+class TimelineEntry(db.Model):
+    """A message delivered to a user's home timeline (fan-out on write)."""
+
+    __tablename__ = "timeline_entries"
+
+    __table_args__ = (
+        db.Index("ix_timeline_entries_user_timestamp",
+                 "user_id", "timestamp", "message_id"),
+        db.Index("ix_timeline_entries_author", "author_id"),
+    )
+
+    user_id = db.Column(
+        db.Integer,
+        db.ForeignKey('users.id', ondelete="cascade"),
+        primary_key=True,
+    )
+
+    message_id = db.Column(
+        db.Integer,
+        db.ForeignKey('messages.id', ondelete="cascade"),
+        primary_key=True,
+    )
+
+    author_id = db.Column(
+        db.Integer,
+        db.ForeignKey('users.id', ondelete="cascade"),
+        nullable=False,
+    )
+
+    timestamp = db.Column(
+        db.DateTime,
+        nullable=False,
+    )
+
+    def __repr__(self):
+        return f"<TimelineEntry: User: {self.user_id}, Message: {self.message_id}>"
+
+
+class Job(db.Model):
+    """Deferred work for the job worker (see jobs.py)."""
+
+    __tablename__ = "jobs"
+
+    __table_args__ = (db.Index("ix_jobs_status_run_at", "status", "run_at"), )
+
+    id = db.Column(
+        db.Integer,
+        autoincrement=True,
+        primary_key=True,
+    )
+
+    task = db.Column(
+        db.Text,
+        nullable=False,
+    )
+
+    # keyword arguments, as JSON
+    args = db.Column(
+        db.Text,
+        nullable=False,
+    )
+
+    # Idempotency key: a job with the same key is only ever queued once
+    key = db.Column(
+        db.Text,
+        unique=True,
+    )
+
+    # queued, running, done or failed
+    status = db.Column(
+        db.Text,
+        nullable=False,
+        default='queued',
+    )
+
+    attempts = db.Column(
+        db.Integer,
+        nullable=False,
+        default=0,
+    )
+
+    max_attempts = db.Column(
+        db.Integer,
+        nullable=False,
+    )
+
+    run_at = db.Column(
+        db.DateTime,
+        nullable=False,
+        default=datetime.utcnow,
+    )
+
+    locked_at = db.Column(
+        db.DateTime,
+    )
+
+    finished_at = db.Column(
+        db.DateTime,
+    )
+
+    last_error = db.Column(
+        db.Text,
+    )
+
+    def __repr__(self):
+        return f"<Job #{self.id}: {self.task} ({self.status})>"
+
 
 def connect_db(app):
     """Connect this database to provided Flask app.
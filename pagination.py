@@ -0,0 +1,102 @@
+"""Keyset (cursor) pagination for Warbler's message lists.
+
+Pages are ordered newest first on (timestamp, id). Instead of an OFFSET,
+each page carries a cursor naming the last row shown, and the next page
+starts strictly below it -- so page 500 costs the same index seek as page 1.
+"""
+
+from collections import namedtuple
+from datetime import datetime
+
+from flask import abort, current_app, request
+from sqlalchemy import tuple_
+
+CURSOR_FORMAT = "%Y%m%d%H%M%S%f"
+
+DEFAULT_PAGE_SIZE = 20
+
+Page = namedtuple('Page', ['items', 'next_cursor'])
+
+
+def encode_cursor(timestamp, id):
+    """Cursor string pointing just after the row (`timestamp`, `id`)."""
+
+    return f"{timestamp.strftime(CURSOR_FORMAT)}-{id}"
+
+
+def decode_cursor(cursor):
+    """Turn a cursor string back into a (timestamp, id) tuple.
+
+    Raises ValueError for anything that isn't a cursor we made.
+    """
+
+    timestamp, id = cursor.split('-')
+    return datetime.strptime(timestamp, CURSOR_FORMAT), int(id)
+
+
+def cursor_from_request():
+    """The (timestamp, id) cursor in ?before=, or None for the first page.
+
+    Aborts with a 400 if the cursor is malformed.
+    """
+
+    before = request.args.get('before')
+
+    if not before:
+        return None
+
+    try:
+        return decode_cursor(before)
+    except ValueError:
+        abort(400)
+
+
+def page_size():
+    """How many messages to send per page."""
+
+    return current_app.config.get('FEED_PAGE_SIZE', DEFAULT_PAGE_SIZE)
+
+
+def keyset(query, timestamp_col, id_col, cursor, per_page):
+    """Limit `query` to the page of rows just below `cursor`.
+
+    One extra row is fetched so we know whether there's an older page.
+    """
+
+    if cursor:
+        query = query.filter(tuple_(timestamp_col, id_col) < tuple_(*cursor))
+
+    return (query
+            .order_by(timestamp_col.desc(), id_col.desc())
+            .limit(per_page + 1))
+
+
+def message_key(message):
+    """The (timestamp, id) a message's cursor is made from."""
+
+    return message.timestamp, message.id
+
+
+def make_page(messages, per_page, key=message_key):
+    """Build a Page from up to `per_page` + 1 messages, newest first.
+
+    `key` gives the (timestamp, id) the page is ordered on for a row, for
+    pages ordered on something other than the messages' own.
+    """
+
+    if len(messages) <= per_page:
+        return Page(messages, None)
+
+    messages = messages[:per_page]
+
+    return Page(messages, encode_cursor(*key(messages[-1])))
+
+
+def paginate(query, timestamp_col, id_col, cursor=None, per_page=None,
+             key=message_key):
+    """Fetch one page of messages from `query`."""
+
+    per_page = per_page or page_size()
+
+    messages = keyset(query, timestamp_col, id_col, cursor, per_page).all()
+    return make_page(messages, per_page, key)
@@ -0,0 +1,183 @@
+"""Password hashing and checking, off the request thread.
+
+bcrypt is deliberately slow: at cost 12 a single hash or check takes a few
+hundred milliseconds of CPU. Rather than burn that on the thread serving
+the request, the work goes to a small process pool
+(PASSWORD_HASH_WORKERS processes per app process; 0 runs it inline).
+
+At most PASSWORD_QUEUE_LIMIT hashes may be queued or running at once. A
+request that can't get a slot within PASSWORD_QUEUE_TIMEOUT seconds raises
+PasswordQueueFull, which the app turns into a 503 -- so a login burst sheds
+load quickly instead of stalling every other route.
+
+The cost comes from BCRYPT_LOG_ROUNDS. When it changes, existing hashes are
+upgraded (or downgraded) the next time their owner logs in.
+
+The pool only helps a process that serves several requests at once (gevent
+or threaded workers): requests waiting on bcrypt let the others run, and
+the queue limit sheds the excess. A sync worker serves one request at a
+time, so it can never fill the queue, and extra bcrypt processes would only
+compete for the same cores. So PASSWORD_HASH_WORKERS defaults to 0 (inline)
+unless WARBLER_WORKER is 'gevent'. Each app process has its own pool, so
+keep WEB_CONCURRENCY x PASSWORD_HASH_WORKERS within the cores available.
+"""
+
+import multiprocessing
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import bcrypt
+from flask import current_app, has_app_context
+
+DEFAULT_ROUNDS = 12
+DEFAULT_QUEUE_LIMIT = 16
+DEFAULT_QUEUE_TIMEOUT = 2
+
+
+class PasswordQueueFull(Exception):
+    """Too many password hashes are already waiting."""
+
+
+def _hash(password, rounds):
+    return bcrypt.hashpw(password, bcrypt.gensalt(rounds)).decode('UTF-8')
+
+
+def _check(hashed, password):
+    return bcrypt.checkpw(password, hashed)
+
+
+class PasswordPool:
+    """Bounded pool of processes running bcrypt."""
+
+    def __init__(self, workers, queue_limit, queue_timeout):
+        self.workers = workers
+        self.queue_limit = queue_limit
+        self.queue_timeout = queue_timeout
+
+        self._slots = threading.BoundedSemaphore(queue_limit)
+        self._executor = None
+        self._lock = threading.Lock()
+
+        self.in_flight = 0
+        self.completed = 0
+        self.rejected = 0
+        self.wait_seconds = 0.0
+
+    def executor(self):
+        # Created on first use, so each gunicorn worker gets its own pool
+        # after forking. 'spawn' keeps the children clear of the parent's
+        # threads and database sockets.
+        with self._lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(
+                    self.workers,
+                    mp_context=multiprocessing.get_context('spawn'))
+            return self._executor
+
+    def run(self, fn, *args):
+        """Run `fn(*args)` in the pool and wait for the result."""
+
+        start = time.monotonic()
+
+        if not self._slots.acquire(timeout=self.queue_timeout):
+            with self._lock:
+                self.rejected += 1
+            raise PasswordQueueFull()
+
+        with self._lock:
+            self.in_flight += 1
+
+        try:
+            if self.workers:
+                result = self.executor().submit(fn, *args).result()
+            else:
+                result = fn(*args)
+        finally:
+            self._slots.release()
+
+            with self._lock:
+                self.in_flight -= 1
+
+        with self._lock:
+            self.completed += 1
+            self.wait_seconds += time.monotonic() - start
+
+        return result
+
+    def stats(self):
+        """Queue depth and throughput numbers for monitoring."""
+
+        return {
+            'workers': self.workers,
+            'queue_limit': self.queue_limit,
+            'in_flight': self.in_flight,
+            'completed': self.completed,
+            'rejected': self.rejected,
+            'wait_seconds': self.wait_seconds,
+        }
+
+    def shutdown(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown()
+                self._executor = None
+
+
+def init_passwords(app):
+    """Create the password pool configured for `app`."""
+
+    pool = PasswordPool(
+        app.config.get('PASSWORD_HASH_WORKERS', 0),
+        app.config.get('PASSWORD_QUEUE_LIMIT', DEFAULT_QUEUE_LIMIT),
+        app.config.get('PASSWORD_QUEUE_TIMEOUT', DEFAULT_QUEUE_TIMEOUT))
+
+    app.extensions['warbler_passwords'] = pool
+    return pool
+
+
+# used outside an app (scripts, the shell): hashes inline
+_inline_pool = PasswordPool(0, DEFAULT_QUEUE_LIMIT, None)
+
+
+def get_pool():
+    """The password pool for the current app."""
+
+    if not has_app_context():
+        return _inline_pool
+
+    return current_app.extensions['warbler_passwords']
+
+
+def rounds():
+    """bcrypt cost for new hashes."""
+
+    if not has_app_context():
+        return DEFAULT_ROUNDS
+
+    return current_app.config.get('BCRYPT_LOG_ROUNDS', DEFAULT_ROUNDS)
+
+
+def hash_password(password):
+    """bcrypt hash (as a str) of `password`."""
+
+    return get_pool().run(_hash, password.encode('UTF-8'), rounds())
+
+
+def check_password(hashed, password):
+    """Does `password` match the bcrypt hash `hashed`?"""
+
+    return get_pool().run(_check, hashed.encode('UTF-8'),
+                          password.encode('UTF-8'))
+
+
+def needs_rehash(hashed):
+    """Was `hashed` made with a different cost than we use now?"""
+
+    # bcrypt hashes look like $2b$12$<salt+hash>
+    try:
+        cost = int(hashed.split('$')[2])
+    except (IndexError, ValueError):
+        return True
+
+    return cost != rounds()
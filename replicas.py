@@ -0,0 +1,106 @@
+"""Sending read-only views to database replicas.
+
+Replicas are listed in DATABASE_REPLICA_URLS (comma-separated) and become
+the SQLAlchemy binds named in DB_REPLICAS. Views decorated with
+`@read_only` run their queries against one replica, picked at random per
+request; everything else, and anything flushed, goes to the primary.
+
+Replicas lag the primary a little, so after a visitor writes (any request
+that isn't GET/HEAD/OPTIONS) their session cookie remembers when, and
+their reads stay on the primary for REPLICA_STICKY_SECONDS: they see their
+own new message or follow straight away.
+"""
+
+import random
+import time
+from functools import wraps
+
+from flask import current_app, g, has_request_context, request, session
+from flask_sqlalchemy import SignallingSession, get_state
+
+WROTE_AT_KEY = "db_wrote_at"
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+
+def read_only(f):
+    """Mark a view as safe to serve from a replica."""
+
+    @wraps(f)
+    def wrapped(*args, **kwargs):
+        return f(*args, **kwargs)
+
+    wrapped.read_only = True
+    return wrapped
+
+
+def is_sticky():
+    """Did this visitor write recently enough to need the primary?"""
+
+    wrote_at = session.get(WROTE_AT_KEY)
+
+    window = current_app.config.get('REPLICA_STICKY_SECONDS', 0)
+
+    return wrote_at is not None and time.time() - wrote_at < window
+
+
+def choose_replica():
+    """Pick the replica bind (or None) for this request's reads."""
+
+    g.db_replica = None
+
+    replicas = current_app.config.get('DB_REPLICAS')
+    view = current_app.view_functions.get(request.endpoint)
+
+    if (replicas and request.method in SAFE_METHODS and
+            getattr(view, 'read_only', False) and not is_sticky()):
+        g.db_replica = random.choice(replicas)
+
+
+def remember_write(response):
+    """Keep this visitor's reads on the primary for a while after a write."""
+
+    if (request.method not in SAFE_METHODS and
+            current_app.config.get('DB_REPLICAS')):
+        session[WROTE_AT_KEY] = time.time()
+
+    return response
+
+
+def current_replica():
+    """Name of the replica bind reads should use right now, or None."""
+
+    if not has_request_context():
+        return None
+
+    return g.get('db_replica')
+
+
+class RoutingSession(SignallingSession):
+    """Session sending reads to this request's replica, if it has one."""
+
+    def get_bind(self, mapper=None, clause=None):
+        replica = current_replica()
+
+        if replica is not None and not self._flushing:
+            return get_state(self.app).db.get_engine(self.app, bind=replica)
+
+        return super().get_bind(mapper, clause)
+
+
+def init_replicas(app):
+    """Route `app`'s read-only views to its replicas.
+
+    Call before registering other before_request handlers, so that they
+    read from the replica too.
+    """
+
+    app.before_request(choose_replica)
+    app.after_request(remember_write)
+
+
+def replica_binds(urls):
+    """SQLALCHEMY_BINDS entries for a comma-separated list of replica URLs."""
+
+    urls = [url.strip() for url in (urls or "").split(",") if url.strip()]
+
+    return {f"replica{i}": url for i, url in enumerate(urls)}
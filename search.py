@@ -0,0 +1,415 @@
+"""Search backends for Warbler.
+
+`/users?q=` used to run `username LIKE '%q%'`, which can't use an index and
+scans every user. Searches now go through a backend picked by the database
+dialect:
+
+- PostgreSQL: prefix matches use a `text_pattern_ops` index on
+  lower(username); substring matches in username, bio and location use
+  pg_trgm GIN indexes (migrations/0004_user_search_trigrams.sql).
+  Message text has a GIN full-text index on to_tsvector('english', text).
+  Ranking re-parses each message's text, so only the newest
+  SEARCH_MAX_RANKED matches are ranked; older ones aren't returned.
+- SQLite: FTS5 tables over users (trigram tokenizer: username, bio and
+  location) and messages (porter stemming), ranked with bm25. Handy for
+  local testing.
+
+On both, users are matched on username, bio and location, best username
+matches first; terms shorter than MIN_SUBSTRING (too short for trigrams)
+only match username prefixes.
+
+Both kinds of index are maintained by the database in the same transaction
+as the write (GIN indexes on PostgreSQL, triggers on SQLite), so new and
+deleted messages show up in search immediately.
+
+Run `flask init-search` (or `install()`) once to create the indexes, and
+`flask rebuild-search-index` to bulk-(re)index an existing database.
+"""
+
+from collections import namedtuple
+
+from flask import abort, current_app, request
+from sqlalchemy import (Integer, case, cast, column, func, literal_column, or_,
+                        table, text, tuple_)
+
+from models import db, Message, User
+import pagination
+
+DEFAULT_PAGE_SIZE = 24
+
+# Deep search pages are never useful and get steadily more expensive
+MAX_PAGES = 20
+
+# Shortest term matched anywhere in a field, not just a username prefix
+MIN_SUBSTRING = 3
+
+# Most message matches ranked per search (PostgreSQL)
+DEFAULT_MAX_RANKED = 1000
+
+Results = namedtuple('Results', ['items', 'next_page'])
+
+# Message matches are ordered by relevance in this many coarse buckets, then
+# by recency within a bucket. Integer buckets also keep cursors exact.
+RELEVANCE_BUCKETS = 10
+
+POSTGRES_INSTALL = [
+    """CREATE INDEX IF NOT EXISTS ix_users_username_prefix
+       ON users (lower(username) text_pattern_ops)""",
+    """CREATE INDEX IF NOT EXISTS ix_messages_text_fts
+       ON messages USING gin (to_tsvector('english', text))""",
+]
+
+SQLITE_INSTALL = [
+    """CREATE VIRTUAL TABLE IF NOT EXISTS users_fts USING fts5(
+           username, bio, location,
+           content='users', content_rowid='id', tokenize='trigram')""",
+    """CREATE TRIGGER IF NOT EXISTS users_fts_insert AFTER INSERT ON users
+       BEGIN
+           INSERT INTO users_fts (rowid, username, bio, location)
+           VALUES (new.id, new.username, new.bio, new.location);
+       END""",
+    """CREATE TRIGGER IF NOT EXISTS users_fts_delete AFTER DELETE ON users
+       BEGIN
+           INSERT INTO users_fts (users_fts, rowid, username, bio, location)
+           VALUES ('delete', old.id, old.username, old.bio, old.location);
+       END""",
+    """CREATE TRIGGER IF NOT EXISTS users_fts_update AFTER UPDATE ON users
+       BEGIN
+           INSERT INTO users_fts (users_fts, rowid, username, bio, location)
+           VALUES ('delete', old.id, old.username, old.bio, old.location);
+           INSERT INTO users_fts (rowid, username, bio, location)
+           VALUES (new.id, new.username, new.bio, new.location);
+       END""",
+    "INSERT INTO users_fts (users_fts) VALUES ('rebuild')",
+    """CREATE VIRTUAL TABLE IF NOT EXISTS messages_fts USING fts5(
+           text, content='messages', content_rowid='id',
+           tokenize='porter unicode61')""",
+    """CREATE TRIGGER IF NOT EXISTS messages_fts_insert
+       AFTER INSERT ON messages
+       BEGIN
+           INSERT INTO messages_fts (rowid, text) VALUES (new.id, new.text);
+       END""",
+    """CREATE TRIGGER IF NOT EXISTS messages_fts_delete
+       AFTER DELETE ON messages
+       BEGIN
+           INSERT INTO messages_fts (messages_fts, rowid, text)
+           VALUES ('delete', old.id, old.text);
+       END""",
+    """CREATE TRIGGER IF NOT EXISTS messages_fts_update
+       AFTER UPDATE OF text ON messages
+       BEGIN
+           INSERT INTO messages_fts (messages_fts, rowid, text)
+           VALUES ('delete', old.id, old.text);
+           INSERT INTO messages_fts (rowid, text) VALUES (new.id, new.text);
+       END""",
+    "INSERT INTO messages_fts (messages_fts) VALUES ('rebuild')",
+]
+
+POSTGRES_REBUILD = [
+    "SET LOCAL maintenance_work_mem = '256MB'",
+    "REINDEX INDEX ix_messages_text_fts",
+]
+
+SQLITE_REBUILD = [
+    "INSERT INTO users_fts (users_fts) VALUES ('rebuild')",
+    "INSERT INTO messages_fts (messages_fts) VALUES ('rebuild')",
+    "INSERT INTO messages_fts (messages_fts) VALUES ('optimize')",
+]
+
+
+def dialect():
+    """Name of the database dialect we're talking to."""
+
+    return db.engine.dialect.name
+
+
+def page_size():
+    """How many results to show per page."""
+
+    return current_app.config.get('SEARCH_PAGE_SIZE', DEFAULT_PAGE_SIZE)
+
+
+def max_ranked():
+    """How many of the newest message matches to rank."""
+
+    return current_app.config.get('SEARCH_MAX_RANKED', DEFAULT_MAX_RANKED)
+
+
+def escape_like(term):
+    """Escape LIKE wildcards in `term` (using backslash as the escape)."""
+
+    return (term
+            .replace('\\', '\\\\')
+            .replace('%', '\\%')
+            .replace('_', '\\_'))
+
+
+def install():
+    """Create search indexes for the current database. Safe to re-run."""
+
+    if dialect() == 'postgresql':
+        statements = POSTGRES_INSTALL
+
+    elif dialect() == 'sqlite':
+        statements = SQLITE_INSTALL
+
+    else:
+        statements = []
+
+    for statement in statements:
+        db.session.execute(text(statement))
+
+
+def rebuild():
+    """Rebuild message (and, on SQLite, user) search indexes from scratch.
+
+    Installs any missing indexes first, so this is also the way to
+    bulk-index an existing database.
+    """
+
+    install()
+
+    statements = {'postgresql': POSTGRES_REBUILD,
+                  'sqlite': SQLITE_REBUILD}.get(dialect(), [])
+
+    for statement in statements:
+        db.session.execute(text(statement))
+
+
+def users_in_order(ids):
+    """Load users with `ids`, in that order."""
+
+    users = {user.id: user for user in User.query.filter(User.id.in_(ids))}
+    return [users[id] for id in ids if id in users]
+
+
+def _results(rows, page, per_page):
+    """Build Results from up to `per_page` + 1 rows of (id, ...)."""
+
+    next_page = None
+
+    if len(rows) > per_page:
+        rows = rows[:per_page]
+        if page < MAX_PAGES:
+            next_page = page + 1
+
+    return Results(users_in_order([row[0] for row in rows]), next_page)
+
+
+def _search_users_postgres(term, page, per_page):
+    lowered = func.lower(User.username)
+    term = term.lower()
+
+    prefix = lowered.like(escape_like(term) + '%', escape='\\')
+
+    rank = (case([(lowered == term, 3)], else_=0) +
+            case([(prefix, 2)], else_=0))
+
+    if len(term) < MIN_SUBSTRING:
+        match = prefix
+    else:
+        contains = '%' + escape_like(term) + '%'
+        in_username = lowered.like(contains, escape='\\')
+
+        match = or_(in_username,
+                    func.lower(User.bio).like(contains, escape='\\'),
+                    func.lower(User.location).like(contains, escape='\\'))
+        rank = rank + case([(in_username, 1)], else_=0)
+
+    rows = (db.session
+            .query(User.id)
+            .filter(match, User.deleted_at.is_(None))
+            .order_by(rank.desc(), User.username, User.id)
+            .offset((page - 1) * per_page)
+            .limit(per_page + 1)
+            .all())
+
+    return _results(rows, page, per_page)
+
+
+def _search_users_sqlite(term, page, per_page):
+    offset = (page - 1) * per_page
+
+    # The trigram tokenizer can't match anything shorter than 3 characters
+    if len(term) < MIN_SUBSTRING:
+        rows = db.session.execute(
+            text("""SELECT id FROM users
+                    WHERE username LIKE :prefix ESCAPE '\\'
+                      AND deleted_at IS NULL
+                    ORDER BY username, id
+                    LIMIT :limit OFFSET :offset"""),
+            {'prefix': escape_like(term) + '%',
+             'limit': per_page + 1,
+             'offset': offset}).fetchall()
+
+        return _results(rows, page, per_page)
+
+    phrase = '"' + term.replace('"', '""') + '"'
+
+    rows = db.session.execute(
+        text("""SELECT users_fts.rowid FROM users_fts
+                JOIN users ON users.id = users_fts.rowid
+                WHERE users_fts MATCH :phrase
+                  AND users.deleted_at IS NULL
+                ORDER BY bm25(users_fts, 10.0, 1.0, 1.0), users_fts.rowid
+                LIMIT :limit OFFSET :offset"""),
+        {'phrase': phrase,
+         'limit': per_page + 1,
+         'offset': offset}).fetchall()
+
+    return _results(rows, page, per_page)
+
+
+def search_users(term, page=1, per_page=None):
+    """One page of users matching `term`, best matches first."""
+
+    per_page = per_page or page_size()
+    page = max(1, min(page, MAX_PAGES))
+
+    if dialect() == 'sqlite':
+        return _search_users_sqlite(term, page, per_page)
+
+    return _search_users_postgres(term, page, per_page)
+
+
+def list_users(after_id=None, per_page=None):
+    """One page of all users in id order, starting after `after_id`.
+
+    Returns Results whose `next_page` is the id to continue after.
+    """
+
+    per_page = per_page or page_size()
+
+    query = User.query.filter(User.deleted_at.is_(None))
+
+    if after_id:
+        query = query.filter(User.id > after_id)
+
+    users = query.order_by(User.id).limit(per_page + 1).all()
+
+    if len(users) <= per_page:
+        return Results(users, None)
+
+    users = users[:per_page]
+    return Results(users, users[-1].id)
+
+
+##############################################################################
+# Message search
+
+
+def encode_cursor(score, timestamp, id):
+    """Cursor string pointing just after a search hit."""
+
+    return f"{score}~{pagination.encode_cursor(timestamp, id)}"
+
+
+def decode_cursor(cursor):
+    """Turn a search cursor back into a (score, timestamp, id) tuple.
+
+    Raises ValueError for anything that isn't a cursor we made.
+    """
+
+    score, rest = cursor.split('~')
+    return (int(score), *pagination.decode_cursor(rest))
+
+
+def cursor_from_request():
+    """The search cursor in ?before=, or None. Aborts with 400 if malformed."""
+
+    before = request.args.get('before')
+
+    if not before:
+        return None
+
+    try:
+        return decode_cursor(before)
+    except ValueError:
+        abort(400)
+
+
+def _message_score_postgres(term):
+    """(match clause, relevance bucket) for `term` on PostgreSQL."""
+
+    # The config must be a literal so the planner can use the expression index
+    english = literal_column("'english'")
+    vector = func.to_tsvector(english, Message.text)
+    query = func.plainto_tsquery(english, term)
+
+    # Normalization 32 scales rank into 0..1
+    score = cast(func.ts_rank_cd(vector, query, 32) * RELEVANCE_BUCKETS,
+                 Integer)
+
+    return vector.op('@@')(query), score
+
+
+def _message_score_sqlite(term):
+    """(match clause, relevance bucket) for `term` on SQLite."""
+
+    phrase = ' '.join('"' + word.replace('"', '""') + '"'
+                      for word in term.split())
+
+    fts = table('messages_fts', column('rowid'), column('messages_fts'))
+
+    hits = (db.session
+            .query(fts.c.rowid.label('id'),
+                   func.bm25(literal_column('messages_fts')).label('bm25'))
+            .filter(fts.c.messages_fts.op('MATCH')(phrase))
+            .subquery())
+
+    # bm25 is negative, better matches more so; squash into 0..1 like
+    # PostgreSQL's normalized rank
+    score = cast(-hits.c.bm25 / (1 - hits.c.bm25) * RELEVANCE_BUCKETS,
+                 Integer)
+
+    return hits, score
+
+
+def search_messages(term, cursor=None, per_page=None):
+    """One page of messages matching `term`.
+
+    Best matches come first, newest first among equally good matches.
+    Returns a pagination.Page of (message, score) rows; the page's cursor
+    comes from encode_cursor().
+    """
+
+    per_page = per_page or pagination.page_size()
+
+    if dialect() == 'sqlite':
+        hits, score = _message_score_sqlite(term)
+        query = (db.session
+                 .query(Message, score)
+                 .join(hits, hits.c.id == Message.id))
+    else:
+        match, score = _message_score_postgres(term)
+
+        # the index finds every match cheaply; ranking them all doesn't
+        candidates = (db.session
+                      .query(Message.id)
+                      .filter(match)
+                      .order_by(Message.timestamp.desc(), Message.id.desc())
+                      .limit(max_ranked())
+                      .subquery())
+
+        query = (db.session
+                 .query(Message, score)
+                 .join(candidates, candidates.c.id == Message.id))
+
+    if cursor:
+        query = query.filter(
+            tuple_(score, Message.timestamp, Message.id) < tuple_(*cursor))
+
+    rows = (query
+            .order_by(score.desc(), Message.timestamp.desc(),
+                      Message.id.desc())
+            .limit(per_page + 1)
+            .all())
+
+    if len(rows) <= per_page:
+        return pagination.Page(rows, None)
+
+    rows = rows[:per_page]
+    last, last_score = rows[-1]
+
+    return pagination.Page(
+        rows, encode_cursor(last_score, last.timestamp, last.id))
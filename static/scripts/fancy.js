@@ -0,0 +1,38 @@
+// Fancy and unfancy messages without leaving the page. Without JavaScript
+// the forms still post normally and redirect back.
+
+document.addEventListener('submit', function (evt) {
+  var form = evt.target;
+
+  if (!form.classList.contains('fancy-form') || !window.fetch) return;
+
+  evt.preventDefault();
+
+  var star = form.querySelector('.fancy-star');
+  var count = form.querySelector('.fancy-count');
+
+  // ask for the state we want, so a double click can't undo itself
+  var fancied = !star.classList.contains('fancied');
+
+  fetch(form.action, {
+    method: 'POST',
+    credentials: 'same-origin',
+    headers: {
+      'Accept': 'application/json',
+      'Content-Type': 'application/json'
+    },
+    body: JSON.stringify({fancied: fancied})
+  })
+    .then(function (resp) {
+      if (!resp.ok) throw new Error(resp.status);
+      return resp.json();
+    })
+    .then(function (data) {
+      star.classList.toggle('fancied', data.fancied);
+      star.style.color = data.fancied ? 'coral' : 'grey';
+      count.textContent = data.count;
+    })
+    .catch(function () {
+      form.submit();
+    });
+});
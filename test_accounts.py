@@ -0,0 +1,186 @@
+"""Account deletion tests."""
+
+# run these tests like:
+#
+#    FLASK_ENV=production python -m unittest test_accounts.py
+
+
+import os
+from unittest import TestCase
+
+from models import db, User, Message, Follows, Fancy, TimelineEntry, Job
+
+os.environ['DATABASE_URL'] = "postgresql:///warbler-test"
+
+from app import app, CURR_USER_KEY
+from cache import get_cache
+import accounts
+import counters
+import fancies
+import feeds
+import follows
+import jobs
+import search
+import timeline
+import usercache
+
+db.create_all()
+
+app.config['WTF_CSRF_ENABLED'] = False
+
+
+class AccountDeletionTestCase(TestCase):
+    """Test soft deletion and purging of accounts."""
+
+    def setUp(self):
+        Job.query.delete()
+        TimelineEntry.query.delete()
+        User.query.delete()
+        Message.query.delete()
+        Follows.query.delete()
+        Fancy.query.delete()
+
+        users = [User(username=f"user{i}", email=f"user{i}@test.com",
+                      password="x") for i in range(3)]
+        db.session.add_all(users)
+        db.session.commit()
+
+        self.gone_id, self.friend_id, self.fan_id = [u.id for u in users]
+
+        messages = [Message(text=f"Warble {i}", user_id=self.gone_id)
+                    for i in range(5)]
+        friend_message = Message(text="Hi", user_id=self.friend_id)
+        db.session.add_all(messages + [friend_message])
+        db.session.commit()
+
+        self.friend_message_id = friend_message.id
+        self.gone_message_id = messages[0].id
+
+        with app.app_context():
+            follows.follow(self.gone_id, [self.friend_id])
+            follows.follow(self.friend_id, [self.gone_id])
+            follows.follow(self.fan_id, [self.gone_id])
+            fancies.set_fancied(self.gone_id, friend_message.id, True)
+            for msg in messages:
+                fancies.set_fancied(self.fan_id, msg.id, True)
+                fancies.set_fancied(self.friend_id, msg.id, True)
+            counters.reconcile()
+            timeline.rebuild()
+            # rebuild() already backfilled the follows above
+            Job.query.delete()
+            db.session.commit()
+
+        self.batch_size = app.config['PURGE_BATCH_SIZE']
+        app.config['PURGE_BATCH_SIZE'] = 2
+
+    def tearDown(self):
+        app.config['PURGE_BATCH_SIZE'] = self.batch_size
+        db.session.rollback()
+
+        # test_bulkload restarts id sequences, so later tests can reuse
+        # these users' ids
+        usercache._deleted = {}
+
+    def counts(self, user_id):
+        user = User.query.get(user_id)
+        return (user.messages_count, user.following_count,
+                user.followers_count, user.fancies_count)
+
+    def test_purge(self):
+        with app.app_context():
+            accounts.soft_delete(User.query.get(self.gone_id))
+            db.session.commit()
+
+            status = accounts.status(self.gone_id)
+            self.assertEqual(status['status'], 'deleting')
+            self.assertEqual(status['remaining'], {
+                'messages': 5, 'following': 1, 'followers': 2, 'fancies': 1})
+
+            # one small batch at a time: 6 timeline entries (5 own, 1
+            # followed) down to 4
+            self.assertTrue(accounts.purge_step(self.gone_id))
+            self.assertEqual(
+                TimelineEntry.query.filter_by(user_id=self.gone_id).count(),
+                4)
+
+            accounts.purge(self.gone_id)
+            db.session.expire_all()
+
+            self.assertEqual(accounts.status(self.gone_id),
+                             {'user_id': self.gone_id, 'status': 'deleted'})
+            self.assertEqual(Message.query.count(), 1)
+            self.assertEqual(Follows.query.count(), 0)
+            self.assertEqual(Fancy.query.count(), 0)
+            self.assertEqual(TimelineEntry.query.filter_by(
+                author_id=self.gone_id).count(), 0)
+
+            self.assertEqual(self.counts(self.friend_id), (1, 0, 0, 0))
+            self.assertEqual(self.counts(self.fan_id), (0, 0, 0, 0))
+            self.assertEqual(
+                Message.query.get(self.friend_message_id).fancies_count, 0)
+
+    def test_delete_view(self):
+        with app.test_client() as client:
+            with client.session_transaction() as sess:
+                sess[CURR_USER_KEY] = self.gone_id
+
+            resp = client.post("/users/delete")
+            self.assertEqual(resp.status_code, 302)
+
+            # soft-deleted: hidden, and can't be followed
+            self.assertEqual(client.get(f"/users/{self.gone_id}").status_code,
+                             404)
+
+            with app.app_context():
+                self.assertEqual(follows.follow(self.fan_id, [self.gone_id]),
+                                 [])
+
+        with app.app_context():
+            self.assertEqual(jobs.work(burst=True), 1)
+
+        with app.test_client() as client:
+            resp = client.get(f"/internal/deletions/{self.gone_id}")
+
+        self.assertEqual(resp.get_json(),
+                         {'user_id': self.gone_id, 'status': 'deleted'})
+        self.assertEqual(self.counts(self.friend_id), (1, 0, 0, 0))
+
+    def test_deleted_hidden(self):
+        """Are a soft-deleted account and its messages hidden everywhere?"""
+
+        with app.app_context():
+            usercache.load_user(self.gone_id)
+            key = usercache.cache_key(self.gone_id)
+            cached = get_cache().get(key)
+
+            accounts.soft_delete(User.query.get(self.gone_id))
+            db.session.commit()
+
+            self.assertNotIn(self.gone_id,
+                             [u.id for u in search.list_users().items])
+            self.assertEqual(search.search_users("user0").items, [])
+            self.assertEqual(
+                follows.follow_page(self.friend_id, 'followers').items, [])
+
+            messages = search.search_messages("warble").items
+            self.assertEqual(len(messages), 5)
+            self.assertEqual(
+                feeds.load_feed([msg for msg, score in messages], None), [])
+
+            # another worker's cached copy is ignored from its next check
+            get_cache().set(key, cached)
+            app.config['DELETED_CHECK_SECONDS'] = 0
+            try:
+                self.assertIsNone(usercache.load_user(self.gone_id))
+            finally:
+                app.config['DELETED_CHECK_SECONDS'] = 1
+
+        with app.test_client() as client:
+            with client.session_transaction() as sess:
+                sess[CURR_USER_KEY] = self.fan_id
+
+            resp = client.get(f"/messages/{self.gone_message_id}")
+            self.assertEqual(resp.status_code, 404)
+
+            html = client.get("/").get_data(as_text=True)
+            self.assertNotIn("Warble 0", html)
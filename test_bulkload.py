@@ -0,0 +1,149 @@
+"""Bulk CSV loader tests."""
+
+# run these tests like:
+#
+#    FLASK_ENV=production python -m unittest test_bulkload.py
+
+
+import csv
+import os
+import tempfile
+from unittest import TestCase
+
+import psycopg2
+from sqlalchemy import create_engine, inspect, text
+
+from models import db, User, TimelineEntry
+
+os.environ['DATABASE_URL'] = "postgresql:///warbler-test"
+
+from app import app
+import bulkload
+
+db.create_all()
+
+CSVS = {
+    'users.csv': [
+        ['email', 'username', 'image_url', 'password', 'bio',
+         'header_image_url', 'location'],
+        ['a@test.com', 'alice', '/a.png', 'x', 'Hi, "all"', '/h.png', ''],
+        ['b@test.com', 'bob', '/b.png', 'x', '', '/h.png', 'Here'],
+    ],
+    'messages.csv': [
+        ['text', 'timestamp', 'user_id'],
+        ['First, again', '2019-01-01 10:00:00.000000', '1'],
+        ['Second', '2019-01-02 10:00:00.000000', '2'],
+        ['Third', '2019-01-03 10:00:00.000000', '2'],
+    ],
+    'follows.csv': [
+        ['user_being_followed_id', 'user_following_id'],
+        ['1', '2'],
+    ],
+    'fancies.csv': [
+        ['message_id', 'user_id'],
+        ['2', '1'],
+        ['3', '1'],
+    ],
+}
+
+
+class BulkLoadTestCase(TestCase):
+    """Test loading CSVs with COPY (PostgreSQL) and executemany (SQLite)."""
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+
+        for filename, rows in CSVS.items():
+            with open(os.path.join(self.tmpdir.name, filename), 'w',
+                      newline='') as file:
+                csv.writer(file).writerows(rows)
+
+    def tearDown(self):
+        db.session.rollback()
+        self.tmpdir.cleanup()
+
+    def check_loaded(self, engine, loaded):
+        self.assertEqual([(result.table, result.rows) for result in loaded],
+                         [('users', 2), ('messages', 3), ('follows', 1),
+                          ('fancies', 2)])
+
+        with engine.connect() as conn:
+            bio = conn.execute(
+                text("SELECT bio FROM users WHERE username = 'alice'")
+            ).scalar()
+            self.assertEqual(bio, 'Hi, "all"')
+
+            self.assertEqual(conn.execute(text(
+                "SELECT count(*) FROM fancies WHERE user_id = 1")).scalar(), 2)
+
+        indexes = {ix['name'] for ix in inspect(engine).get_indexes('fancies')}
+        self.assertIn("ix_fancies_user", indexes)
+
+    def truncate(self):
+        with db.engine.begin() as conn:
+            conn.execute(text("TRUNCATE users, messages, follows, fancies, "
+                              "timeline_entries RESTART IDENTITY CASCADE"))
+
+    def test_load_postgres(self):
+        self.truncate()
+
+        loaded = bulkload.load_dir(self.tmpdir.name, db.engine,
+                                   chunk_rows=2, report=lambda msg: None)
+        self.check_loaded(db.engine, loaded)
+
+        self.assertEqual(len(inspect(db.engine).get_foreign_keys('fancies')),
+                         2)
+
+        # the sequence moved past the loaded users
+        user = User.signup("carol", "c@test.com", "password", None)
+        db.session.commit()
+        self.assertEqual(user.id, 3)
+
+    def test_import_postgres(self):
+        """Are counters, timelines and search ready after an import?"""
+
+        self.truncate()
+
+        with app.app_context():
+            bulkload.import_dir(self.tmpdir.name, report=lambda msg: None)
+
+            alice = User.query.filter_by(username='alice').one()
+            self.assertEqual((alice.messages_count, alice.followers_count,
+                              alice.fancies_count), (1, 1, 2))
+
+            # bob follows alice: her message, and his own two
+            self.assertEqual(TimelineEntry.query.filter_by(
+                user_id=alice.followers[0].id).count(), 3)
+
+        with db.engine.connect() as conn:
+            indexes = {row[0] for row in conn.execute(text(
+                "SELECT indexname FROM pg_indexes "
+                "WHERE tablename = 'messages'"))}
+
+        self.assertIn("ix_messages_text_fts", indexes)
+
+    def test_failed_load_restores_constraints(self):
+        """Are indexes and foreign keys put back when loading fails?"""
+
+        self.truncate()
+
+        with open(os.path.join(self.tmpdir.name, 'fancies.csv'), 'a',
+                  newline='') as file:
+            csv.writer(file).writerow(['2', '1'])
+
+        with self.assertRaises(psycopg2.IntegrityError):
+            bulkload.load_dir(self.tmpdir.name, db.engine,
+                              report=lambda msg: None)
+
+        inspector = inspect(db.engine)
+        self.assertIn("ix_fancies_user",
+                      {ix['name'] for ix in inspector.get_indexes('fancies')})
+        self.assertEqual(len(inspector.get_foreign_keys('fancies')), 2)
+
+    def test_load_sqlite(self):
+        engine = create_engine("sqlite://")
+        db.Model.metadata.create_all(engine)
+
+        loaded = bulkload.load_dir(self.tmpdir.name, engine,
+                                   chunk_rows=2, report=lambda msg: None)
+        self.check_loaded(engine, loaded)
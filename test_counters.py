@@ -0,0 +1,108 @@
+"""Denormalized counter tests."""
+
+# run these tests like:
+#
+#    FLASK_ENV=production python -m unittest test_counters.py
+
+
+import os
+from unittest import TestCase
+
+from models import db, User, Message, Follows, Fancy
+
+os.environ['DATABASE_URL'] = "postgresql:///warbler-test"
+
+from app import app, CURR_USER_KEY
+import counters
+
+db.create_all()
+
+app.config['WTF_CSRF_ENABLED'] = False
+
+
+class CountersTestCase(TestCase):
+    """Test that counters follow the views that change them."""
+
+    def setUp(self):
+        """Create test client, add sample data."""
+
+        User.query.delete()
+        Message.query.delete()
+        Follows.query.delete()
+        Fancy.query.delete()
+
+        self.client = app.test_client()
+
+        u1 = User(email="test1@test.com", username="testuser1",
+                  password="HASHED_PASSWORD")
+        u2 = User(email="test2@test.com", username="testuser2",
+                  password="HASHED_PASSWORD")
+        db.session.add_all([u1, u2])
+        db.session.commit()
+
+        self.u1_id = u1.id
+        self.u2_id = u2.id
+
+    def tearDown(self):
+        """Clean up failed transactions"""
+
+        db.session.rollback()
+
+    def counts(self, user_id):
+        user = User.query.get(user_id)
+        return (user.messages_count, user.following_count,
+                user.followers_count, user.fancies_count)
+
+    def test_view_counters(self):
+        """Do posting, following, fancying and deleting keep counts right?"""
+
+        with self.client as c:
+            with c.session_transaction() as sess:
+                sess[CURR_USER_KEY] = self.u1_id
+
+            c.post("/messages/new", data={"text": "Hello"})
+            msg_id = Message.query.filter_by(text="Hello").one().id
+
+            with c.session_transaction() as sess:
+                sess[CURR_USER_KEY] = self.u2_id
+
+            c.post(f"/users/follow/{self.u1_id}")
+            c.post(f"/messages/{msg_id}/fancy", headers={"Referer": "/"})
+
+            self.assertEqual(self.counts(self.u1_id), (1, 0, 1, 0))
+            self.assertEqual(self.counts(self.u2_id), (0, 1, 0, 1))
+            self.assertEqual(Message.query.get(msg_id).fancies_count, 1)
+
+            c.post(f"/users/stop-following/{self.u1_id}")
+
+            with c.session_transaction() as sess:
+                sess[CURR_USER_KEY] = self.u1_id
+
+            c.post(f"/messages/{msg_id}/delete")
+
+        self.assertEqual(self.counts(self.u1_id), (0, 0, 0, 0))
+        self.assertEqual(self.counts(self.u2_id), (0, 0, 0, 0))
+
+    def test_reconcile(self):
+        """Does reconciling repair counts that have drifted?"""
+
+        msg = Message(text="Hello", user_id=self.u1_id)
+        db.session.add(msg)
+        db.session.add(Follows(user_following_id=self.u2_id,
+                               user_being_followed_id=self.u1_id))
+        db.session.commit()
+
+        db.session.add(Fancy(user_id=self.u2_id, message_id=msg.id))
+        db.session.commit()
+
+        self.assertEqual(self.counts(self.u1_id), (0, 0, 0, 0))
+
+        fixed = counters.reconcile()
+        db.session.commit()
+
+        self.assertEqual(fixed, 5)
+        self.assertEqual(self.counts(self.u1_id), (1, 0, 1, 0))
+        self.assertEqual(self.counts(self.u2_id), (0, 1, 0, 1))
+        self.assertEqual(msg.fancies_count, 1)
+
+        self.assertEqual(counters.reconcile(), 0)
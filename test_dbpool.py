@@ -0,0 +1,59 @@
+"""Database pool tests."""
+
+# run these tests like:
+#
+#    FLASK_ENV=production python -m unittest test_dbpool.py
+
+
+import os
+from unittest import TestCase
+
+from models import db
+
+os.environ['DATABASE_URL'] = "postgresql:///warbler-test"
+
+from app import app
+import dbpool
+
+db.create_all()
+
+app.config['WTF_CSRF_ENABLED'] = False
+
+
+class PoolSizingTestCase(TestCase):
+    """Test splitting a connection budget between workers."""
+
+    def test_size_for_workers(self):
+        self.assertEqual(dbpool.size_for_workers(100, 4), (18, 7))
+        self.assertEqual(dbpool.size_for_workers(3, 8), (1, 0))
+
+        pool_size, overflow = dbpool.size_for_workers(90, 9)
+        self.assertLessEqual(9 * (pool_size + overflow), 90)
+
+
+class PoolStatsTestCase(TestCase):
+    """Test pool instrumentation and the internal endpoint."""
+
+    def test_counts_checkouts(self):
+        self.assertIsInstance(db.engine.pool, dbpool.InstrumentedQueuePool)
+        before = db.engine.pool.checkouts
+
+        db.engine.execute("SELECT 1")
+        db.engine.execute("SELECT 1")
+
+        stats = dbpool.pool_stats(db.engine)
+        self.assertEqual(stats['checkouts'], before + 2)
+        self.assertEqual(stats['pool_size'],
+                         app.config['SQLALCHEMY_POOL_SIZE'])
+        self.assertGreaterEqual(stats['peak_checked_out'], 1)
+
+    def test_internal_stats(self):
+        with app.test_client() as client:
+            resp = client.get("/internal/stats")
+            self.assertEqual(resp.status_code, 200)
+            self.assertIn('checkouts', resp.json['db'])
+            self.assertIn('in_flight', resp.json['passwords'])
+
+            resp = client.get("/internal/stats",
+                              environ_base={'REMOTE_ADDR': '10.1.2.3'})
+            self.assertEqual(resp.status_code, 404)
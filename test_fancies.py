@@ -0,0 +1,131 @@
+"""Fancy toggle tests."""
+
+# run these tests like:
+#
+#    FLASK_ENV=production python -m unittest test_fancies.py
+
+
+import os
+from unittest import TestCase
+
+from models import db, User, Message, Follows, Fancy
+
+os.environ['DATABASE_URL'] = "postgresql:///warbler-test"
+
+from app import app, CURR_USER_KEY
+import fancies
+
+db.create_all()
+
+app.config['WTF_CSRF_ENABLED'] = False
+
+
+class FancyTestCase(TestCase):
+    """Test fancying and unfancying messages."""
+
+    def setUp(self):
+        User.query.delete()
+        Message.query.delete()
+        Follows.query.delete()
+        Fancy.query.delete()
+
+        author = User(username="author", email="author@test.com",
+                      password="x")
+        fan = User(username="fan", email="fan@test.com", password="x")
+        db.session.add_all([author, fan])
+        db.session.commit()
+
+        msg = Message(text="Fancy this", user_id=author.id)
+        db.session.add(msg)
+        db.session.commit()
+
+        self.fan_id = fan.id
+        self.msg_id = msg.id
+
+    def tearDown(self):
+        db.session.rollback()
+
+    def counts(self):
+        db.session.expire_all()
+        return (User.query.get(self.fan_id).fancies_count,
+                Message.query.get(self.msg_id).fancies_count,
+                Fancy.query.count())
+
+    def test_toggle(self):
+        with app.app_context():
+            state = fancies.set_fancied(self.fan_id, self.msg_id)
+            db.session.commit()
+            self.assertEqual(state, fancies.FancyState(True, 1))
+            self.assertEqual(self.counts(), (1, 1, 1))
+
+            state = fancies.set_fancied(self.fan_id, self.msg_id)
+            db.session.commit()
+            self.assertEqual(state, fancies.FancyState(False, 0))
+            self.assertEqual(self.counts(), (0, 0, 0))
+
+    def test_set_is_idempotent(self):
+        with app.app_context():
+            for _ in range(2):
+                state = fancies.set_fancied(self.fan_id, self.msg_id, True)
+                db.session.commit()
+                self.assertEqual(state, fancies.FancyState(True, 1))
+                self.assertEqual(self.counts(), (1, 1, 1))
+
+            for _ in range(2):
+                state = fancies.set_fancied(self.fan_id, self.msg_id, False)
+                db.session.commit()
+                self.assertEqual(state, fancies.FancyState(False, 0))
+                self.assertEqual(self.counts(), (0, 0, 0))
+
+    def test_missing_message(self):
+        with app.app_context():
+            self.assertIsNone(
+                fancies.set_fancied(self.fan_id, self.msg_id + 1000))
+            self.assertIsNone(
+                fancies.set_fancied(self.fan_id, self.msg_id + 1000, False))
+
+    def test_view_redirects(self):
+        with app.test_client() as client:
+            with client.session_transaction() as sess:
+                sess[CURR_USER_KEY] = self.fan_id
+
+            resp = client.post(f"/messages/{self.msg_id}/fancy",
+                               headers={"Referer": "/users/1"})
+            self.assertEqual(resp.status_code, 302)
+            self.assertTrue(resp.location.endswith("/users/1"))
+
+            # no referrer: back to the message
+            resp = client.post(f"/messages/{self.msg_id}/fancy")
+            self.assertTrue(resp.location.endswith(f"/messages/{self.msg_id}"))
+
+        self.assertEqual(self.counts(), (0, 0, 0))
+
+    def test_view_json(self):
+        with app.test_client() as client:
+            with client.session_transaction() as sess:
+                sess[CURR_USER_KEY] = self.fan_id
+
+            resp = client.post(f"/messages/{self.msg_id}/fancy",
+                               json={"fancied": True})
+            self.assertEqual(resp.status_code, 200)
+            self.assertEqual(resp.get_json(), {"fancied": True, "count": 1})
+
+            # a repeated click doesn't undo it
+            resp = client.post(f"/messages/{self.msg_id}/fancy",
+                               json={"fancied": True})
+            self.assertEqual(resp.get_json(), {"fancied": True, "count": 1})
+
+            resp = client.post(f"/messages/{self.msg_id}/fancy",
+                               data={"fancied": "false"},
+                               headers={"Accept": "application/json"})
+            self.assertEqual(resp.get_json(), {"fancied": False, "count": 0})
+
+            resp = client.post(f"/messages/{self.msg_id}/fancy",
+                               data={"fancied": "maybe"})
+            self.assertEqual(resp.status_code, 400)
+
+            resp = client.post(f"/messages/{self.msg_id + 1000}/fancy",
+                               json={})
+            self.assertEqual(resp.status_code, 404)
+
+        self.assertEqual(self.counts(), (0, 0, 0))
@@ -0,0 +1,130 @@
+"""Batched feed loading tests."""
+
+# run these tests like:
+#
+#    FLASK_ENV=production python -m unittest test_feeds.py
+
+
+import os
+from unittest import TestCase
+
+from sqlalchemy import event
+
+from models import db, User, Message, Follows, Fancy
+
+os.environ['DATABASE_URL'] = "postgresql:///warbler-test"
+
+from app import app, CURR_USER_KEY
+import counters
+import feeds
+
+db.create_all()
+
+app.config['WTF_CSRF_ENABLED'] = False
+
+
+class QueryCounter:
+    """Count statements run against the engine inside a `with` block."""
+
+    def __enter__(self):
+        self.count = 0
+        event.listen(db.engine, 'before_cursor_execute', self.callback)
+        return self
+
+    def __exit__(self, *exc):
+        event.remove(db.engine, 'before_cursor_execute', self.callback)
+
+    def callback(self, *args):
+        self.count += 1
+
+
+class FeedsTestCase(TestCase):
+    """Test loading of authors, fancy counts and fancied flags."""
+
+    def setUp(self):
+        """Create test client, add sample data."""
+
+        User.query.delete()
+        Message.query.delete()
+        Follows.query.delete()
+        Fancy.query.delete()
+
+        self.client = app.test_client()
+
+        self.users = [User(email=f"test{i}@test.com", username=f"testuser{i}",
+                           password="HASHED_PASSWORD") for i in range(3)]
+        db.session.add_all(self.users)
+        db.session.commit()
+
+        self.messages = [Message(text=f"warble-{i}", user_id=user.id)
+                         for i, user in enumerate(self.users * 4)]
+        db.session.add_all(self.messages)
+        db.session.commit()
+
+        viewer = self.users[0]
+        db.session.add_all([
+            Fancy(user_id=viewer.id, message_id=self.messages[1].id),
+            Fancy(user_id=self.users[1].id, message_id=self.messages[1].id),
+            Fancy(user_id=self.users[2].id, message_id=self.messages[2].id),
+        ])
+        counters.reconcile()
+        db.session.commit()
+
+    def tearDown(self):
+        """Clean up failed transactions"""
+
+        db.session.rollback()
+
+    def test_load_feed(self):
+        """Are counts and flags right, in a fixed number of queries?"""
+
+        viewer_id = self.users[0].id
+        db.session.remove()
+
+        viewer = User.query.get(viewer_id)
+        messages = Message.query.all()
+
+        with QueryCounter() as counter:
+            items = feeds.load_feed(messages, viewer)
+            for item in items:
+                item.author.username
+
+        self.assertEqual(counter.count, 2)
+
+        by_text = {item.message.text: item for item in items}
+        self.assertEqual(by_text["warble-1"].fancy_count, 2)
+        self.assertTrue(by_text["warble-1"].fancied)
+        self.assertEqual(by_text["warble-2"].fancy_count, 1)
+        self.assertFalse(by_text["warble-2"].fancied)
+        self.assertEqual(by_text["warble-3"].fancy_count, 0)
+
+    def test_load_message_following(self):
+        """Does a single message know if the viewer follows its author?"""
+
+        viewer, author = self.users[0], self.users[1]
+        db.session.add(Follows(user_following_id=viewer.id,
+                               user_being_followed_id=author.id))
+        db.session.commit()
+
+        item = feeds.load_message(self.messages[1], viewer)
+        self.assertTrue(item.following_author)
+
+        item = feeds.load_message(self.messages[2], viewer)
+        self.assertFalse(item.following_author)
+
+    def test_show_message(self):
+        """Does the single-message page render the card?"""
+
+        viewer_id = self.users[0].id
+        message_id = self.messages[1].id
+
+        with self.client as c:
+            with c.session_transaction() as sess:
+                sess[CURR_USER_KEY] = viewer_id
+
+            resp = c.get(f"/messages/{message_id}")
+            html = resp.get_data(as_text=True)
+
+        self.assertEqual(resp.status_code, 200)
+        self.assertIn("warble-1", html)
+        self.assertIn("Follow", html)
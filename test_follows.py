@@ -0,0 +1,200 @@
+"""Follow/unfollow tests."""
+
+# run these tests like:
+#
+#    FLASK_ENV=production python -m unittest test_follows.py
+
+
+import os
+from unittest import TestCase
+
+from models import db, User, Message, Follows, Fancy, TimelineEntry, Job
+
+os.environ['DATABASE_URL'] = "postgresql:///warbler-test"
+
+from app import app, CURR_USER_KEY
+import follows
+import jobs
+
+db.create_all()
+
+app.config['WTF_CSRF_ENABLED'] = False
+
+
+class FollowsTestCase(TestCase):
+    """Test set-based following and unfollowing."""
+
+    def setUp(self):
+        Job.query.delete()
+        TimelineEntry.query.delete()
+        User.query.delete()
+        Message.query.delete()
+        Follows.query.delete()
+        Fancy.query.delete()
+
+        users = [User(username=f"user{i}", email=f"user{i}@test.com",
+                      password="x") for i in range(4)]
+        db.session.add_all(users)
+        db.session.commit()
+
+        self.ids = [user.id for user in users]
+
+        db.session.add(Message(text="Hello", user_id=self.ids[1]))
+        db.session.commit()
+
+    def tearDown(self):
+        db.session.rollback()
+
+    def counts(self, user_id):
+        db.session.expire_all()
+        user = User.query.get(user_id)
+        return user.following_count, user.followers_count
+
+    def test_follow_and_unfollow(self):
+        me, *others = self.ids
+
+        with app.app_context():
+            added = follows.follow(me, others + [me, others[0] + 1000])
+            db.session.commit()
+
+            self.assertEqual(sorted(added), others)
+            self.assertEqual(self.counts(me), (3, 0))
+            self.assertEqual(self.counts(others[0]), (0, 1))
+            # others[0] posted; their message is backfilled by a job
+            self.assertEqual(
+                TimelineEntry.query.filter_by(user_id=me).count(), 0)
+            self.assertEqual(jobs.work(burst=True), 1)
+            self.assertEqual(
+                TimelineEntry.query.filter_by(user_id=me).count(), 1)
+
+            # following again changes nothing
+            self.assertEqual(follows.follow(me, others), [])
+            db.session.commit()
+            self.assertEqual(self.counts(me), (3, 0))
+
+            removed = follows.unfollow(me, [others[0], others[0] + 1000])
+            db.session.commit()
+
+            self.assertEqual(removed, [others[0]])
+            self.assertEqual(self.counts(me), (2, 0))
+            self.assertEqual(self.counts(others[0]), (0, 0))
+            self.assertEqual(
+                TimelineEntry.query.filter_by(user_id=me).count(), 0)
+
+            self.assertEqual(follows.unfollow(me, [others[0]]), [])
+
+    def test_signal(self):
+        me, other = self.ids[:2]
+        seen = []
+
+        def receiver(follower_id, added, removed):
+            seen.append((follower_id, added, removed))
+
+        with follows.follows_changed.connected_to(receiver):
+            with app.app_context():
+                follows.follow(me, [other])
+                follows.follow(me, [other])
+                follows.unfollow(me, [other])
+                db.session.commit()
+
+        self.assertEqual(seen, [(me, [other], []), (me, [], [other])])
+
+    def test_views(self):
+        me, *others = self.ids
+
+        with app.test_client() as client:
+            with client.session_transaction() as sess:
+                sess[CURR_USER_KEY] = me
+
+            resp = client.post(f"/users/follow/{others[0]}")
+            self.assertEqual(resp.status_code, 302)
+
+            resp = client.post(f"/users/follow/{others[0] + 1000}")
+            self.assertEqual(resp.status_code, 404)
+
+            # unfollowing someone who doesn't exist is harmless
+            resp = client.post(f"/users/stop-following/{others[0] + 1000}")
+            self.assertEqual(resp.status_code, 302)
+
+            resp = client.post("/users/follow", json={"ids": others})
+            self.assertEqual(sorted(resp.get_json()["followed"]), others[1:])
+
+            resp = client.post("/users/stop-following",
+                               data={"ids": f"{others[0]},{others[1]}"},
+                               headers={"Accept": "application/json"})
+            self.assertEqual(sorted(resp.get_json()["unfollowed"]),
+                             others[:2])
+
+            resp = client.post("/users/follow", json={"ids": ["x"]})
+            self.assertEqual(resp.status_code, 400)
+
+            # a string isn't a list of ids (it'd be split into digits)
+            resp = client.post("/users/follow", json={"ids": str(others[2])})
+            self.assertEqual(resp.status_code, 400)
+
+        self.assertEqual(self.counts(me), (1, 0))
+
+    def test_follow_page(self):
+        me, *others = self.ids
+
+        with app.app_context():
+            follows.follow(me, others)
+            follows.follow(others[0], [others[2]])
+            db.session.commit()
+
+            page = follows.follow_page(me, 'following', others[0],
+                                       per_page=2)
+            self.assertEqual([entry.user.id for entry in page.items],
+                             others[:2])
+            self.assertEqual([entry.viewer_follows for entry in page.items],
+                             [False, False])
+            self.assertEqual(page.next_cursor, others[1])
+
+            page = follows.follow_page(me, 'following', others[0],
+                                       page.next_cursor, per_page=2)
+            self.assertEqual(page.items, [(User.query.get(others[2]), True)])
+            self.assertIsNone(page.next_cursor)
+
+            page = follows.follow_page(others[2], 'followers', me)
+            self.assertEqual([entry.user.id for entry in page.items],
+                             [me, others[0]])
+            self.assertEqual([entry.viewer_follows for entry in page.items],
+                             [False, True])
+
+    def test_listing_views(self):
+        me, *others = self.ids
+
+        with app.app_context():
+            follows.follow(me, others)
+            db.session.commit()
+
+        app.config['FEED_PAGE_SIZE'] = 2
+
+        try:
+            with app.test_client() as client:
+                with client.session_transaction() as sess:
+                    sess[CURR_USER_KEY] = others[0]
+
+                resp = client.get(f"/users/{me}/following")
+                html = resp.get_data(as_text=True)
+                self.assertIn("@user1", html)
+                self.assertIn("@user2", html)
+                self.assertNotIn("@user3", html)
+                self.assertIn(f"/users/{me}/following?after={others[1]}",
+                              html)
+
+                resp = client.get(f"/users/{me}/following?after={others[1]}",
+                                  headers={"Accept": "application/json"})
+                data = resp.get_json()
+                self.assertEqual([user["username"] for user in data["users"]],
+                                 ["user3"])
+                self.assertIsNone(data["next"])
+
+                resp = client.get(f"/users/{others[0]}/followers",
+                                  headers={"Accept": "application/json"})
+                self.assertEqual(resp.get_json()["users"], [{
+                    "id": me, "username": "user0",
+                    "image_url": User.query.get(me).image_url,
+                    "bio": None, "viewer_follows": False}])
+        finally:
+            app.config['FEED_PAGE_SIZE'] = 20
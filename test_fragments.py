@@ -0,0 +1,100 @@
+"""Message card fragment cache tests."""
+
+# run these tests like:
+#
+#    FLASK_ENV=production python -m unittest test_fragments.py
+
+
+import os
+from unittest import TestCase
+
+from models import db, User, Message, Follows, Fancy
+
+os.environ['DATABASE_URL'] = "postgresql:///warbler-test"
+
+from app import app
+from cache import get_cache
+import feeds
+import fragments
+
+db.create_all()
+
+
+class FragmentsTestCase(TestCase):
+    """Test caching of rendered message cards."""
+
+    def setUp(self):
+        """Create sample data."""
+
+        User.query.delete()
+        Message.query.delete()
+        Follows.query.delete()
+        Fancy.query.delete()
+
+        self.author = User(email="author@test.com", username="author",
+                           password="HASHED_PASSWORD")
+        self.viewer = User(email="viewer@test.com", username="viewer",
+                           password="HASHED_PASSWORD")
+        db.session.add_all([self.author, self.viewer])
+        db.session.commit()
+
+        self.msg = Message(text="<b>Hello</b>", user_id=self.author.id)
+        db.session.add(self.msg)
+        db.session.commit()
+
+        db.session.add(Fancy(user_id=self.viewer.id, message_id=self.msg.id))
+        db.session.commit()
+
+        self.author_id = self.author.id
+        self.viewer_id = self.viewer.id
+        self.msg_id = self.msg.id
+
+    def tearDown(self):
+        """Clean up failed transactions"""
+
+        db.session.rollback()
+
+        with app.app_context():
+            get_cache().clear()
+
+    def card(self, viewer_id):
+        with app.test_request_context():
+            viewer = User.query.get(viewer_id)
+            [item] = feeds.load_feed([Message.query.get(self.msg_id)], viewer)
+            return fragments.message_card(item)
+
+    def test_card_reused_across_viewers(self):
+        """Is the shared part cached, with the star filled in per viewer?"""
+
+        with app.app_context():
+            cache = get_cache()
+            hits = cache.hits
+
+        as_viewer = self.card(self.viewer_id)
+        as_author = self.card(self.author_id)
+
+        self.assertEqual(cache.hits, hits + 1)
+        self.assertIn("color:coral", as_viewer)
+        self.assertIn("color:grey", as_author)
+        self.assertIn("&lt;b&gt;Hello&lt;/b&gt;", as_author)
+        self.assertNotIn("slot:", as_author)
+
+    def test_profile_edit_rerenders(self):
+        """Does a renamed author show up without explicit invalidation?"""
+
+        self.card(self.viewer_id)
+
+        User.query.get(self.author_id).username = "renamed"
+        db.session.commit()
+
+        self.assertIn("@renamed", self.card(self.viewer_id))
+
+    def test_forget_message(self):
+        """Are deleted messages dropped from the cache?"""
+
+        self.card(self.viewer_id)
+
+        with app.app_context():
+            fragments.forget_message(self.msg_id)
+            self.assertIsNone(
+                get_cache().get(fragments.cache_key(self.msg_id, False)))
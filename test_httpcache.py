@@ -0,0 +1,96 @@
+"""HTTP caching tests."""
+
+# run these tests like:
+#
+#    FLASK_ENV=production python -m unittest test_httpcache.py
+
+
+import os
+from unittest import TestCase
+
+from models import db, User, Message, Follows, Fancy
+
+os.environ['DATABASE_URL'] = "postgresql:///warbler-test"
+
+from app import app, CURR_USER_KEY
+import httpcache
+
+db.create_all()
+
+
+class HTTPCacheTestCase(TestCase):
+    """Test cache headers and conditional GETs."""
+
+    def setUp(self):
+        """Create test client, add sample data."""
+
+        User.query.delete()
+        Message.query.delete()
+        Follows.query.delete()
+        Fancy.query.delete()
+
+        self.client = app.test_client()
+
+        user = User(email="test@test.com", username="testuser",
+                    password="HASHED_PASSWORD")
+        db.session.add(user)
+        db.session.commit()
+
+        msg = Message(text="Hello", user_id=user.id)
+        db.session.add(msg)
+        db.session.commit()
+
+        self.user_id = user.id
+        self.msg_id = msg.id
+
+    def tearDown(self):
+        """Clean up failed transactions"""
+
+        db.session.rollback()
+
+    def test_fingerprinted_static(self):
+        """Are fingerprinted static files cached for good?"""
+
+        with app.test_request_context():
+            url = httpcache.static_url('stylesheets/style.css')
+
+        self.assertIn("?v=", url)
+
+        resp = self.client.get(url)
+        self.assertIn("immutable", resp.headers['Cache-Control'])
+
+        resp = self.client.get('/static/stylesheets/style.css')
+        self.assertNotIn("immutable", resp.headers['Cache-Control'])
+
+    def test_conditional_get(self):
+        """Does a matching If-None-Match get a 304, until the page changes?"""
+
+        for url in [f"/messages/{self.msg_id}", f"/users/{self.user_id}"]:
+            resp = self.client.get(url)
+            etag = resp.headers['ETag']
+
+            self.assertEqual(resp.status_code, 200)
+            self.assertEqual(resp.headers['Cache-Control'], httpcache.PUBLIC)
+            self.assertIn("Cookie", resp.headers['Vary'])
+
+            resp = self.client.get(url, headers={"If-None-Match": etag})
+            self.assertEqual(resp.status_code, 304)
+            self.assertEqual(resp.get_data(), b"")
+
+            Message.query.get(self.msg_id).fancies_count += 1
+            db.session.commit()
+
+            resp = self.client.get(url, headers={"If-None-Match": etag})
+            self.assertEqual(resp.status_code, 200)
+
+    def test_logged_in_is_private(self):
+        """Are pages rendered for a logged-in user kept private?"""
+
+        with self.client as c:
+            with c.session_transaction() as sess:
+                sess[CURR_USER_KEY] = self.user_id
+
+            resp = c.get(f"/messages/{self.msg_id}")
+
+        self.assertEqual(resp.headers['Cache-Control'], httpcache.PRIVATE)
+        self.assertNotIn('ETag', resp.headers)
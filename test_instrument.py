@@ -0,0 +1,97 @@
+"""Request instrumentation tests."""
+
+# run these tests like:
+#
+#    FLASK_ENV=production python -m unittest test_instrument.py
+
+
+import os
+from unittest import TestCase
+
+from models import db, User, Message, Follows, Fancy
+
+os.environ['DATABASE_URL'] = "postgresql:///warbler-test"
+
+from app import app
+import instrument
+
+db.create_all()
+
+app.config['WTF_CSRF_ENABLED'] = False
+
+
+class InstrumentTestCase(TestCase):
+    """Test per-request query counts, timings and the endpoint report."""
+
+    def setUp(self):
+        User.query.delete()
+        Message.query.delete()
+        Follows.query.delete()
+        Fancy.query.delete()
+
+        user = User(username="testuser", email="test@test.com", password="x")
+        db.session.add(user)
+        db.session.commit()
+        self.user_id = user.id
+
+        instrument.reset()
+        self.config = dict(app.config)
+        app.config['INSTRUMENT_SAMPLE_RATE'] = 1
+
+    def tearDown(self):
+        app.config.update(self.config)
+        db.session.rollback()
+
+    def test_server_timing(self):
+        with app.test_client() as client:
+            resp = client.get(f"/users/{self.user_id}")
+
+        timing = resp.headers['Server-Timing']
+        self.assertRegex(timing, r'db;dur=[\d.]+;desc="[1-9]\d* queries"')
+        self.assertRegex(timing, r'tpl;dur=[\d.]+')
+
+        report = instrument.report()['users_show']
+        self.assertEqual(report['requests'], 1)
+        self.assertGreater(report['avg_queries'], 0)
+        self.assertGreater(report['avg_template_ms'], 0)
+
+    def test_server_timing_internal_only(self):
+        app.config['INTERNAL_TOKEN'] = "secret"
+
+        with app.test_client() as client:
+            resp = client.get(f"/users/{self.user_id}")
+            self.assertNotIn('Server-Timing', resp.headers)
+
+            resp = client.get(f"/users/{self.user_id}",
+                              headers={'X-Internal-Token': "secret"})
+            self.assertIn('Server-Timing', resp.headers)
+
+        # still counted either way
+        self.assertEqual(instrument.report()['users_show']['requests'], 2)
+
+    def test_slow_statements_have_call_sites(self):
+        app.config['SLOW_QUERY_MS'] = 0
+
+        with app.test_client() as client:
+            client.get(f"/users/{self.user_id}")
+
+        slow = instrument.report()['users_show']['slow_statements']
+        self.assertTrue(slow)
+        self.assertTrue(any(stmt['call_site'].startswith("app.py:")
+                            for stmt in slow))
+
+    def test_sampling(self):
+        app.config['INSTRUMENT_SAMPLE_RATE'] = 0
+
+        with app.test_client() as client:
+            resp = client.get(f"/users/{self.user_id}")
+
+        self.assertNotIn('Server-Timing', resp.headers)
+        self.assertEqual(instrument.report(), {})
+
+    def test_internal_report(self):
+        with app.test_client() as client:
+            client.get(f"/users/{self.user_id}")
+            resp = client.get("/internal/requests")
+
+        self.assertIn('users_show', resp.json['endpoints'])
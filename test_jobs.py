@@ -0,0 +1,186 @@
+"""Job queue tests."""
+
+# run these tests like:
+#
+#    FLASK_ENV=production python -m unittest test_jobs.py
+
+
+import os
+from datetime import datetime, timedelta
+from unittest import TestCase
+
+from models import db, Job
+
+os.environ['DATABASE_URL'] = "postgresql:///warbler-test"
+
+from app import app
+import jobs
+
+db.create_all()
+
+calls = []
+
+
+@jobs.task('test-record')
+def record(value):
+    calls.append(value)
+
+
+@jobs.task('test-fail', max_attempts=2)
+def fail():
+    raise RuntimeError("nope")
+
+
+@jobs.task('test-heartbeat')
+def beat():
+    calls.append(db.session.query(Job.locked_at)
+                 .filter(Job.task == 'test-heartbeat').scalar())
+    jobs.heartbeat()
+
+
+class JobsTestCase(TestCase):
+    """Test queueing and running jobs."""
+
+    def setUp(self):
+        Job.query.delete()
+        db.session.commit()
+        calls.clear()
+
+    def tearDown(self):
+        app.config['JOBS_EAGER'] = False
+        db.session.rollback()
+
+    def test_enqueue_and_run(self):
+        with app.app_context():
+            self.assertIsNotNone(jobs.enqueue('test-record', value=1))
+            jobs.enqueue('test-record', key="once", value=2)
+            # the same key again is ignored
+            self.assertIsNone(jobs.enqueue('test-record', key="once",
+                                           value=3))
+            jobs.enqueue('test-record', delay=60, value=4)
+            db.session.commit()
+
+            self.assertEqual(jobs.work(burst=True), 2)
+            self.assertEqual(calls, [1, 2])
+            self.assertEqual(jobs.stats(),
+                             {'test-record': {'done': 2, 'queued': 1}})
+
+    def test_rolled_back_request_queues_nothing(self):
+        with app.app_context():
+            jobs.enqueue('test-record', value=1)
+            db.session.rollback()
+
+            self.assertEqual(jobs.work(burst=True), 0)
+
+    def test_retries_then_fails(self):
+        app.config['JOB_RETRY_DELAY'] = 0
+
+        try:
+            with app.app_context():
+                job_id = jobs.enqueue('test-fail')
+                db.session.commit()
+
+                self.assertEqual(jobs.work(burst=True), 2)
+
+                job = Job.query.get(job_id)
+                self.assertEqual((job.status, job.attempts), ('failed', 2))
+                self.assertIn("RuntimeError: nope", job.last_error)
+        finally:
+            app.config['JOB_RETRY_DELAY'] = 10
+
+    def test_retry_backs_off(self):
+        with app.app_context():
+            job_id = jobs.enqueue('test-fail')
+            db.session.commit()
+
+            self.assertEqual(jobs.work(burst=True), 1)
+
+            job = Job.query.get(job_id)
+            self.assertEqual(job.status, 'queued')
+            self.assertGreater(job.run_at, datetime.utcnow())
+
+    def test_claims_skip_locked_and_stale_jobs(self):
+        with app.app_context():
+            first = jobs.enqueue('test-record', value=1)
+            second = jobs.enqueue('test-record', value=2)
+            db.session.commit()
+
+            # a job another worker holds a lock on is skipped
+            conn = db.engine.connect()
+            trans = conn.begin()
+            conn.execute("SELECT * FROM jobs WHERE id = %s FOR UPDATE",
+                         first)
+
+            try:
+                self.assertEqual(jobs.claim().id, second)
+            finally:
+                trans.rollback()
+                conn.close()
+
+            self.assertEqual(jobs.claim().id, first)
+            self.assertIsNone(jobs.claim())
+
+            # ... until its worker has been gone for JOB_LOCK_TIMEOUT
+            Job.query.filter_by(id=first).update(
+                {'locked_at': datetime.utcnow() - timedelta(hours=1)})
+            db.session.commit()
+
+            job = jobs.claim()
+            self.assertEqual((job.id, job.attempts), (first, 2))
+
+    def test_stale_job_out_of_attempts_fails(self):
+        """Is a job whose worker died on its last attempt failed, not rerun?"""
+
+        with app.app_context():
+            job_id = jobs.enqueue('test-fail')
+            db.session.commit()
+
+            Job.query.filter_by(id=job_id).update(
+                {'status': 'running', 'attempts': 2,
+                 'locked_at': datetime.utcnow() - timedelta(hours=1)})
+            db.session.commit()
+
+            self.assertIsNone(jobs.claim())
+
+            job = Job.query.get(job_id)
+            self.assertEqual((job.status, job.attempts), ('failed', 2))
+            self.assertIsNotNone(job.finished_at)
+
+    def test_heartbeat(self):
+        """Does heartbeat() renew the running job's lock?"""
+
+        with app.app_context():
+            job_id = jobs.enqueue('test-heartbeat')
+            db.session.commit()
+
+            jobs.work(burst=True)
+
+            job = Job.query.get(job_id)
+            self.assertEqual(job.status, 'done')
+            self.assertGreater(job.locked_at, calls[0])
+
+            # and outside a worker does nothing
+            jobs.heartbeat()
+
+    def test_eager(self):
+        app.config['JOBS_EAGER'] = True
+
+        with app.app_context():
+            jobs.enqueue('test-record', value=1)
+
+            self.assertEqual(calls, [1])
+            self.assertEqual(Job.query.count(), 0)
+
+    def test_prune(self):
+        with app.app_context():
+            jobs.enqueue('test-record', value=1)
+            jobs.enqueue('test-record', value=2)
+            db.session.commit()
+            jobs.work(burst=True)
+
+            Job.query.filter_by(args='{"value": 1}').update(
+                {'finished_at': datetime.utcnow() - timedelta(days=8)})
+
+            self.assertEqual(jobs.prune(7), 1)
+            db.session.commit()
+            self.assertEqual(Job.query.count(), 1)
@@ -0,0 +1,69 @@
+"""Prometheus metrics tests."""
+
+# run these tests like:
+#
+#    FLASK_ENV=production python -m unittest test_metrics.py
+
+
+import os
+from unittest import TestCase
+
+from models import db, User, Message, Follows, Fancy
+
+os.environ['DATABASE_URL'] = "postgresql:///warbler-test"
+
+from app import app
+
+db.create_all()
+
+app.config['WTF_CSRF_ENABLED'] = False
+
+
+class MetricsTestCase(TestCase):
+    """Test the /metrics endpoint."""
+
+    def setUp(self):
+        User.query.delete()
+        Message.query.delete()
+        Follows.query.delete()
+        Fancy.query.delete()
+
+        user = User(username="testuser", email="test@test.com", password="x")
+        db.session.add(user)
+        db.session.commit()
+        self.user_id = user.id
+
+        self.token = app.config['INTERNAL_TOKEN']
+
+    def tearDown(self):
+        app.config['INTERNAL_TOKEN'] = self.token
+        db.session.rollback()
+
+    def test_metrics(self):
+        with app.test_client() as client:
+            client.get(f"/users/{self.user_id}")
+            resp = client.get("/metrics")
+
+        self.assertEqual(resp.status_code, 200)
+        self.assertTrue(resp.content_type.startswith("text/plain"))
+
+        text = resp.get_data(as_text=True)
+        self.assertIn('warbler_request_duration_seconds_count{'
+                      'endpoint="users_show",method="GET"}', text)
+        self.assertIn('warbler_request_queries_bucket{endpoint="users_show"',
+                      text)
+        self.assertIn("warbler_db_pool_checkouts_total", text)
+        self.assertIn("warbler_cache_hits_total", text)
+        self.assertIn("warbler_password_in_flight", text)
+        # the /metrics request itself is still being served
+        self.assertIn("warbler_requests_in_flight 1.0", text)
+
+    def test_needs_token_when_set(self):
+        app.config['INTERNAL_TOKEN'] = "s3cret"
+
+        with app.test_client() as client:
+            self.assertEqual(client.get("/metrics").status_code, 404)
+
+            resp = client.get("/metrics",
+                              headers={'Authorization': "Bearer s3cret"})
+            self.assertEqual(resp.status_code, 200)
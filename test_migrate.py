@@ -0,0 +1,139 @@
+"""Schema migration tests."""
+
+# run these tests like:
+#
+#    FLASK_ENV=production python -m unittest test_migrate.py
+
+
+import os
+from unittest import TestCase, skipUnless
+
+from sqlalchemy import create_engine, inspect, text
+
+from models import db
+
+os.environ['DATABASE_URL'] = "postgresql:///warbler-test"
+
+import app  # noqa: F401 (connects db to the app)
+import migrate
+
+db.create_all()
+
+with db.engine.connect() as conn:
+    HAS_PG_TRGM = bool(conn.execute(text(
+        "SELECT 1 FROM pg_available_extensions WHERE name = 'pg_trgm'"
+    )).scalar())
+
+# the tables as models.py first defined them, before any migration
+BASELINE_SCHEMA = [
+    """CREATE TABLE users (
+        id SERIAL PRIMARY KEY,
+        email TEXT NOT NULL UNIQUE,
+        username TEXT NOT NULL UNIQUE,
+        image_url TEXT,
+        header_image_url TEXT,
+        bio TEXT,
+        location TEXT,
+        password TEXT NOT NULL)""",
+    """CREATE TABLE follows (
+        user_being_followed_id INTEGER
+            REFERENCES users (id) ON DELETE CASCADE,
+        user_following_id INTEGER REFERENCES users (id) ON DELETE CASCADE,
+        PRIMARY KEY (user_being_followed_id, user_following_id),
+        CHECK (user_being_followed_id <> user_following_id))""",
+    """CREATE TABLE messages (
+        id SERIAL PRIMARY KEY,
+        text VARCHAR(140) NOT NULL,
+        timestamp TIMESTAMP NOT NULL,
+        user_id INTEGER NOT NULL REFERENCES users (id) ON DELETE CASCADE)""",
+    """CREATE TABLE fancies (
+        message_id INTEGER REFERENCES messages (id) ON DELETE CASCADE,
+        user_id INTEGER REFERENCES users (id) ON DELETE CASCADE,
+        PRIMARY KEY (message_id, user_id))""",
+]
+
+
+class MigrateTestCase(TestCase):
+    """Test applying numbered SQL migrations."""
+
+    def test_statements(self):
+        [path] = [path for _, name, path in migrate.available()
+                  if name == "hot_query_indexes"]
+
+        self.assertTrue(all(stmt.startswith("CREATE INDEX")
+                            for stmt in migrate.statements(path)))
+
+    @skipUnless(HAS_PG_TRGM, "needs the pg_trgm extension")
+    def test_upgrade_existing_database(self):
+        """Do migrations bring an older database up to date, once?"""
+
+        # a scratch schema in the test database, as it was before migrations
+        engine = create_engine(
+            "postgresql:///warbler-test",
+            connect_args={'options': "-csearch_path=migrate_test"})
+
+        with engine.begin() as conn:
+            conn.execute(text("DROP SCHEMA IF EXISTS migrate_test CASCADE"))
+            conn.execute(text("CREATE SCHEMA migrate_test"))
+
+        try:
+            with engine.begin() as conn:
+                for stmt in BASELINE_SCHEMA:
+                    conn.execute(text(stmt))
+
+                conn.execute(text(
+                    "INSERT INTO users (email, username, password) "
+                    "VALUES ('a@test.com', 'a', 'x'), "
+                    "('b@test.com', 'b', 'x')"))
+                conn.execute(text(
+                    "INSERT INTO follows "
+                    "(user_being_followed_id, user_following_id) "
+                    "SELECT b.id, a.id FROM users a, users b "
+                    "WHERE a.username = 'a' AND b.username = 'b'"))
+
+            self.assertEqual(migrate.upgrade(engine),
+                             ["timelines_and_counters", "hot_query_indexes",
+                              "soft_delete", "jobs", "user_search_trigrams"])
+            self.assertEqual(migrate.upgrade(engine), [])
+
+            inspector = inspect(engine)
+            indexes = {ix['name'] for ix in inspector.get_indexes('messages')}
+            self.assertIn("ix_messages_user_timestamp", indexes)
+            self.assertTrue({"deleted_at", "messages_count", "followers_count"}
+                            <= {col['name'] for col in
+                                inspector.get_columns('users')})
+            self.assertIn("fancies_count", {col['name'] for col in
+                                            inspector.get_columns('messages')})
+            self.assertTrue(engine.has_table("timeline_entries"))
+            self.assertTrue(engine.has_table("jobs"))
+
+            # counters start out right for existing rows
+            with engine.connect() as conn:
+                counts = conn.execute(text(
+                    "SELECT username, following_count, followers_count "
+                    "FROM users ORDER BY username")).fetchall()
+
+            self.assertEqual([tuple(row) for row in counts],
+                             [("a", 1, 0), ("b", 0, 1)])
+
+            # and the models work against the upgraded schema
+            for table in db.Model.metadata.sorted_tables:
+                self.assertTrue(engine.has_table(table.name), table.name)
+                self.assertTrue({col.name for col in table.columns}
+                                <= {col['name'] for col in
+                                    inspector.get_columns(table.name)},
+                                table.name)
+        finally:
+            with engine.begin() as conn:
+                conn.execute(text("DROP SCHEMA migrate_test CASCADE"))
+            engine.dispose()
+
+    @skipUnless(HAS_PG_TRGM, "needs the pg_trgm extension")
+    def test_upgrade_fresh_database(self):
+        """Are migrations safe against a database built by create_all?"""
+
+        with db.engine.begin() as conn:
+            migrate.applied(conn)
+            conn.execute(text("DELETE FROM schema_migrations"))
+
+        self.assertIn("hot_query_indexes", migrate.upgrade(db.engine))
@@ -0,0 +1,138 @@
+"""Keyset pagination tests."""
+
+# run these tests like:
+#
+#    FLASK_ENV=production python -m unittest test_pagination.py
+
+
+import os
+import re
+from datetime import datetime, timedelta
+from unittest import TestCase
+
+from models import db, User, Message, Follows, Fancy
+
+os.environ['DATABASE_URL'] = "postgresql:///warbler-test"
+
+from app import app, CURR_USER_KEY
+import pagination
+
+db.create_all()
+
+app.config['WTF_CSRF_ENABLED'] = False
+
+
+class PaginationTestCase(TestCase):
+    """Test cursor pagination of message lists."""
+
+    def setUp(self):
+        """Create test client, add sample data."""
+
+        User.query.delete()
+        Message.query.delete()
+        Follows.query.delete()
+        Fancy.query.delete()
+
+        self.client = app.test_client()
+
+        user = User(email="test@test.com", username="testuser",
+                    password="HASHED_PASSWORD")
+        db.session.add(user)
+        db.session.commit()
+        self.user_id = user.id
+
+        # Five messages a minute apart, plus two sharing a timestamp so
+        # the id tie-breaker gets exercised.
+        start = datetime(2020, 1, 1)
+        for i in range(5):
+            db.session.add(Message(text=f"warble-{i}", user_id=self.user_id,
+                                   timestamp=start + timedelta(minutes=i)))
+        db.session.add(Message(text="warble-tie", user_id=self.user_id,
+                               timestamp=start))
+        db.session.commit()
+
+        app.config['FEED_PAGE_SIZE'] = 2
+
+    def tearDown(self):
+        """Clean up failed transactions"""
+
+        db.session.rollback()
+        app.config['FEED_PAGE_SIZE'] = 20
+
+    def test_cursor_round_trip(self):
+        """Does a cursor decode back to what was encoded?"""
+
+        stamp = datetime(2020, 1, 2, 3, 4, 5, 678)
+        cursor = pagination.encode_cursor(stamp, 42)
+
+        self.assertEqual(pagination.decode_cursor(cursor), (stamp, 42))
+
+        with self.assertRaises(ValueError):
+            pagination.decode_cursor("nonsense")
+
+    def test_pages_cover_every_message_once(self):
+        """Does following 'before' cursors walk through all messages?"""
+
+        seen = []
+        url = f"/users/{self.user_id}"
+
+        with app.app_context():
+            query = Message.query.filter(Message.user_id == self.user_id)
+            cursor = None
+
+            while True:
+                page = pagination.paginate(query, Message.timestamp,
+                                           Message.id, cursor)
+                seen.extend(msg.text for msg in page.items)
+
+                if not page.next_cursor:
+                    break
+                cursor = pagination.decode_cursor(page.next_cursor)
+
+        self.assertEqual(len(seen), 6)
+        self.assertEqual(len(set(seen)), 6)
+        self.assertEqual(seen[:2], ["warble-4", "warble-3"])
+
+        resp = self.client.get(url)
+        html = resp.get_data(as_text=True)
+
+        self.assertIn("warble-4", html)
+        self.assertNotIn("warble-2", html)
+        self.assertIn("Load older", html)
+
+    def test_bad_cursor(self):
+        """Does a malformed cursor give a 400?"""
+
+        resp = self.client.get(f"/users/{self.user_id}?before=garbage")
+        self.assertEqual(resp.status_code, 400)
+
+    def test_fancies_page_in_fancy_order(self):
+        """Are fancies paged newest fancy first, whatever the messages' age?"""
+
+        messages = Message.query.order_by(Message.timestamp,
+                                          Message.id).all()
+        start = datetime(2021, 1, 1)
+
+        # fancied oldest message last
+        for i, msg in enumerate(reversed(messages)):
+            db.session.add(Fancy(user_id=self.user_id, message_id=msg.id,
+                                 timestamp=start + timedelta(minutes=i)))
+        db.session.commit()
+
+        expected = [msg.text for msg in messages]
+        seen = []
+        url = f"/users/{self.user_id}/fancies"
+
+        with self.client as c:
+            with c.session_transaction() as sess:
+                sess[CURR_USER_KEY] = self.user_id
+
+            while url:
+                html = c.get(url).get_data(as_text=True)
+                seen.extend(sorted((text for text in expected if text in html),
+                                   key=html.index))
+
+                match = re.search(r'href="([^"]*\?before=[^"]*)"', html)
+                url = match and match.group(1).replace("&amp;", "&")
+
+        self.assertEqual(seen, expected)
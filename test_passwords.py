@@ -0,0 +1,121 @@
+"""Password pool tests."""
+
+# run these tests like:
+#
+#    FLASK_ENV=production python -m unittest test_passwords.py
+
+
+import os
+import threading
+from unittest import TestCase
+
+from models import db, User, Message, Follows, Fancy
+
+os.environ['DATABASE_URL'] = "postgresql:///warbler-test"
+
+from app import app
+import passwords
+
+db.create_all()
+
+app.config['WTF_CSRF_ENABLED'] = False
+
+
+class PasswordPoolTestCase(TestCase):
+    """Test the bounded bcrypt pool."""
+
+    def test_hash_and_check(self):
+        pool = passwords.PasswordPool(1, 4, 5)
+        hashed = pool.run(passwords._hash, b"secret", 4)
+
+        try:
+            self.assertTrue(pool.run(passwords._check, hashed.encode(),
+                                     b"secret"))
+            self.assertFalse(pool.run(passwords._check, hashed.encode(),
+                                      b"wrong"))
+        finally:
+            pool.shutdown()
+
+        self.assertTrue(hashed.startswith("$2b$04$"))
+        self.assertEqual(pool.stats()['completed'], 3)
+
+    def test_rejects_when_full(self):
+        pool = passwords.PasswordPool(0, 1, 0.01)
+        started = threading.Event()
+        release = threading.Event()
+
+        def block():
+            started.set()
+            release.wait(5)
+
+        thread = threading.Thread(target=pool.run, args=(block,))
+        thread.start()
+        started.wait(5)
+
+        try:
+            with self.assertRaises(passwords.PasswordQueueFull):
+                pool.run(lambda: None)
+        finally:
+            release.set()
+            thread.join()
+
+        stats = pool.stats()
+        self.assertEqual((stats['rejected'], stats['completed']), (1, 1))
+        self.assertEqual(stats['in_flight'], 0)
+
+
+class PasswordRehashTestCase(TestCase):
+    """Test hashes are upgraded when the bcrypt cost changes."""
+
+    def setUp(self):
+        User.query.delete()
+        Message.query.delete()
+        Follows.query.delete()
+        Fancy.query.delete()
+
+        self.rounds = app.config['BCRYPT_LOG_ROUNDS']
+
+    def tearDown(self):
+        app.config['BCRYPT_LOG_ROUNDS'] = self.rounds
+        db.session.rollback()
+
+    def test_rehash_on_login(self):
+        with app.app_context():
+            app.config['BCRYPT_LOG_ROUNDS'] = 4
+            User.signup("testuser", "test@test.com", "password", None)
+            db.session.commit()
+
+            app.config['BCRYPT_LOG_ROUNDS'] = 5
+            self.assertFalse(User.authenticate("testuser", "wrong"))
+            user = User.authenticate("testuser", "password")
+
+            self.assertTrue(user)
+            self.assertTrue(user.password.startswith("$2b$05$"))
+            self.assertFalse(passwords.needs_rehash(user.password))
+
+    def test_needs_rehash(self):
+        with app.app_context():
+            app.config['BCRYPT_LOG_ROUNDS'] = 12
+            self.assertFalse(passwords.needs_rehash("$2b$12$abc"))
+            self.assertTrue(passwords.needs_rehash("$2b$10$abc"))
+            self.assertTrue(passwords.needs_rehash("not a hash"))
+
+    def test_busy_login_is_503(self):
+        User.signup("testuser", "test@test.com", "password", None)
+        db.session.commit()
+
+        pool = app.extensions['warbler_passwords']
+        old = pool._slots, pool.queue_timeout
+        pool._slots = threading.BoundedSemaphore(1)
+        pool._slots.acquire()
+        pool.queue_timeout = 0.01
+
+        try:
+            with app.test_client() as client:
+                resp = client.post("/login", data={"username": "testuser",
+                                                   "password": "password"})
+        finally:
+            pool._slots, pool.queue_timeout = old
+
+        self.assertEqual(resp.status_code, 503)
+        self.assertEqual(resp.headers['Retry-After'], '1')
@@ -0,0 +1,128 @@
+"""Read-replica routing tests."""
+
+# run these tests like:
+#
+#    FLASK_ENV=production python -m unittest test_replicas.py
+
+
+import os
+import tempfile
+import time
+from unittest import TestCase
+
+from models import db, User, Message, Follows, Fancy
+
+os.environ['DATABASE_URL'] = "postgresql:///warbler-test"
+
+from app import app, CURR_USER_KEY
+from cache import get_cache
+import replicas
+
+db.create_all()
+
+app.config['WTF_CSRF_ENABLED'] = False
+
+
+class ReplicaRoutingTestCase(TestCase):
+    """Test read-only views go to a replica (a SQLite stand-in here) and
+    writes go to the primary."""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.tmpdir = tempfile.TemporaryDirectory()
+        cls.old_binds = app.config['SQLALCHEMY_BINDS']
+
+        app.config['SQLALCHEMY_BINDS'] = {
+            'replica0': f"sqlite:///{cls.tmpdir.name}/replica.db"}
+        app.config['DB_REPLICAS'] = ['replica0']
+
+        cls.replica = db.get_engine(app, bind='replica0')
+        db.Model.metadata.create_all(cls.replica)
+
+    @classmethod
+    def tearDownClass(cls):
+        app.config['SQLALCHEMY_BINDS'] = cls.old_binds
+        app.config['DB_REPLICAS'] = list(cls.old_binds)
+        db.session.remove()
+        cls.replica.dispose()
+        cls.tmpdir.cleanup()
+
+    def setUp(self):
+        User.query.delete()
+        Message.query.delete()
+        Follows.query.delete()
+        Fancy.query.delete()
+
+        user = User(username="onprimary", email="p@test.com", password="x")
+        db.session.add(user)
+        db.session.commit()
+        self.user_id = user.id
+
+        # the "replica" has the same user under another name, so each
+        # response shows which database it was read from
+        with self.replica.begin() as conn:
+            conn.execute(Message.__table__.delete())
+            conn.execute(User.__table__.delete())
+            conn.execute(User.__table__.insert(),
+                         id=self.user_id, username="onreplica",
+                         email="r@test.com", password="x")
+
+        self.client = app.test_client()
+
+    def tearDown(self):
+        db.session.rollback()
+
+        with app.app_context():
+            get_cache().clear()
+
+    def test_read_only_view_uses_replica(self):
+        resp = self.client.get(f"/users/{self.user_id}")
+
+        self.assertIn("@onreplica", str(resp.data))
+        self.assertNotIn("@onprimary", str(resp.data))
+
+    def test_other_views_use_primary(self):
+        with self.client as c:
+            with c.session_transaction() as sess:
+                sess[CURR_USER_KEY] = self.user_id
+
+            resp = c.get("/users/profile")
+            self.assertIn("onprimary", str(resp.data))
+
+    def test_writes_go_to_primary_and_stick(self):
+        with self.client as c:
+            with c.session_transaction() as sess:
+                sess[CURR_USER_KEY] = self.user_id
+
+            c.post("/messages/new", data={"text": "Hello"})
+
+            with c.session_transaction() as sess:
+                self.assertIn(replicas.WROTE_AT_KEY, sess)
+
+            # read-your-writes: the profile comes from the primary for now
+            resp = c.get(f"/users/{self.user_id}")
+            self.assertIn("@onprimary", str(resp.data))
+            self.assertIn("Hello", str(resp.data))
+
+            with c.session_transaction() as sess:
+                sess[replicas.WROTE_AT_KEY] = time.time() - 60
+
+            # the replica hasn't caught up with the new message
+            resp = c.get(f"/users/{self.user_id}")
+            self.assertNotIn("Hello", str(resp.data))
+
+        self.assertEqual(Message.query.filter_by(text="Hello").count(), 1)
+
+        with self.replica.connect() as conn:
+            count = conn.execute(Message.__table__.count()).scalar()
+        self.assertEqual(count, 0)
+
+
+class ReplicaBindsTestCase(TestCase):
+    """Test reading replica URLs from the environment."""
+
+    def test_replica_binds(self):
+        self.assertEqual(replicas.replica_binds(None), {})
+        self.assertEqual(
+            replicas.replica_binds("postgresql://a/w, postgresql://b/w"),
+            {'replica0': "postgresql://a/w", 'replica1': "postgresql://b/w"})
@@ -0,0 +1,285 @@
+"""Search tests."""
+
+# run these tests like:
+#
+#    FLASK_ENV=production python -m unittest test_search.py
+
+
+import os
+from datetime import datetime, timedelta
+from unittest import TestCase
+
+from flask import Flask
+
+from models import db, User, Message, Follows, Fancy
+
+os.environ['DATABASE_URL'] = "postgresql:///warbler-test"
+
+from app import app
+import search
+
+db.create_all()
+
+with app.app_context():
+    search.install()
+    db.session.commit()
+
+
+def make_users(*usernames, bio=None):
+    for username in usernames:
+        db.session.add(User(email=f"{username}@test.com", username=username,
+                            password="HASHED_PASSWORD", bio=bio))
+    db.session.commit()
+
+
+class UserSearchTestCase(TestCase):
+    """Test user search against the app's database."""
+
+    def setUp(self):
+        """Create test client, add sample data."""
+
+        User.query.delete()
+        Message.query.delete()
+        Follows.query.delete()
+        Fancy.query.delete()
+
+        self.client = app.test_client()
+
+        make_users("bob", "bobby", "Bobcat", "alice", "robert")
+
+    def tearDown(self):
+        """Clean up failed transactions"""
+
+        db.session.rollback()
+        app.config['SEARCH_PAGE_SIZE'] = search.DEFAULT_PAGE_SIZE
+
+    def test_prefix_ranking(self):
+        """Does an exact match come before other prefix matches?"""
+
+        with app.app_context():
+            results = search.search_users("bob")
+
+        usernames = [user.username for user in results.items]
+
+        self.assertEqual(usernames[0], "bob")
+        self.assertIn("bobby", usernames)
+        self.assertIn("Bobcat", usernames)
+        self.assertNotIn("alice", usernames)
+
+    def test_substrings_in_all_fields(self):
+        """Are substrings of usernames and bios matched, usernames first?"""
+
+        make_users("carol", bio="Birdwatcher and bobsled fan")
+
+        with app.app_context():
+            usernames = [user.username for user in
+                         search.search_users("ber").items]
+            self.assertEqual(usernames, ["robert"])
+
+            usernames = [user.username for user in
+                         search.search_users("bob").items]
+            self.assertEqual(usernames[-1], "carol")
+
+    def test_short_terms(self):
+        """Do terms too short for trigrams match username prefixes only?"""
+
+        with app.app_context():
+            usernames = [user.username for user in
+                         search.search_users("ob").items]
+            self.assertEqual(usernames, [])
+
+            usernames = [user.username for user in
+                         search.search_users("al").items]
+            self.assertEqual(usernames, ["alice"])
+
+    def test_wildcards_are_literal(self):
+        """Are LIKE wildcards in the search term escaped?"""
+
+        with app.app_context():
+            results = search.search_users("%")
+
+        self.assertEqual(results.items, [])
+
+    def test_search_pages(self):
+        """Do search results come one page at a time?"""
+
+        app.config['SEARCH_PAGE_SIZE'] = 2
+
+        resp = self.client.get("/users?q=bob")
+        html = resp.get_data(as_text=True)
+
+        self.assertIn("@bob<", html)
+        self.assertIn("page=2", html)
+
+        resp = self.client.get("/users?q=bob&page=2")
+        html = resp.get_data(as_text=True)
+
+        self.assertNotIn("page=3", html)
+
+    def test_list_all_users(self):
+        """Does the no-query listing page through users by id?"""
+
+        with app.app_context():
+            first = search.list_users(per_page=3)
+            rest = search.list_users(first.next_page, per_page=3)
+
+        self.assertEqual(len(first.items), 3)
+        self.assertEqual(len(rest.items), 2)
+        self.assertIsNone(rest.next_page)
+
+
+class MessageSearchTestCase(TestCase):
+    """Test full-text search over warbles."""
+
+    def setUp(self):
+        """Create test client, add sample data."""
+
+        User.query.delete()
+        Message.query.delete()
+        Follows.query.delete()
+        Fancy.query.delete()
+
+        self.client = app.test_client()
+
+        make_users("bob")
+        user_id = User.query.one().id
+
+        start = datetime(2020, 1, 1)
+        texts = ["Warblers sing at dawn",
+                 "Warbler? Warbler! Warbler song",
+                 "Nothing to see here",
+                 "A warbler, quietly"]
+
+        for i, text in enumerate(texts):
+            db.session.add(Message(text=text, user_id=user_id,
+                                   timestamp=start + timedelta(days=i)))
+        db.session.commit()
+
+    def tearDown(self):
+        """Clean up failed transactions"""
+
+        db.session.rollback()
+
+    def test_ranking(self):
+        """Do the best matches come first, then the newest?"""
+
+        with app.app_context():
+            page = search.search_messages("warbler")
+
+        texts = [msg.text for msg, score in page.items]
+
+        self.assertEqual(texts[0], "Warbler? Warbler! Warbler song")
+        self.assertEqual(texts[1:], ["A warbler, quietly",
+                                     "Warblers sing at dawn"])
+
+    def test_cursor_pages(self):
+        """Do cursors walk through every hit exactly once?"""
+
+        seen = []
+        cursor = None
+
+        with app.app_context():
+            while True:
+                page = search.search_messages("warbler", cursor, per_page=1)
+                seen.extend(msg.text for msg, score in page.items)
+
+                if not page.next_cursor:
+                    break
+                cursor = search.decode_cursor(page.next_cursor)
+
+        self.assertEqual(len(seen), 3)
+        self.assertEqual(len(set(seen)), 3)
+
+    def test_ranks_newest_matches(self):
+        """Are only the newest SEARCH_MAX_RANKED matches ranked?"""
+
+        app.config['SEARCH_MAX_RANKED'] = 2
+
+        try:
+            with app.app_context():
+                page = search.search_messages("warbler")
+        finally:
+            del app.config['SEARCH_MAX_RANKED']
+
+        texts = [msg.text for msg, score in page.items]
+
+        self.assertEqual(texts, ["Warbler? Warbler! Warbler song",
+                                 "A warbler, quietly"])
+
+    def test_search_view(self):
+        """Does the search page show hits and skip misses?"""
+
+        resp = self.client.get("/messages/search?q=warblers")
+        html = resp.get_data(as_text=True)
+
+        self.assertEqual(resp.status_code, 200)
+        self.assertIn("Warblers sing at dawn", html)
+        self.assertNotIn("Nothing to see here", html)
+
+
+class SqliteUserSearchTestCase(TestCase):
+    """Test the SQLite FTS5 backend on a scratch in-memory database."""
+
+    def setUp(self):
+        db.session.remove()
+
+        self.app = Flask(search.__name__)
+        self.app.config['SQLALCHEMY_DATABASE_URI'] = "sqlite://"
+        self.app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+        db.init_app(self.app)
+
+        self.ctx = self.app.app_context()
+        self.ctx.push()
+
+        db.create_all()
+        search.install()
+        make_users("bob", "bobby", "alice", "robert")
+        make_users("carol", bio="Birdwatcher and bobsled fan")
+
+    def tearDown(self):
+        db.session.remove()
+        self.ctx.pop()
+
+    def test_fts_search(self):
+        """Does FTS5 find substrings in usernames and bios, best first?"""
+
+        usernames = [user.username for user in search.search_users("bob").items]
+
+        self.assertEqual(usernames[-1], "carol")
+        self.assertEqual(set(usernames[:2]), {"bob", "bobby"})
+
+        usernames = [user.username for user in search.search_users("ber").items]
+        self.assertEqual(usernames, ["robert"])
+
+    def test_short_terms(self):
+        """Do terms too short for trigrams fall back to prefix matching?"""
+
+        usernames = [user.username for user in search.search_users("al").items]
+        self.assertEqual(usernames, ["alice"])
+
+    def test_fts_follows_updates(self):
+        """Do renamed users get reindexed?"""
+
+        user = User.query.filter_by(username="alice").one()
+        user.username = "alicia"
+        db.session.commit()
+
+        self.assertEqual(search.search_users("alice").items, [])
+        self.assertEqual(search.search_users("alicia").items, [user])
+
+    def test_message_search(self):
+        """Does FTS5 find stemmed matches, and drop deleted messages?"""
+
+        user = User.query.filter_by(username="bob").one()
+        hello = Message(text="Hello warbling world", user_id=user.id)
+        bye = Message(text="Goodbye", user_id=user.id)
+        db.session.add_all([hello, bye])
+        db.session.commit()
+
+        page = search.search_messages("warbles")
+        self.assertEqual([msg for msg, score in page.items], [hello])
+
+        db.session.delete(hello)
+        db.session.commit()
+
+        self.assertEqual(search.search_messages("warbles").items, [])
@@ -0,0 +1,255 @@
+"""Home timeline tests."""
+
+# run these tests like:
+#
+#    FLASK_ENV=production python -m unittest test_timeline.py
+
+
+import os
+from datetime import datetime, timedelta
+from unittest import TestCase
+
+from models import db, User, Message, Follows, Fancy, TimelineEntry, Job
+
+os.environ['DATABASE_URL'] = "postgresql:///warbler-test"
+
+from app import app, CURR_USER_KEY
+import follows
+import jobs
+import pagination
+import timeline
+
+db.create_all()
+
+app.config['WTF_CSRF_ENABLED'] = False
+
+
+class TimelineTestCase(TestCase):
+    """Test fan-out of messages to home timelines."""
+
+    def setUp(self):
+        """Create test client, add sample data."""
+
+        Job.query.delete()
+        TimelineEntry.query.delete()
+        User.query.delete()
+        Message.query.delete()
+        Follows.query.delete()
+        Fancy.query.delete()
+
+        self.client = app.test_client()
+
+        self.author = User(email="author@test.com", username="author",
+                           password="HASHED_PASSWORD")
+        self.reader = User(email="reader@test.com", username="reader",
+                           password="HASHED_PASSWORD")
+
+        db.session.add_all([self.author, self.reader])
+        db.session.commit()
+
+        self.author_id = self.author.id
+        self.reader_id = self.reader.id
+
+        with app.app_context():
+            follows.follow(self.reader_id, [self.author_id])
+            db.session.commit()
+            jobs.work(burst=True)
+
+    def tearDown(self):
+        """Clean up failed transactions"""
+
+        db.session.rollback()
+        app.config['TIMELINE_FANOUT_LIMIT'] = 10000
+        app.config['TIMELINE_BACKFILL_LIMIT'] = 100
+
+    def login(self, c, user_id):
+        with c.session_transaction() as sess:
+            sess[CURR_USER_KEY] = user_id
+
+    def test_new_message_fans_out(self):
+        """Does a new message land on the author's and followers' timelines?"""
+
+        with self.client as c:
+            self.login(c, self.author_id)
+            c.post("/messages/new", data={"text": "Hello"})
+
+        msg_id = Message.query.filter_by(text="Hello").one().id
+        owners = {entry.user_id for entry in
+                  TimelineEntry.query.filter_by(message_id=msg_id)}
+
+        # followers get it once the job has run
+        self.assertEqual(owners, {self.author_id})
+
+        with app.app_context():
+            self.assertEqual(jobs.work(burst=True), 1)
+
+        owners = {entry.user_id for entry in
+                  TimelineEntry.query.filter_by(message_id=msg_id)}
+
+        self.assertEqual(owners, {self.author_id, self.reader_id})
+
+        with self.client as c:
+            self.login(c, self.reader_id)
+            html = c.get("/").get_data(as_text=True)
+
+        self.assertIn("Hello", html)
+
+    def test_unfollow_prunes_timeline(self):
+        """Does unfollowing remove the author's messages from the timeline?"""
+
+        with self.client as c:
+            self.login(c, self.author_id)
+            c.post("/messages/new", data={"text": "Hello"})
+
+        with app.app_context():
+            jobs.work(burst=True)
+
+        with self.client as c:
+            self.login(c, self.reader_id)
+            c.post(f"/users/stop-following/{self.author_id}")
+
+        self.assertEqual(
+            TimelineEntry.query.filter_by(user_id=self.reader_id).count(), 0)
+
+    def test_follow_backfills_timeline(self):
+        """Does following someone pull their recent messages in?"""
+
+        stranger = User(email="stranger@test.com", username="stranger",
+                        password="HASHED_PASSWORD")
+        db.session.add(stranger)
+        db.session.commit()
+
+        stranger_id = stranger.id
+        db.session.add(Message(text="Before you followed", user_id=stranger_id))
+        db.session.commit()
+
+        with self.client as c:
+            self.login(c, self.reader_id)
+            c.post(f"/users/follow/{stranger_id}")
+
+            # the backfill is queued with the follow
+            with app.app_context():
+                self.assertEqual(jobs.work(burst=True), 1)
+
+            html = c.get("/").get_data(as_text=True)
+
+        self.assertIn("Before you followed", html)
+
+    def test_popular_author_read_on_demand(self):
+        """Are messages from authors over the fan-out limit pulled at read time?"""
+
+        app.config['TIMELINE_FANOUT_LIMIT'] = 0
+
+        with self.client as c:
+            self.login(c, self.author_id)
+            c.post("/messages/new", data={"text": "Hello, fans"})
+
+        with app.app_context():
+            jobs.work(burst=True)
+
+        self.assertEqual(
+            TimelineEntry.query.filter_by(user_id=self.reader_id).count(), 0)
+
+        with app.app_context():
+            page = timeline.home_timeline(self.reader_id)
+
+        self.assertEqual([msg.text for msg in page.items], ["Hello, fans"])
+
+    def test_popular_author_pages(self):
+        """Do cursors page through pulled authors' messages?"""
+
+        app.config['TIMELINE_FANOUT_LIMIT'] = 0
+
+        start = datetime(2020, 1, 1)
+        for i in range(3):
+            db.session.add(Message(text=f"Warble {i}", user_id=self.author_id,
+                                   timestamp=start + timedelta(days=i)))
+        db.session.commit()
+
+        seen = []
+        cursor = None
+
+        with app.app_context():
+            while True:
+                page = timeline.home_timeline(self.reader_id, cursor,
+                                              per_page=2)
+                seen.extend(msg.text for msg in page.items)
+
+                if not page.next_cursor:
+                    break
+                cursor = pagination.decode_cursor(page.next_cursor)
+
+        self.assertEqual(seen, ["Warble 2", "Warble 1", "Warble 0"])
+
+    def test_author_back_under_limit_backfilled(self):
+        """Do messages written while over the limit reach followers once the
+        author drops back under it?"""
+
+        fan = User(email="fan@test.com", username="fan",
+                   password="HASHED_PASSWORD")
+        db.session.add(fan)
+        db.session.commit()
+        fan_id = fan.id
+
+        app.config['TIMELINE_FANOUT_LIMIT'] = 1
+
+        with app.app_context():
+            follows.follow(fan_id, [self.author_id])
+            db.session.commit()
+
+        with self.client as c:
+            self.login(c, self.author_id)
+            c.post("/messages/new", data={"text": "Hello, fans"})
+
+        with app.app_context():
+            jobs.work(burst=True)
+
+        self.assertEqual(
+            TimelineEntry.query.filter_by(user_id=self.reader_id).count(), 0)
+
+        with app.app_context():
+            follows.unfollow(fan_id, [self.author_id])
+            db.session.commit()
+            self.assertEqual(jobs.work(burst=True), 1)
+
+            page = timeline.home_timeline(self.reader_id)
+            self.assertEqual([msg.text for msg in page.items],
+                             ["Hello, fans"])
+
+        self.assertEqual(
+            TimelineEntry.query.filter_by(user_id=self.reader_id).count(), 1)
+
+    def test_rebuild(self):
+        """Does rebuilding recreate timelines from follows and messages?"""
+
+        db.session.add(Message(text="Seeded", user_id=self.author_id))
+        db.session.commit()
+
+        with app.app_context():
+            timeline.rebuild()
+            db.session.commit()
+
+        self.assertEqual(TimelineEntry.query.count(), 2)
+
+    def test_rebuild_caps_per_author(self):
+        """Does rebuilding copy only each author's newest messages?"""
+
+        start = datetime(2020, 1, 1)
+        for i in range(3):
+            db.session.add(Message(text=f"Warble {i}", user_id=self.author_id,
+                                   timestamp=start + timedelta(days=i)))
+        db.session.commit()
+
+        app.config['TIMELINE_BACKFILL_LIMIT'] = 2
+
+        with app.app_context():
+            timeline.rebuild()
+            db.session.commit()
+
+        texts = [row[0] for row in
+                 db.session.query(Message.text)
+                 .join(TimelineEntry, TimelineEntry.message_id == Message.id)
+                 .filter(TimelineEntry.user_id == self.reader_id)
+                 .order_by(TimelineEntry.timestamp.desc())]
+
+        self.assertEqual(texts, ["Warble 2", "Warble 1"])
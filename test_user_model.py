@@ -130,3 +130,24 @@ class UserModelTestCase(TestCase):
             User.signup("username-different", "email@test.gov","password3")
             db.session.commit()
         print(exception.exception)
+
+    def test_following_among(self):
+        """Can we check many follows at once?"""
+
+        users = [User(email=f"test{i}@test.com", username=f"testuser{i}",
+                      password="HASHED_PASSWORD") for i in range(4)]
+        db.session.add_all(users)
+        db.session.commit()
+
+        viewer = users[0]
+        for followed in users[1:3]:
+            db.session.add(Follows(user_following_id=viewer.id,
+                                   user_being_followed_id=followed.id))
+        db.session.commit()
+
+        ids = [user.id for user in users]
+
+        self.assertEqual(viewer.following_among(ids),
+                         {users[1].id, users[2].id})
+        self.assertEqual(users[3].following_among(ids), set())
+        self.assertEqual(viewer.following_among([]), set())
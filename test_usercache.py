@@ -0,0 +1,105 @@
+"""Logged-in user cache tests."""
+
+# run these tests like:
+#
+#    FLASK_ENV=production python -m unittest test_usercache.py
+
+
+import os
+import time
+from unittest import TestCase
+
+from models import db, User, Message, Follows, Fancy
+
+os.environ['DATABASE_URL'] = "postgresql:///warbler-test"
+
+from app import app, CURR_USER_KEY
+from cache import LRUCache, get_cache
+from test_feeds import QueryCounter
+import usercache
+
+db.create_all()
+
+app.config['WTF_CSRF_ENABLED'] = False
+
+
+class LRUCacheTestCase(TestCase):
+    """Test the in-process cache backend."""
+
+    def test_evicts_least_recently_used(self):
+        cache = LRUCache(max_entries=2)
+        cache.set("a", 1)
+        cache.set("b", 2)
+        cache.get("a")
+        cache.set("c", 3)
+
+        self.assertEqual(cache.get("a"), 1)
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual(cache.get("c"), 3)
+        self.assertEqual((cache.hits, cache.misses), (3, 1))
+
+    def test_expires(self):
+        cache = LRUCache(ttl=0.01)
+        cache.set("a", 1)
+        time.sleep(0.02)
+
+        self.assertIsNone(cache.get("a"))
+        self.assertEqual(len(cache), 0)
+
+
+class UserCacheTestCase(TestCase):
+    """Test caching of the logged-in user."""
+
+    def setUp(self):
+        """Create test client, add sample data."""
+
+        User.query.delete()
+        Message.query.delete()
+        Follows.query.delete()
+        Fancy.query.delete()
+
+        self.client = app.test_client()
+
+        self.user = User.signup(username="testuser", email="test@test.com",
+                                password="testuser")
+        db.session.commit()
+        self.user_id = self.user.id
+
+    def tearDown(self):
+        """Clean up failed transactions"""
+
+        db.session.rollback()
+
+        with app.app_context():
+            get_cache().clear()
+
+    def test_cached_user_needs_no_query(self):
+        """Is a cached user rebuilt without touching the database?"""
+
+        with app.app_context():
+            usercache.load_user(self.user_id)
+            db.session.remove()
+
+            with QueryCounter() as counter:
+                user = usercache.load_user(self.user_id)
+                self.assertEqual(user.username, "testuser")
+
+            self.assertEqual(counter.count, 0)
+
+            # Uncached columns still load on demand
+            self.assertEqual(user.messages_count, 0)
+
+    def test_profile_edit_invalidates(self):
+        """Does editing the profile show the new name straight away?"""
+
+        with self.client as c:
+            with c.session_transaction() as sess:
+                sess[CURR_USER_KEY] = self.user_id
+
+            c.get("/")
+            c.post("/users/profile", data={"username": "renamed",
+                                           "email": "test@test.com",
+                                           "password": "testuser"})
+            html = c.get(f"/users/{self.user_id}").get_data(as_text=True)
+
+        self.assertIn("@renamed", html)
@@ -0,0 +1,311 @@
+"""Materialized home timelines for Warbler.
+
+New messages are copied ("fanned out") into the `timeline_entries` rows of
+everyone following the author when they're written, so reading a home feed
+is a single index range scan on (user_id, timestamp).
+
+Authors with more than TIMELINE_FANOUT_LIMIT followers (by their
+`followers_count`, see counters.py) are not fanned out; their messages are
+pulled in at read time instead (fan-out on read), so one popular account
+can't turn a single warble into millions of writes. When unfollows bring an
+author back down to the limit, a job backfills their recent messages into
+their followers' timelines, since what they wrote while over it was never
+pushed. New follows are backfilled by a job as well, so following many
+users at once doesn't copy their messages inside the request.
+"""
+
+from flask import current_app
+from sqlalchemy import and_, func, literal, select, true, tuple_
+from sqlalchemy.dialects.postgresql import insert
+
+from models import db, Follows, Message, TimelineEntry, User
+import jobs
+import pagination
+
+DEFAULT_FANOUT_LIMIT = 10000
+DEFAULT_BACKFILL_LIMIT = 100
+
+
+def fanout_limit():
+    """Follower count above which an author's messages are read, not pushed."""
+
+    return current_app.config.get('TIMELINE_FANOUT_LIMIT', DEFAULT_FANOUT_LIMIT)
+
+
+def backfill_limit():
+    """Most recent messages per author copied in by a backfill."""
+
+    return current_app.config.get('TIMELINE_BACKFILL_LIMIT',
+                                  DEFAULT_BACKFILL_LIMIT)
+
+
+def is_fanout_author(user_id):
+    """Should messages from `user_id` be pushed to their followers?"""
+
+    followers_count = (db.session
+                       .query(User.followers_count)
+                       .filter(User.id == user_id)
+                       .scalar())
+
+    return followers_count is not None and followers_count <= fanout_limit()
+
+
+def add_message(message):
+    """Put a freshly-written `message` on its author's timeline, and queue
+    delivery to its followers' (see fan_out).
+
+    Call after the message has an id (i.e. after a flush) and before the
+    commit, so it all lands together.
+    """
+
+    db.session.add(TimelineEntry(user_id=message.user_id,
+                                 message_id=message.id,
+                                 author_id=message.user_id,
+                                 timestamp=message.timestamp))
+
+    jobs.enqueue('fan-out-message', key=f"fan-out-message:{message.id}",
+                 message_id=message.id)
+
+
+@jobs.task('fan-out-message')
+def fan_out(message_id):
+    """Deliver a message to its followers' timelines (a job).
+
+    Only if the author is under the fan-out limit; safe to run twice.
+    """
+
+    message = Message.query.get(message_id)
+
+    if message is None or not is_fanout_author(message.user_id):
+        return
+
+    followers = (select([Follows.user_following_id,
+                         literal(message.id),
+                         literal(message.user_id),
+                         literal(message.timestamp, db.DateTime)])
+                 .where(Follows.user_being_followed_id == message.user_id))
+
+    db.session.execute(
+        insert(TimelineEntry.__table__)
+        .from_select(['user_id', 'message_id', 'author_id', 'timestamp'],
+                     followers)
+        .on_conflict_do_nothing())
+
+
+def ranked_messages(author_ids):
+    """Messages of `author_ids` (a select of ids), each numbered by `rank`
+    from 1 for the author's newest."""
+
+    rank = (func.row_number()
+            .over(partition_by=Message.user_id,
+                  order_by=(Message.timestamp.desc(), Message.id.desc()))
+            .label('rank'))
+
+    return (select([Message.id, Message.user_id, Message.timestamp, rank])
+            .where(Message.user_id.in_(author_ids))
+            .alias('ranked'))
+
+
+def add_follows(follower_id, followed_ids):
+    """Queue backfilling `follower_id`'s timeline with recent messages of
+    `followed_ids` (see backfill_follows); commit afterwards."""
+
+    jobs.enqueue('backfill-follows', follower_id=follower_id,
+                 followed_ids=list(followed_ids))
+
+
+@jobs.task('backfill-follows')
+def backfill_follows(follower_id, followed_ids):
+    """Copy recent messages of `followed_ids` into `follower_id`'s timeline
+    (a job).
+
+    Only authors still followed and under the fan-out limit are backfilled;
+    the rest are read at request time anyway. Safe to run twice.
+    """
+
+    followed = (select([Follows.user_being_followed_id])
+                .where(Follows.user_following_id == follower_id))
+
+    pushed = (select([User.id])
+              .where(User.id.in_(followed_ids))
+              .where(User.id.in_(followed))
+              .where(User.followers_count <= fanout_limit()))
+
+    ranked = ranked_messages(pushed)
+
+    recent = (select([literal(follower_id),
+                      ranked.c.id,
+                      ranked.c.user_id,
+                      ranked.c.timestamp])
+              .where(ranked.c.rank <= backfill_limit()))
+
+    db.session.execute(
+        insert(TimelineEntry.__table__)
+        .from_select(['user_id', 'message_id', 'author_id', 'timestamp'],
+                     recent)
+        .on_conflict_do_nothing())
+
+
+def remove_follows(follower_id, followed_ids):
+    """Drop `followed_ids`' messages from `follower_id`'s timeline."""
+
+    (TimelineEntry
+     .query
+     .filter(TimelineEntry.user_id == follower_id,
+             TimelineEntry.author_id.in_(followed_ids))
+     .delete(synchronize_session=False))
+
+
+def followers_removed(author_ids):
+    """Queue backfills for any of `author_ids` that losing followers has
+    just brought back down to the fan-out limit.
+
+    Call after their `followers_count` has been lowered, in the same
+    transaction.
+    """
+
+    if not author_ids:
+        return
+
+    rows = (db.session
+            .query(User.id)
+            .filter(User.id.in_(author_ids),
+                    User.followers_count == fanout_limit())
+            .all())
+
+    for (author_id,) in rows:
+        jobs.enqueue('backfill-author', author_id=author_id)
+
+
+@jobs.task('backfill-author')
+def backfill_author(author_id):
+    """Copy an author's recent messages into all their followers' timelines
+    (a job).
+
+    For authors back under the fan-out limit, whose messages from while they
+    were over it were never pushed. Safe to run twice.
+    """
+
+    if not is_fanout_author(author_id):
+        return
+
+    recent = (select([Message.id, Message.user_id, Message.timestamp])
+              .where(Message.user_id == author_id)
+              .order_by(Message.timestamp.desc(), Message.id.desc())
+              .limit(backfill_limit())
+              .alias('recent'))
+
+    followers = (select([Follows.user_following_id,
+                         recent.c.id,
+                         recent.c.user_id,
+                         recent.c.timestamp])
+                 .where(Follows.user_being_followed_id == author_id))
+
+    db.session.execute(
+        insert(TimelineEntry.__table__)
+        .from_select(['user_id', 'message_id', 'author_id', 'timestamp'],
+                     followers)
+        .on_conflict_do_nothing())
+
+
+def pulled_messages(user_id, cursor, per_page):
+    """Query for the page below `cursor` of messages by accounts `user_id`
+    follows whose messages are read, not pushed.
+
+    Each such author's newest messages below the cursor are found with an
+    index seek on (user_id, timestamp, id) -- at most a page per author --
+    and only those are merged, so the cost doesn't grow with how much the
+    authors have written.
+    """
+
+    authors = (select([Follows.user_being_followed_id.label('author_id')])
+               .select_from(Follows.__table__.join(
+                   User.__table__,
+                   User.id == Follows.user_being_followed_id))
+               .where(Follows.user_following_id == user_id)
+               .where(User.followers_count > fanout_limit())
+               .alias('authors'))
+
+    recent = select([Message.id]).where(Message.user_id == authors.c.author_id)
+
+    if cursor:
+        recent = recent.where(
+            tuple_(Message.timestamp, Message.id) < tuple_(*cursor))
+
+    recent = (recent
+              .order_by(Message.timestamp.desc(), Message.id.desc())
+              .limit(per_page + 1)
+              .lateral('recent'))
+
+    ids = select([recent.c.id]).select_from(authors.join(recent, true()))
+
+    return pagination.keyset(Message.query.filter(Message.id.in_(ids)),
+                             Message.timestamp,
+                             Message.id,
+                             cursor,
+                             per_page)
+
+
+def home_timeline(user_id, cursor=None, per_page=None):
+    """One page of `user_id`'s home timeline, newest first, below `cursor`."""
+
+    per_page = per_page or pagination.page_size()
+
+    query = (Message
+             .query
+             .join(TimelineEntry, and_(TimelineEntry.message_id == Message.id,
+                                       TimelineEntry.user_id == user_id)))
+
+    messages = pagination.keyset(query,
+                                 TimelineEntry.timestamp,
+                                 TimelineEntry.message_id,
+                                 cursor,
+                                 per_page).all()
+
+    pulled = pulled_messages(user_id, cursor, per_page).all()
+
+    if pulled:
+        seen = {msg.id for msg in messages}
+        messages.extend(msg for msg in pulled if msg.id not in seen)
+        messages.sort(key=lambda msg: (msg.timestamp, msg.id), reverse=True)
+
+    return pagination.make_page(messages, per_page)
+
+
+def rebuild():
+    """Rebuild every timeline from `follows` and `messages`.
+
+    Useful after a bulk import, or to repair timelines written before
+    fan-out existed. Like a new follow, each follower gets the newest
+    TIMELINE_BACKFILL_LIMIT messages of each author they follow. Decides who
+    is fanned out by `followers_count`, so reconcile counters first if they
+    may be off.
+    """
+
+    TimelineEntry.query.delete(synchronize_session=False)
+
+    own = select([Message.user_id.label('user_id'),
+                  Message.id,
+                  Message.user_id.label('author_id'),
+                  Message.timestamp])
+
+    db.session.execute(
+        TimelineEntry.__table__.insert().from_select(
+            ['user_id', 'message_id', 'author_id', 'timestamp'], own))
+
+    pushed_authors = (select([User.id])
+                      .where(User.followers_count <= fanout_limit()))
+
+    ranked = ranked_messages(pushed_authors)
+
+    followed = (select([Follows.user_following_id,
+                        ranked.c.id,
+                        ranked.c.user_id,
+                        ranked.c.timestamp])
+                .select_from(Follows.__table__.join(
+                    ranked, ranked.c.user_id == Follows.user_being_followed_id))
+                .where(ranked.c.rank <= backfill_limit()))
+
+    db.session.execute(
+        TimelineEntry.__table__.insert().from_select(
+            ['user_id', 'message_id', 'author_id', 'timestamp'], followed))
@@ -0,0 +1,103 @@
+"""Cache of logged-in users' profile rows.
+
+Every request used to start with `User.query.get(session[CURR_USER_KEY])`.
+Profile columns change rarely, so we keep them in the cache (see cache.py)
+and rebuild the User from there, attached to the session without a query.
+
+Only profile columns are cached. The password hash and the counters are
+left unloaded; touching them loads them from the database as usual.
+
+With the in-process 'simple' backend, an edit only clears the cache of the
+worker that handled it; other workers catch up within CACHE_DEFAULT_TTL.
+Use the 'redis' backend where that matters.
+
+Deleting an account can't wait that long, so at most once every
+DELETED_CHECK_SECONDS each worker asks which accounts were deleted since it
+last looked (a range scan of the small ix_users_deleted index), and a cached
+user among them counts as logged out.
+"""
+
+from datetime import datetime, timedelta
+
+from flask import current_app
+from sqlalchemy.orm import make_transient_to_detached
+
+from cache import get_cache, DEFAULT_TTL
+from models import db, User
+
+DEFAULT_DELETED_CHECK_SECONDS = 1
+
+# allowance for clocks on different hosts stamping deleted_at
+CLOCK_SKEW = timedelta(seconds=5)
+
+# user id -> deleted_at, for accounts deleted within the cache TTL
+_deleted = {}
+_checked_at = None
+
+CACHED_COLUMNS = ('id', 'email', 'username', 'image_url', 'header_image_url',
+                  'bio', 'location')
+
+
+def cache_key(user_id):
+    return f"user:{user_id}"
+
+
+def load_user(user_id):
+    """The User with `user_id` (or None), from the cache when we can."""
+
+    if user_id in recently_deleted():
+        return None
+
+    cache = get_cache()
+    data = cache.get(cache_key(user_id))
+
+    if data is None:
+        user = User.query.filter_by(id=user_id, deleted_at=None).first()
+
+        if user is not None:
+            cache.set(cache_key(user_id),
+                      {col: getattr(user, col) for col in CACHED_COLUMNS})
+
+        return user
+
+    user = User(**data)
+    make_transient_to_detached(user)
+
+    return db.session.merge(user, load=False)
+
+
+def forget_user(user_id):
+    """Drop `user_id` from the cache; call after changing or deleting them."""
+
+    get_cache().delete(cache_key(user_id))
+
+
+def recently_deleted():
+    """Ids of accounts deleted within the cache TTL, checked at most once
+    every DELETED_CHECK_SECONDS."""
+
+    global _deleted, _checked_at
+
+    now = datetime.utcnow()
+    interval = current_app.config.get('DELETED_CHECK_SECONDS',
+                                      DEFAULT_DELETED_CHECK_SECONDS)
+
+    if _checked_at is not None and now - _checked_at < timedelta(
+            seconds=interval):
+        return _deleted
+
+    ttl = timedelta(seconds=current_app.config.get('CACHE_DEFAULT_TTL',
+                                                   DEFAULT_TTL))
+    since = (_checked_at or now - ttl) - CLOCK_SKEW
+
+    rows = (db.session
+            .query(User.id, User.deleted_at)
+            .filter(User.deleted_at >= since))
+
+    cutoff = now - ttl - CLOCK_SKEW
+    _deleted = {id: deleted_at
+                for id, deleted_at in [*_deleted.items(), *rows]
+                if deleted_at >= cutoff}
+    _checked_at = now
+
+    return _deleted